@@ -0,0 +1,489 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# bench/fakes.py
+# ───────────────────────────────────────────────────────────────────────────────
+import json, math, asyncio, threading, time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import aiohttp
+from aiohttp import web
+import gspread
+from gspread.utils import a1_range_to_grid_range
+from src.utils_google import GoogleClients
+from src.utils_synthetic import synthetic_curve
+
+# Offline stand-ins for Deribit (REST and WebSocket), the other venues' REST APIs, alert webhooks,
+# Sheets and Drive, for tests and benchmarks; kept out of src so production never imports them.
+# Each fake counts the API calls it serves in `calls` (method -> n).
+
+
+# ── Deribit ────────────────────────────────────────────────────────────────────
+class FakeDeribit:
+    """Local HTTP server for the public endpoints fetch_deribit uses; serves synthetic curves."""
+
+    SPOT = {'BTC': 50000.0, 'ETH': 2500.0}
+
+    def __init__(self, n_expiries: int = 8, latency_ms: float = 0.0):
+        self.calls = Counter()
+        self.latency_s = latency_ms / 1000
+        self._lock = threading.Lock()
+        self.set_curve(n_expiries)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'   # keep-alive, like the real API
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def log_message(self, *a):
+                pass
+
+            def do_GET(self):
+                u = urlparse(self.path)
+                q = {k: v[0] for k, v in parse_qs(u.query).items()}
+                code, body = fake.handle(u.path.rsplit('/', 1)[-1], q)
+                b = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(b)))
+                self.end_headers()
+                self.wfile.write(b)
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def funding_1h(hour: int) -> float:
+        # ~10%/yr mean with a daily cycle, deterministic per hour
+        return 1.15e-5 * (1 + 0.5 * math.sin(2 * math.pi * (hour % 24) / 24))
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/api/v2"
+
+    def set_curve(self, n_expiries: int, seed: int = 0):
+        now_ms = int(time.time() * 1000)
+        self.curves = {b: synthetic_curve(n_expiries, base=b, spot=s, now_ms=now_ms, seed=seed)
+                       for b, s in self.SPOT.items()}
+
+    def set_instruments(self, base: str, instruments: list, price: float = None):
+        """Serve recorded get_instruments results for `base` (e.g. a recording's 'instruments')."""
+        price = self.SPOT.get(base, 100.0) if price is None else price
+        self.curves[base] = [{'price': price, **it} for it in instruments]
+
+    def handle(self, method: str, q: dict):
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        now_ms = int(time.time() * 1000)
+        if method == 'get_index_price':
+            base = q.get('index_name', 'btc_usd').split('_')[0].upper()
+            return 200, {'result': {'index_price': self.SPOT.get(base, 100.0)}}
+        if method == 'get_instruments':
+            curve = self.curves.get(q.get('currency', '').upper(), [])
+            return 200, {'result': [{k: v for k, v in it.items() if k != 'price'} for it in curve]}
+        if method == 'get_book_summary_by_currency':
+            curve = self.curves.get(q.get('currency', '').upper(), [])
+            return 200, {'result': [{'instrument_name': it['instrument_name'], 'last': it['price'],
+                                     'mark_price': it['price'], 'creation_timestamp': now_ms} for it in curve]}
+        if method == 'ticker':
+            name = q.get('instrument_name', '')
+            it = next((i for i in self.curves.get(name.split('-')[0], []) if i['instrument_name'] == name), None)
+            if it is None:
+                return 400, {'error': {'message': 'instrument_not_found'}}
+            return 200, {'result': {'last_price': it['price'], 'mark_price': it['price'], 'timestamp': now_ms}}
+        if method == 'get_funding_rate_history':
+            base = q.get('instrument_name', 'BTC').split('-')[0]
+            hour = 3_600_000
+            lo = -(-int(q.get('start_timestamp', 0)) // hour)
+            hi = min(int(q.get('end_timestamp', now_ms)), now_ms) // hour
+            spot = self.SPOT.get(base, 100.0)
+            # One record per published hour, capped like the real endpoint
+            return 200, {'result': [{'timestamp': h * hour, 'index_price': spot, 'prev_index_price': spot,
+                                     'interest_1h': self.funding_1h(h), 'interest_8h': 8 * self.funding_1h(h)}
+                                    for h in range(lo, min(hi, lo + 743) + 1)]}
+        return 400, {'error': {'message': f'unsupported method {method}'}}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_recording(path: str) -> dict:
+    """A recorded session: {'instruments': get_instruments result, 'messages': [ws notifications]}."""
+    with open(path) as f:
+        return json.load(f)
+
+
+class AioFake:
+    """An aiohttp app on its own event-loop thread; subclasses add handlers in `routes()`."""
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        self._runner, self.port = self._call(self._start())
+
+    def _call(self, coro, timeout: float = 10):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def routes(self, app: web.Application):
+        raise NotImplementedError
+
+    async def _start(self):
+        app = web.Application()
+        self.routes(app)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        return runner, runner.addresses[0][1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def close(self):
+        self._call(self._runner.cleanup())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+class FakeDeribitWS(AioFake):
+    """Local JSON-RPC WebSocket replaying recorded subscription messages.
+
+    Each connection gets the recorded notifications for the channels it subscribed
+    to, in order, `repeat` times. `drop()` closes every open socket (a venue-side
+    disconnect) and `heartbeat()` sends a test_request; requests are counted in `calls`.
+    """
+
+    def __init__(self, messages: list, repeat: int = 1):
+        self.messages = [(m['params']['channel'], json.dumps(m)) for m in messages]
+        self.repeat = repeat
+        self.calls = Counter()
+        self.subscriptions = []   # channel list per public/subscribe, across connections
+        self.connects = 0
+        self.sent = 0
+        self._conns = set()
+        super().__init__()
+
+    def routes(self, app: web.Application):
+        app.router.add_get('/ws/api/v2', self._ws)
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/ws/api/v2"
+
+    async def _replay(self, ws, channels: set):
+        for _ in range(self.repeat):
+            for i, (chan, raw) in enumerate(self.messages):
+                if chan in channels:
+                    await ws.send_str(raw)
+                    self.sent += 1
+                if i % 64 == 0:
+                    await asyncio.sleep(0)   # let requests (heartbeat replies) through
+
+    async def _ws(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self.connects += 1
+        self._conns.add(ws)
+        channels, replay = set(), None
+        try:
+            async for m in ws:
+                if m.type != aiohttp.WSMsgType.TEXT:
+                    break
+                req = json.loads(m.data)
+                method = req.get('method')
+                self.calls[method] += 1
+                result = 'ok'
+                if method == 'public/subscribe':
+                    result = list(req['params']['channels'])
+                    self.subscriptions.append(result)
+                    channels.update(result)
+                    if replay is None:
+                        replay = asyncio.ensure_future(self._replay(ws, channels))
+                await ws.send_json({'jsonrpc': '2.0', 'id': req.get('id'), 'result': result})
+        finally:
+            if replay is not None:
+                replay.cancel()
+            self._conns.discard(ws)
+        return ws
+
+    def drop(self):
+        async def close_all():
+            for ws in list(self._conns):
+                await ws.close()
+        self._call(close_all())
+
+    def heartbeat(self):
+        async def send_all():
+            for ws in list(self._conns):
+                await ws.send_json({'jsonrpc': '2.0', 'method': 'heartbeat', 'params': {'type': 'test_request'}})
+        self._call(send_all())
+
+    def close(self):
+        self.drop()
+        super().close()
+
+
+# ── venue REST ─────────────────────────────────────────────────────────────────
+class FakeVenues(AioFake):
+    """Recorded public REST responses for Deribit, OKX and Binance COIN-M on one local server.
+
+    Recordings are {'responses': [{path, params, body}]}; a request gets the first body
+    whose path matches and whose recorded params are all in its query (404 otherwise).
+    The venues' paths don't overlap, so every connector can point at `urls[venue]`.
+    """
+
+    def __init__(self, *recordings):
+        self.responses = [r for rec in recordings for r in rec['responses']]
+        self.calls = Counter()   # path -> n
+        super().__init__()
+
+    def routes(self, app: web.Application):
+        app.router.add_get('/{path:.*}', self._serve)
+
+    @property
+    def urls(self) -> dict:
+        return {'deribit': f"{self.base_url}/api/v2", 'okx': self.base_url, 'binance_cm': self.base_url}
+
+    async def _serve(self, request):
+        q = dict(request.query)
+        self.calls[request.path] += 1
+        for r in self.responses:
+            if r['path'] == request.path and all(q.get(k) == str(v) for k, v in r.get('params', {}).items()):
+                return web.json_response(r['body'])
+        return web.json_response({'error': f"not recorded: {request.path} {q}"}, status=404)
+
+
+# ── alert webhooks ─────────────────────────────────────────────────────────────
+class FakeWebhooks(AioFake):
+    """LINE Notify, Discord webhook and Telegram sendMessage endpoints on one local server.
+
+    `script[channel]` is a list of (status, headers) answered before falling back to
+    200; `delay_s[channel]` holds each response back. Every request is logged in
+    `requests` as (channel, received_at, body) and `done[channel]` lists response times.
+    """
+
+    def __init__(self):
+        self.script = {}
+        self.delay_s = {}
+        self.requests = []
+        self.done = {}
+        super().__init__()
+
+    def routes(self, app: web.Application):
+        app.router.add_post('/line/api/notify', self._handler('line'))
+        app.router.add_post('/discord/webhook', self._handler('discord'))
+        app.router.add_post('/telegram/bot{token}/sendMessage', self._handler('telegram'))
+
+    @property
+    def urls(self) -> dict:
+        return {'line': f"{self.base_url}/line/api/notify", 'discord': f"{self.base_url}/discord/webhook",
+                'telegram': f"{self.base_url}/telegram"}
+
+    def _handler(self, channel: str):
+        async def handle(request):
+            return await self._hook(channel, request)
+        return handle
+
+    async def _hook(self, channel: str, request):
+        body = dict(await request.post()) if channel == 'line' else await request.json()
+        self.requests.append((channel, time.monotonic(), body))
+        if self.delay_s.get(channel):
+            await asyncio.sleep(self.delay_s[channel])
+        queued = self.script.get(channel)
+        status, headers = queued.pop(0) if queued else (200, {})
+        self.done.setdefault(channel, []).append(time.monotonic())
+        return web.json_response({'ok': status < 400}, status=status, headers=headers)
+
+    def received(self, channel: str) -> list:
+        return [(t, b) for c, t, b in self.requests if c == channel]
+
+
+# ── Sheets ─────────────────────────────────────────────────────────────────────
+class FakeWorksheet:
+    """The subset of gspread.Worksheet used by GoogleClients, over an in-memory grid."""
+
+    def __init__(self, spreadsheet, title: str, rows: int = 1000, cols: int = 30):
+        self.spreadsheet, self.title = spreadsheet, title
+        self.row_count, self.col_count = rows, cols
+        self.cells = []
+
+    def _count(self, op):
+        self.spreadsheet.calls[op] += 1
+
+    def row_values(self, row: int):
+        self._count('row_values')
+        return list(self.cells[row - 1]) if len(self.cells) >= row else []
+
+    def col_values(self, col: int):
+        self._count('col_values')
+        return [r[col - 1] for r in self.cells if len(r) >= col and r[col - 1] != '']
+
+    def get_all_values(self, **kw):
+        # gspread pads every row to the widest one
+        self._count('get_all_values')
+        width = max((len(r) for r in self.cells), default=0)
+        return [list(r) + [''] * (width - len(r)) for r in self.cells]
+
+    def get(self, range_name: str, **kw):
+        self._count('get')
+        g = a1_range_to_grid_range(range_name)
+        c0, c1 = g.get('startColumnIndex', 0), g.get('endColumnIndex')
+        return [list(r[c0:c1]) for r in self.cells[g.get('startRowIndex', 0):g.get('endRowIndex')]]
+
+    def update(self, values, range_name: str = 'A1', **kw):
+        self._count('update')
+        g = a1_range_to_grid_range(range_name)
+        r0, c0 = g.get('startRowIndex', 0), g.get('startColumnIndex', 0)
+        for i, row in enumerate(values):
+            while len(self.cells) <= r0 + i:
+                self.cells.append([])
+            cur = self.cells[r0 + i]
+            cur += [''] * max(0, c0 + len(row) - len(cur))
+            cur[c0:c0 + len(row)] = list(row)
+        self.row_count = max(self.row_count, len(self.cells))
+
+    def add_cols(self, n: int):
+        self._count('add_cols')
+        self.col_count += n
+
+    def append_rows(self, values, **kw):
+        self._count('append_rows')
+        self.cells.extend(list(r) for r in values)
+        self.row_count = max(self.row_count, len(self.cells))
+        return {'updates': {'updatedRows': len(values)}}
+
+
+class FakeSpreadsheet:
+    def __init__(self, key: str, calls: Counter):
+        self.id, self.calls = key, calls
+        self.tabs = {}
+
+    def worksheet(self, title: str):
+        self.calls['worksheet'] += 1
+        if title not in self.tabs:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.tabs[title]
+
+    def worksheets(self):
+        self.calls['worksheets'] += 1
+        return list(self.tabs.values())
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kw):
+        self.calls['add_worksheet'] += 1
+        self.tabs[title] = FakeWorksheet(self, title, rows, cols)
+        return self.tabs[title]
+
+    def values_get(self, range_name: str, params=None):
+        # What gspread_dataframe.get_as_dataframe reads (whole tab)
+        self.calls['values_get'] += 1
+        ws = self.tabs[range_name.strip("'").replace("''", "'")]
+        return {'range': range_name, 'values': [list(r) for r in ws.cells]}
+
+
+class FakeSheets:
+    """gspread client stand-in: spreadsheets by key, created on first open."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.books = {}
+
+    def open_by_key(self, key: str):
+        self.calls['open_by_key'] += 1
+        if key not in self.books:
+            self.books[key] = FakeSpreadsheet(key, self.calls)
+        return self.books[key]
+
+
+# ── Drive ──────────────────────────────────────────────────────────────────────
+class _FakeUpload:
+    def __init__(self, drive, body: dict, media):
+        self.drive, self.body, self.media = drive, body, media
+        self.offset, self.buf = 0, bytearray()
+        self.chunk = 0
+        self.in_error = False
+
+    def _fail(self):
+        # A pending interruption for this chunk: half of it lands, then the connection drops
+        left = self.drive.fail_chunks.get(self.chunk, 0)
+        if not left:
+            return False
+        self.drive.fail_chunks[self.chunk] = left - 1
+        part = self.media.getbytes(self.offset, self.media.chunksize() // 2)
+        self.buf += part
+        self.offset += len(part)
+        self.drive.calls['chunk_error'] += 1
+        return True
+
+    def next_chunk(self, num_retries: int = 0):
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaUploadProgress
+        import httplib2
+        if self.in_error:
+            self.drive.calls['resume'] += 1   # status query; upload continues at self.offset
+            self.in_error = False
+        for _ in range(num_retries + 1):
+            self.drive.calls['upload_chunk'] += 1
+            if not self._fail():
+                break
+        else:
+            self.in_error = True
+            raise HttpError(httplib2.Response({'status': 503}), b'backend error')
+        size = self.media.size()
+        chunk = self.media.getbytes(self.offset, self.media.chunksize())
+        self.buf += chunk
+        self.offset += len(chunk)
+        self.chunk += 1
+        if self.offset < size:
+            return MediaUploadProgress(self.offset, size), None
+        file_id = f"fake-{len(self.drive.uploads) + 1:06d}"
+        self.drive.uploads[file_id] = {**self.body, 'size': len(self.buf), 'data': bytes(self.buf)}
+        return None, {'id': file_id}
+
+
+class FakeDrive:
+    """Drive v2 resource stand-in for resumable `files().insert(...).next_chunk()` uploads.
+
+    `fail_chunks[i] = k` interrupts chunk i (0-based, per upload) k times; each
+    interruption keeps half the chunk, like a dropped connection mid-request.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.uploads = {}
+        self.fail_chunks = {}
+
+    def files(self):
+        return self
+
+    def insert(self, body=None, media_body=None, **kw):
+        self.calls['insert'] += 1
+        return _FakeUpload(self, body or {}, media_body)
+
+
+class FakeGoogleClients(GoogleClients):
+    """GoogleClients over FakeSheets/FakeDrive; every read/append/upload path is the production one."""
+
+    def __init__(self, sa_json_path: str = None, sheets: FakeSheets = None, drive: FakeDrive = None):
+        self.creds = None
+        self.gc = sheets or FakeSheets()
+        self.fake_drive = drive or FakeDrive()
+        self._drive = None
+        self._worksheets = {}
+        self._headers = {}
+        self._index = {}
+
+    def drive_service(self):
+        return self.fake_drive
+
+    @property
+    def calls(self) -> Counter:
+        return self.gc.calls + self.fake_drive.calls
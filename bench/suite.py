@@ -0,0 +1,299 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# bench/suite.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, sys, json, time, argparse, tempfile, tracemalloc
+from collections import Counter
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.utils_synthetic import synthetic_history
+from src.write_google_sheet import append_metrics_to_sheet
+from .fakes import FakeDeribit, FakeGoogleClients
+
+# End-to-end benchmarks of the scheduler's stages against offline fakes.
+# Each case reports latency percentiles, peak traced memory and API calls per
+# iteration; results can be saved as a baseline and compared on later runs.
+# Run from the repo root: python -m bench.suite [--quick] [--save-baseline]
+
+STAGES = ('fetch', 'stream', 'metrics', 'term_curve', 'sheets', 'archive', 'funding')
+TERM_BINS = [0, 7, 14, 30, 60, 90, 180, 365]
+SIZES = {
+    'fetch': (8, 32, 128),                  # listed expiries
+    'stream': (5_000, 20_000, 100_000),     # replayed WebSocket messages
+    'metrics': (10_000, 100_000, 500_000),  # history rows
+    'term_curve': (1_000, 10_000, 100_000),
+    'sheets': (100, 1_000, 10_000),         # rows appended / read back
+    'archive': (1_000, 10_000, 50_000),     # rows in the archived day
+    'funding': (30, 90, 365),               # days of cached funding history
+}
+QUICK = {'fetch': (8, 32), 'stream': (5_000,), 'metrics': (10_000,), 'term_curve': (1_000, 10_000),
+         'sheets': (100, 1_000), 'archive': (1_000,), 'funding': (30,)}
+
+
+def measure(fn, repeat: int = 5, warmup: int = 1, calls=None) -> dict:
+    """Run fn warmup+repeat times; memory is traced on one extra run so it doesn't skew timings.
+
+    calls: zero-arg callable returning a Counter of API calls served so far.
+    """
+    for _ in range(warmup):
+        fn()
+    c0 = calls() if calls else Counter()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    used = (calls() - c0) if calls else Counter()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    t = np.asarray(times)
+    return {
+        'p50_ms': float(np.percentile(t, 50)), 'p95_ms': float(np.percentile(t, 95)), 'max_ms': float(t.max()),
+        'peak_mb': peak / 1e6,
+        'api_calls': round(sum(used.values()) / repeat, 2),
+        'calls': {k: round(v / repeat, 2) for k, v in sorted(used.items())},
+    }
+
+
+# ── stages ─────────────────────────────────────────────────────────────────────
+def bench_fetch(sizes, repeat: int = 5):
+    from src import fetch_deribit
+    fake = FakeDeribit()
+    try:
+        for n in sizes:
+            fake.set_curve(n)
+            fetch_deribit._instruments_cache.clear()
+            for mode in ('bulk', 'ticker'):
+                fn = lambda: fetch_deribit.fetch_spot_perp_future_prices('BTC', 'USD', mode=mode, api=fake.url)
+                assert len(fn()) == n
+                yield 'fetch', mode, n, measure(fn, repeat, calls=lambda: Counter(fake.calls))
+    finally:
+        fake.close()
+
+
+def bench_stream(sizes, repeat: int = 3):
+    """DeribitStream ingesting a recorded session replayed by the WebSocket fake; reports ticks/s."""
+    from .fakes import FakeDeribitWS, load_recording
+    from src.stream_deribit import DeribitStream
+    rec = load_recording(os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures', 'deribit_ws_btc.json'))
+    rest = FakeDeribit()
+    rest.set_instruments('BTC', rec['instruments'])
+    try:
+        for n in sizes:
+            repeat_msgs = max(1, -(-n // len(rec['messages'])))
+            total = repeat_msgs * len(rec['messages'])
+            ws = FakeDeribitWS(rec['messages'], repeat=repeat_msgs)
+
+            def fn():
+                st = DeribitStream('BTC', 'USD', url=ws.url, api=rest.url).start()
+                try:
+                    while st.stats['messages'] < total:
+                        time.sleep(0.001)
+                finally:
+                    st.stop()
+            try:
+                m = measure(fn, repeat, calls=lambda: Counter(ws.calls))
+            finally:
+                ws.close()
+            m['ticks_per_s'] = total / (m['p50_ms'] / 1000)
+            yield 'stream', 'replay', total, m
+    finally:
+        rest.close()
+
+
+def bench_metrics(sizes, repeat: int = 3):
+    from src.compute_metrics import compute_all_metrics
+    for n in sizes:
+        hist = synthetic_history(n_rows=n, n_instruments=8)
+        cur = hist[hist['timestamp_utc'] == hist['timestamp_utc'].max()]
+        hist = hist[hist['timestamp_utc'] < hist['timestamp_utc'].max()]
+        fn = lambda: compute_all_metrics(cur, hist, TERM_BINS)
+        yield 'metrics', 'compute_all_metrics', n, measure(fn, repeat)
+
+
+def bench_term_curve(sizes, repeat: int = 5):
+    from src.utils_termcurve import fit_term_curve_lowess, fit_term_curve_bins
+    for n in sizes:
+        h = synthetic_history(n_rows=n, n_instruments=8)
+        x, y = h['days_to_expiry'].to_numpy(dtype=float), h['spread'].to_numpy(dtype=float)
+        yield 'term_curve', 'lowess', n, measure(lambda: fit_term_curve_lowess(x, y, frac=0.6)(x), repeat)
+        yield 'term_curve', 'bins', n, measure(lambda: fit_term_curve_bins(x, y, bins=TERM_BINS)(x), repeat)
+
+
+def bench_sheets(sizes, repeat: int = 5):
+    from src.schema import COLUMNS
+    for n in sizes:
+        rows = synthetic_history(n_rows=n, n_instruments=8).reindex(columns=COLUMNS)
+        # One run's worth of rows per append, on a warm client (header/row count cached)
+        gc = FakeGoogleClients()
+        yield 'sheets', 'append_rows', n, measure(lambda: gc.append_rows('bench', 'live_metrics', rows),
+                                                  repeat, calls=lambda: Counter(gc.calls))
+        # Reads against a tab holding exactly n rows
+        gc = FakeGoogleClients()
+        gc.append_rows('bench', 'live_metrics', rows)
+        calls = lambda: Counter(gc.calls)
+        yield 'sheets', 'read_sheet_all', n, measure(lambda: gc.read_sheet_all('bench', 'live_metrics'),
+                                                     repeat, calls=calls)
+        # The same rows rotated into monthly tabs: a one-day window opens only the tab covering it
+        gc = FakeGoogleClients()
+        append_metrics_to_sheet(gc, 'bench', 'live_metrics', rows, rotate='month')
+        day = rows['timestamp_utc'].iloc[len(rows) // 2].floor('D')
+        calls = lambda: Counter(gc.calls)
+        yield 'sheets', 'read_sheet_window', n, measure(
+            lambda: gc.read_sheet_window('bench', 'live_metrics', start=day, end=day + pd.Timedelta(days=1)),
+            repeat, calls=calls)
+
+
+def bench_archive(sizes, repeat: int = 3):
+    """archive_parquet.main for one day read from the fake sheet (empty history store) and uploaded to the fake Drive."""
+    import logging
+    from src import archive_parquet
+    from src.schema import COLUMNS
+    from src.utils_logging import setup_logger
+    day = '2024-01-01'
+    log = setup_logger()   # main() configures it on first use; set up here so it can be quietened
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            rows = synthetic_history(n_rows=n, n_instruments=8, freq=f"{max(1, 86400 * 8 // n)}s", start=day)
+            rows = rows[rows['timestamp_utc'] < pd.Timestamp(day, tz='UTC') + pd.Timedelta(days=1)]
+            gc = FakeGoogleClients()
+            gc.append_rows('bench', 'live_metrics', rows.reindex(columns=COLUMNS))
+            cfg = {
+                'sheet': {'spreadsheet_id': 'bench', 'worksheet_name': 'live_metrics'},
+                'archive': {'drive_folder_id': 'bench', 'out_dir': os.path.join(tmp, 'out'),
+                            'history_dir': os.path.join(tmp, 'history'), 'upload_chunk_mb': 1},
+            }
+            argv = ['archive_parquet', '--start', day, '--force']
+
+            def fn():
+                gc._worksheets.clear(); gc._headers.clear(); gc._index.clear()
+                with mock.patch.object(archive_parquet, 'GoogleClients', lambda sa: gc), \
+                        mock.patch.object(archive_parquet, 'load_config', lambda: cfg), \
+                        mock.patch.object(sys, 'argv', argv):
+                    level = log.level
+                    log.setLevel(logging.WARNING)
+                    try:
+                        archive_parquet.main()
+                    finally:
+                        log.setLevel(level)
+            yield 'archive', 'main', len(rows), measure(fn, repeat, calls=lambda: Counter(gc.calls))
+
+
+def bench_funding(sizes, repeat: int = 5):
+    """FundingCache against the fake: a cold backfill, an up-to-date run and a run with one new hourly record."""
+    from src.funding import FundingCache, perp_instrument
+    fake = FakeDeribit()
+    calls = lambda: Counter(fake.calls)
+    inst = perp_instrument('BTC')
+    try:
+        for days in sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                fc = FundingCache(tmp, api=fake.url, backfill_days=days, retain_days=days)
+
+                def cold():
+                    fc._hist.clear()
+                    if os.path.exists(fc.path(inst)):
+                        os.remove(fc.path(inst))
+                    return fc.estimate('BTC')
+
+                def next_hour():
+                    fc._hist[inst] = fc.history(inst).iloc[:-1]
+                    return fc.estimate('BTC')
+
+                yield 'funding', 'cold', days, measure(cold, repeat, calls=calls)
+                yield 'funding', 'warm', days, measure(lambda: fc.estimate('BTC'), repeat, calls=calls)
+                yield 'funding', 'next_hour', days, measure(next_hour, repeat, calls=calls)
+    finally:
+        fake.close()
+
+
+BENCHES = {'fetch': bench_fetch, 'stream': bench_stream, 'metrics': bench_metrics, 'term_curve': bench_term_curve,
+           'sheets': bench_sheets, 'archive': bench_archive, 'funding': bench_funding}
+
+
+def run(stages=STAGES, sizes: dict = None, log=None) -> pd.DataFrame:
+    sizes = {**SIZES, **(sizes or {})}
+    rows = []
+    for st in stages:
+        for stage, case, n, m in BENCHES[st](sizes[st]):
+            rows.append({'stage': stage, 'case': case, 'n': n, **m})
+            if log:
+                log.info(f"bench {stage:<10} {case:<20} n={n:>8,}: p50={m['p50_ms']:9.2f} ms "
+                         f"p95={m['p95_ms']:9.2f} ms peak={m['peak_mb']:8.1f} MB calls={m['api_calls']:g}"
+                         + (f" ticks/s={m['ticks_per_s']:,.0f}" if 'ticks_per_s' in m else ''))
+    return pd.DataFrame(rows)
+
+
+# ── baselines ──────────────────────────────────────────────────────────────────
+def _key(r) -> str:
+    return f"{r['stage']}/{r['case']}/{r['n']}"
+
+
+def save_baseline(res: pd.DataFrame, path: str):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    base = {_key(r): {k: r[k] for k in ('p50_ms', 'p95_ms', 'peak_mb', 'api_calls')} for r in res.to_dict('records')}
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'saved_at': pd.Timestamp.now(tz='UTC').isoformat(), 'results': base}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def compare(res: pd.DataFrame, path: str, tolerance: float = 0.25, min_ms: float = 1.0) -> pd.DataFrame:
+    """Regressions vs a saved baseline: p50 or peak memory above (1+tolerance)x, or more API calls.
+
+    Latencies under min_ms are too noisy to flag on ratio alone.
+    """
+    with open(path) as f:
+        base = json.load(f)['results']
+    out = []
+    for r in res.to_dict('records'):
+        b = base.get(_key(r))
+        if b is None:
+            continue
+        checks = {
+            'p50_ms': r['p50_ms'] > b['p50_ms'] * (1 + tolerance) and r['p50_ms'] - b['p50_ms'] > min_ms,
+            'peak_mb': r['peak_mb'] > b['peak_mb'] * (1 + tolerance) and r['peak_mb'] - b['peak_mb'] > 0.5,
+            'api_calls': r['api_calls'] > b['api_calls'],
+        }
+        for metric, bad in checks.items():
+            if bad:
+                out.append({'key': _key(r), 'metric': metric, 'baseline': b[metric], 'now': r[metric],
+                            'ratio': r[metric] / b[metric] if b[metric] else float('inf')})
+    return pd.DataFrame(out, columns=['key', 'metric', 'baseline', 'now', 'ratio'])
+
+
+def main():
+    from src.utils_logging import setup_logger
+    ap = argparse.ArgumentParser(description="End-to-end stage benchmarks against offline Deribit/Sheets/Drive fakes")
+    ap.add_argument('--stages', nargs='*', choices=STAGES, default=list(STAGES))
+    ap.add_argument('--quick', action='store_true', help="small sizes only (smoke run)")
+    ap.add_argument('--baseline', default='ops/bench_baseline.json')
+    ap.add_argument('--save-baseline', action='store_true', help="write this run's results to --baseline")
+    ap.add_argument('--tolerance', type=float, default=0.25, help="allowed p50/memory growth before flagging")
+    ap.add_argument('--out', help="also write full results as CSV")
+    args = ap.parse_args()
+
+    log = setup_logger()
+    res = run(args.stages, QUICK if args.quick else None, log=log)
+    if args.out:
+        res.to_csv(args.out, index=False)
+    if args.save_baseline:
+        save_baseline(res, args.baseline)
+        log.info(f"Baseline saved to {args.baseline} ({len(res)} cases)")
+        return
+    if not os.path.exists(args.baseline):
+        log.info(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    bad = compare(res, args.baseline, args.tolerance)
+    for r in bad.to_dict('records'):
+        log.warning(f"REGRESSION {r['key']} {r['metric']}: {r['baseline']:.2f} -> {r['now']:.2f} ({r['ratio']:.2f}x)")
+    if len(bad):
+        sys.exit(1)
+    log.info(f"No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
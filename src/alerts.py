@@ -1,28 +1,11 @@
 # ───────────────────────────────────────────────────────────────────────────────
 # src/alerts.py
 # ───────────────────────────────────────────────────────────────────────────────
-import os, time, json, requests
+import os, time, asyncio, threading
+from email.utils import parsedate_to_datetime
+import aiohttp
 import pandas as pd
-
-
-def _line_notify(token: str, message: str):
-    if not token:
-        return
-    url = 'https://notify-api.line.me/api/notify'
-    headers = {'Authorization': f'Bearer {token}'}
-    requests.post(url, headers=headers, data={'message': message}, timeout=10)
-
-
-def _discord_hook(url: str, content: str):
-    if not url:
-        return
-    requests.post(url, json={'content': content}, timeout=10)
-
-
-def _telegram_bot(token: str, chat_id: str, text: str):
-    if not token or not chat_id:
-        return
-    requests.get(f"https://api.telegram.org/bot{token}/sendMessage", params={'chat_id': chat_id, 'text': text}, timeout=10)
+from .utils_metrics import METRICS
 
 
 def format_signal_row(row: pd.Series) -> str:
@@ -34,12 +17,179 @@ def format_signal_row(row: pd.Series) -> str:
     )
 
 
-def send_alerts(row: pd.Series, channels: list, conf: dict):
-    msg = format_signal_row(row)
-    if 'line' in channels:
-        _line_notify(os.getenv('LINE_NOTIFY_TOKEN', conf.get('line_notify_token','')), msg)
-    if 'discord' in channels:
-        _discord_hook(os.getenv('DISCORD_WEBHOOK_URL', conf.get('discord_webhook_url','')), msg)
-    if 'telegram' in channels:
-        _telegram_bot(os.getenv('TELEGRAM_BOT_TOKEN', conf.get('telegram_bot_token','')),
-                      os.getenv('TELEGRAM_CHAT_ID', conf.get('telegram_chat_id','')), msg)
+# ── batched async dispatcher ───────────────────────────────────────────────────
+LINE_NOTIFY_URL = os.getenv('LINE_NOTIFY_URL', 'https://notify-api.line.me/api/notify')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+# Per-channel message size cap and minimum spacing between requests
+CHANNEL_LIMITS = {
+    'line': {'max_chars': 1000, 'min_interval_s': 1.0},
+    'discord': {'max_chars': 2000, 'min_interval_s': 0.5},
+    'telegram': {'max_chars': 4096, 'min_interval_s': 1.0},
+}
+
+
+def retry_after_s(value: str):
+    """Retry-After as seconds: delta-seconds or an HTTP-date; None when unparseable."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def format_signal_batch(df: pd.DataFrame) -> list:
+    return [format_signal_row(row) for _, row in df.iterrows()]
+
+
+def pack_messages(parts: list, max_chars: int, header: str = '') -> list:
+    """Greedily pack per-signal texts into as few messages as fit under max_chars."""
+    out, cur = [], header
+    for p in parts:
+        p = p[:max_chars - len(header) - 2]
+        if cur and len(cur) + len(p) + 2 > max_chars:
+            out.append(cur)
+            cur = header
+        cur = f"{cur}\n\n{p}" if cur else p
+    if cur and cur != header:
+        out.append(cur)
+    return out
+
+
+class AlertDispatcher:
+    """Coalesces a run's signals into one message per channel and sends channels concurrently.
+
+    Runs an asyncio loop on a background thread with one pooled aiohttp session, so
+    `dispatch()` returns immediately with a concurrent Future. Each channel is spaced
+    by CHANNEL_LIMITS and retried with exponential backoff on 429/5xx/network errors
+    (honouring Retry-After).
+    """
+
+    def __init__(self, conf: dict, channels: list, max_retries: int = 4, backoff_s: float = 1.0,
+                 timeout_s: float = 10.0, log=None):
+        self.channels = list(channels)
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.timeout_s = timeout_s
+        self.log = log
+        self.creds = {
+            'line': os.getenv('LINE_NOTIFY_TOKEN', conf.get('line_notify_token', '')),
+            'discord': os.getenv('DISCORD_WEBHOOK_URL', conf.get('discord_webhook_url', '')),
+            'telegram': (os.getenv('TELEGRAM_BOT_TOKEN', conf.get('telegram_bot_token', '')),
+                         os.getenv('TELEGRAM_CHAT_ID', conf.get('telegram_chat_id', ''))),
+        }
+        self.stats = {'sent': 0, 'retries': 0, 'failed': 0}
+        self._next_ok = {}
+        self._locks = {}
+        self._session = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+
+    def dispatch(self, df: pd.DataFrame):
+        parts = format_signal_batch(df) if not df.empty else []
+        fut = asyncio.run_coroutine_threadsafe(self._dispatch(parts), self._loop)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, fut):
+        exc = None if fut.cancelled() else fut.exception()
+        if exc is not None and self.log:
+            self.log.error(f"Alert dispatch failed: {exc!r}")
+
+    def close(self, timeout: float = 60.0):
+        async def _drain():
+            pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            if pending:
+                await asyncio.wait(pending, timeout=timeout)
+            if self._session is not None:
+                await self._session.close()
+        if self._thread.is_alive():
+            asyncio.run_coroutine_threadsafe(_drain(), self._loop).result(timeout + 5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+
+    # ── internals ──────────────────────────────────────────────────────────
+    def _request(self, channel: str, text: str):
+        if channel == 'line':
+            token = self.creds['line']
+            return token and ('POST', LINE_NOTIFY_URL, {'headers': {'Authorization': f'Bearer {token}'},
+                                                        'data': {'message': text}})
+        if channel == 'discord':
+            url = self.creds['discord']
+            return url and ('POST', url, {'json': {'content': text}})
+        if channel == 'telegram':
+            token, chat_id = self.creds['telegram']
+            return token and chat_id and ('POST', f"{TELEGRAM_API_URL}/bot{token}/sendMessage",
+                                          {'json': {'chat_id': chat_id, 'text': text}})
+        return None
+
+    async def _dispatch(self, parts: list):
+        if not parts:
+            return {}
+        if self._session is None:
+            conn = aiohttp.TCPConnector(limit=16, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=conn, timeout=aiohttp.ClientTimeout(total=self.timeout_s))
+        header = f"[ARBI] {len(parts)} signal(s)"
+        jobs = {ch: self._send_channel(ch, pack_messages(parts, CHANNEL_LIMITS[ch]['max_chars'], header))
+                for ch in self.channels if ch in CHANNEL_LIMITS}
+        res = dict(zip(jobs, await asyncio.gather(*jobs.values(), return_exceptions=True)))
+        for ch, r in res.items():
+            if isinstance(r, BaseException):
+                self.stats['failed'] += 1
+                if self.log:
+                    self.log.error(f"Alert to {ch} raised {r!r}")
+        return res
+
+    async def _throttle(self, channel: str):
+        lock = self._locks.setdefault(channel, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next_ok.get(channel, 0.0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_ok[channel] = loop.time() + CHANNEL_LIMITS[channel]['min_interval_s']
+
+    async def _send_channel(self, channel: str, messages: list) -> int:
+        sent = 0
+        for text in messages:
+            req = self._request(channel, text)
+            if not req:
+                return sent
+            method, url, kw = req
+            for attempt in range(self.max_retries + 1):
+                await self._throttle(channel)
+                delay = self.backoff_s * 2 ** attempt
+                try:
+                    async with self._session.request(method, url, **kw) as r:
+                        METRICS.http(channel, r.status, r.content_length or 0)
+                        if r.status < 400:
+                            sent += 1
+                            self.stats['sent'] += 1
+                            break
+                        if r.status != 429 and r.status < 500:
+                            raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status)
+                        retry_after = retry_after_s(r.headers.get('Retry-After'))
+                        if retry_after is not None:
+                            delay = max(delay, retry_after)
+                except aiohttp.ClientResponseError:
+                    self.stats['failed'] += 1
+                    if self.log:
+                        self.log.warning(f"Alert to {channel} rejected")
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                if attempt == self.max_retries:
+                    self.stats['failed'] += 1
+                    if self.log:
+                        self.log.warning(f"Alert to {channel} failed after {attempt + 1} attempts")
+                    break
+                self.stats['retries'] += 1
+                METRICS.retry(channel)
+                await asyncio.sleep(delay)
+        return sent
@@ -1,11 +1,15 @@
 # ───────────────────────────────────────────────────────────────────────────────
 # src/archive_parquet.py
 # ───────────────────────────────────────────────────────────────────────────────
-import os, yaml
+import os, json, time, yaml, argparse, threading
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from .utils_logging import setup_logger
+from .utils_metrics import METRICS
 from .utils_google import GoogleClients
+from .history_store import HistoryStore, write_table
+from .schema import coerce
 from dotenv import load_dotenv
 
 
@@ -18,60 +22,167 @@ def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
 
-def main():
-    log = setup_logger()
-    load_dotenv()
-    cfg = load_config()
-    sa = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-    gc = GoogleClients(sa)
-
-    sheet_cfg = cfg['sheet']
-    arch_cfg = cfg['archive']
-
+def default_target_date():
     # Archive "yesterday" UTC by default (or ARB_ARCHIVE_DATE=YYYY-MM-DD)
     target_str = os.getenv('ARB_ARCHIVE_DATE')
     if target_str:
-        target_date = datetime.fromisoformat(target_str).date()
-    else:
-        target_date = (datetime.now(timezone.utc) - timedelta(days=1)).date()
+        return datetime.fromisoformat(target_str).date()
+    return (datetime.now(timezone.utc) - timedelta(days=1)).date()
 
-    # Prefer full read for accurate day split; fallback to tail if needed
-    try:
-        df = gc.read_sheet_all(sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'])
-    except Exception:
-        df = gc.read_sheet_tail(sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'], n_rows=999999)
 
+def read_day(cfg: dict, gc: GoogleClients, day: str) -> pd.DataFrame:
+    """Rows of one UTC date: the history store partition, or the sheet if the store has none."""
+    store = HistoryStore.from_config(cfg)
+    df = store.read_day(day)
+    if len(df) or gc is None:
+        return df
+    sheet_cfg = cfg['sheet']
+    # Only the tab(s) whose month/week covers the day
+    start = pd.Timestamp(day, tz='UTC')
+    df = gc.read_sheet_window(sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'],
+                              start=start, end=start + pd.Timedelta(days=1))
+    if df.empty or 'timestamp_utc' not in df.columns:
+        return df
+    # ISO timestamps: match on the date prefix before parsing anything
+    df = df[df['timestamp_utc'].astype(str).str.startswith(day)]
+    return coerce(df)
+
+
+class _Manifest:
+    """day -> {file_id, rows, bytes} for days already uploaded, so range runs can resume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    def __contains__(self, day):
+        return day in self.data
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        return cls(os.path.join(cfg['archive']['out_dir'], '_uploaded.json'))
+
+    def put(self, day: str, rec: dict):
+        with self._lock:
+            self.data[day] = rec
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+def write_day(cfg: dict, gc: GoogleClients, day: str, compact: bool = False):
+    """Build the archive file for one date; returns (local_path, rows) or (None, 0)."""
+    arch_cfg = cfg['archive']
+    if compact:
+        HistoryStore.from_config(cfg).compact_day(day)
+    with METRICS.span('archive_read'):
+        df = read_day(cfg, gc, day)
+    METRICS.rows('read', 'archive', len(df))
     if df.empty:
-        log.info("No data in sheet; nothing to archive.")
-        return
-
-    # Parse timestamp and filter by date (UTC)
-    df['timestamp_utc'] = pd.to_datetime(df['timestamp_utc'], errors='coerce', utc=True)
-    df = df.dropna(subset=['timestamp_utc'])
-    df['date'] = df['timestamp_utc'].dt.date
-    day_df = df[df['date'] == target_date].copy()
-
-    if day_df.empty:
-        log.info(f"No rows to archive for {target_date}.")
-        return
-
-    # Enforce numeric dtypes for compact parquet
-    num_cols = ['expiry_ts','days_to_expiry','spot_price','perp_price','fut_price','spread','apy_annual',
-                'z_hist','z_cross','z_term','funding_est_hourly','fee_bp_est','apy_net','liq_depth_bp']
-    for c in num_cols:
-        if c in day_df.columns:
-            day_df[c] = pd.to_numeric(day_df[c], errors='coerce')
-
-    # Write parquet locally
+        return None, 0
+    # Instrument-major order keeps each row group's instrument min/max tight
+    df = df.sort_values(['instrument', 'timestamp_utc'], kind='stable', ignore_index=True)
     out_dir = arch_cfg['out_dir']
     ensure_dir(out_dir)
-    fname = f"arbitrage_{target_date.isoformat()}.parquet"
-    local_path = os.path.join(out_dir, fname)
-    day_df.drop(columns=['date'], errors='ignore').to_parquet(local_path, index=False)
+    local_path = os.path.join(out_dir, f"arbitrage_{day}.parquet")
+    with METRICS.span('archive_write'):
+        write_table(df, local_path, row_group_size=int(arch_cfg.get('row_group_rows', 64 * 1024)),
+                    compression=arch_cfg.get('compression', 'zstd'))
+    METRICS.rows('write', 'archive', len(df))
+    return local_path, len(df)
+
 
-    # Upload to Google Drive
-    drive_id = gc.upload_to_drive(arch_cfg['drive_folder_id'], local_path, fname)
-    log.info(f"Uploaded {fname} to Drive id={drive_id}; rows={len(day_df)}")
+def uploaded(cfg: dict, target_date) -> bool:
+    return str(target_date) in _Manifest.from_config(cfg)
+
+
+def archive_day(cfg: dict, gc: GoogleClients, target_date, log, upload: bool = True, compact: bool = False,
+                force: bool = False):
+    day = str(target_date)
+    arch_cfg = cfg['archive']
+    manifest = _Manifest.from_config(cfg)
+    if upload and not force and day in manifest:
+        log.info(f"{day} already uploaded (Drive id={manifest.data[day].get('file_id')}); skipping.")
+        return None
+    local_path, n = write_day(cfg, gc, day, compact=compact)
+    if local_path is None:
+        log.info(f"No rows to archive for {day}.")
+        return None
+    if not upload:
+        log.info(f"Wrote {local_path}; rows={n} ({os.path.getsize(local_path) / 1e6:.2f} MB)")
+        return None
+    fname = os.path.basename(local_path)
+    with METRICS.span('archive_upload'):
+        drive_id = gc.upload_to_drive(arch_cfg['drive_folder_id'], local_path, fname,
+                                      chunk_mb=arch_cfg.get('upload_chunk_mb', 8), log=log)
+    manifest.put(day, {'file_id': drive_id, 'rows': n, 'bytes': os.path.getsize(local_path)})
+    log.info(f"Uploaded {fname} to Drive id={drive_id}; rows={n}")
+    return drive_id
+
+
+def archive_range(cfg: dict, gc: GoogleClients, start, end, log, upload: bool = True,
+                  compact: bool = False, workers: int = None, force: bool = False) -> dict:
+    """Backfill/compact [start, end]: day files are built in parallel, uploads run one at a time."""
+    arch_cfg = cfg['archive']
+    days = [d.strftime('%Y-%m-%d') for d in pd.date_range(str(start), str(end), freq='D')]
+    manifest = _Manifest.from_config(cfg)
+    if upload and not force:
+        days = [d for d in days if d not in manifest]
+    workers = workers or int(arch_cfg.get('max_workers', 4))
+    res = {}
+    # The Drive client is not thread-safe, so only Parquet building is fanned out
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        built = zip(days, ex.map(lambda d: write_day(cfg, gc, d, compact=compact), days))
+        for day, (local_path, n) in built:
+            if local_path is None:
+                continue
+            res[day] = n
+            if upload:
+                fname = os.path.basename(local_path)
+                with METRICS.span('archive_upload'):
+                    drive_id = gc.upload_to_drive(arch_cfg['drive_folder_id'], local_path, fname,
+                                                  chunk_mb=arch_cfg.get('upload_chunk_mb', 8))
+                manifest.put(day, {'file_id': drive_id, 'rows': n, 'bytes': os.path.getsize(local_path)})
+            log.info(f"{day}: {n} rows -> {fname if upload else local_path}")
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Day-partitioned Parquet archive to Google Drive")
+    ap.add_argument('--start', help="first UTC date (YYYY-MM-DD); default: yesterday / ARB_ARCHIVE_DATE")
+    ap.add_argument('--end', help="last UTC date, default: start")
+    ap.add_argument('--compact', action='store_true', help="merge per-run part files in the history store first")
+    ap.add_argument('--no-upload', action='store_true')
+    ap.add_argument('--force', action='store_true', help="re-upload days already in the manifest")
+    ap.add_argument('--workers', type=int)
+    args = ap.parse_args()
+
+    log = setup_logger()
+    load_dotenv()
+    cfg = load_config()
+    METRICS.configure(cfg, log, job='archive')
+    sa = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
+    gc = GoogleClients(sa)
+    before = METRICS.snapshot()
+    try:
+        with METRICS.span('archive'):
+            if args.start:
+                n = archive_range(cfg, gc, args.start, args.end or args.start, log, upload=not args.no_upload,
+                                  compact=args.compact, workers=args.workers, force=args.force)
+                log.info(f"Archived {len(n)} day(s), {sum(n.values())} rows")
+            else:
+                archive_day(cfg, gc, default_target_date(), log, upload=not args.no_upload, compact=args.compact,
+                            force=args.force)
+        METRICS.set('last_archive_timestamp_seconds', time.time())
+    finally:
+        if METRICS.enabled:
+            log.info("archive metrics", extra={'fields': {'event': 'archive', 'counters': METRICS.delta(before, stages=True)}})
+        METRICS.write_textfile()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,309 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/backtest.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, glob, time, argparse, itertools, tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from concurrent.futures import ProcessPoolExecutor
+from .schema import READ_SCHEMA, PARQUET_FORMAT, coerce, from_arrow
+from .batch_metrics import compute_metrics_batch
+from .signals import SignalEngine, Z_RULES
+from .utils_termcurve import TermCurveCache
+
+# Replay of archived days through the batch metric engine (compute_all_metrics'
+# scoring, vectorized) and SignalEngine.evaluate_history (the scheduler's decide
+# step, stateless). Parameter sweeps fan out over a process pool; workers
+# memory-map one Arrow IPC copy of the data instead of each re-reading Parquet.
+
+LOAD_COLUMNS = ['timestamp_utc', 'exchange', 'base', 'quote', 'instrument', 'days_to_expiry',
+                'spot_price', 'perp_price', 'fut_price', 'liq_depth_bp']
+# Parameters that change the metrics themselves; everything else only re-runs the signal rules
+METRIC_KEYS = ('lookback_days_for_hist_z', 'min_history_rows_per_expiry', 'term_frac', 'term_method')
+RESULT_COLUMNS = ['entries', 'alerts', 'flag_rows', 'hit_rate', 'conv_bp_mean', 'conv_bp_median',
+                  'conv_bp_total', 'hold_h_mean', 'open_at_end']
+
+
+def base_params(cfg: dict) -> dict:
+    """Every sweepable parameter with its current config value (flat names)."""
+    app, tc = cfg['app'], cfg.get('term_curve', {})
+    th = dict(cfg['thresholds'])
+    for r in Z_RULES:
+        th.setdefault(f'{r}_exit', th[f'{r}_enter'])
+    th.setdefault('apy_net_exit', th['apy_net_min'])
+    th.setdefault('liq_depth_min_bp', None)
+    return {
+        **th,
+        'lookback_days_for_hist_z': app['lookback_days_for_hist_z'],
+        'min_history_rows_per_expiry': app['min_history_rows_per_expiry'],
+        'term_frac': tc.get('frac', 0.6),
+        'term_method': 'kernel' if tc.get('method') == 'kernel' else 'lowess',
+        'debounce_minutes': app.get('debounced_minutes', 0),
+        'realert_minutes': app.get('realert_minutes', 0),
+        'fee_bp_est': 2.0,
+        'max_hold_hours': cfg.get('backtest', {}).get('max_hold_hours', 168),
+    }
+
+
+def grid(base: dict, sweep: dict = None) -> list:
+    """Cartesian product of `sweep` ({param: [values]}) over the base parameters."""
+    sweep = sweep or {}
+    unknown = sorted(set(sweep) - set(base))
+    if unknown:
+        raise ValueError(f"Unknown sweep parameter(s): {', '.join(unknown)}")
+    keys = list(sweep)
+    vals = [v if isinstance(v, (list, tuple)) else [v] for v in sweep.values()]
+    return [{**base, **dict(zip(keys, combo))} for combo in itertools.product(*vals)]
+
+
+# ── data ───────────────────────────────────────────────────────────────────────
+def archive_files(out_dir: str, start=None, end=None) -> list:
+    files = sorted(glob.glob(os.path.join(out_dir, 'arbitrage_????-??-??.parquet')))
+    day = lambda p: os.path.basename(p)[len('arbitrage_'):-len('.parquet')]
+    return [f for f in files if (start is None or day(f) >= str(start)) and (end is None or day(f) <= str(end))]
+
+
+def load_archive(out_dir: str, start=None, end=None) -> pd.DataFrame:
+    files = archive_files(out_dir, start, end)
+    if not files:
+        return coerce(pd.DataFrame(), columns=LOAD_COLUMNS)
+    table = ds.dataset(files, format=PARQUET_FORMAT, schema=READ_SCHEMA).to_table(columns=LOAD_COLUMNS)
+    return from_arrow(table).sort_values('timestamp_utc', kind='stable', ignore_index=True)
+
+
+def write_ipc(df: pd.DataFrame, path: str) -> str:
+    # Uncompressed Arrow file: workers map it read-only and share the page cache
+    table = pa.Table.from_pandas(df, preserve_index=False).unify_dictionaries().combine_chunks()
+    with pa.OSFile(path, 'wb') as f, pa.ipc.new_file(f, table.schema) as w:
+        w.write_table(table)
+    return path
+
+
+def read_ipc(path: str) -> pd.DataFrame:
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    # split_blocks keeps numeric columns as views onto the mapping (no consolidation copy)
+    return table.to_pandas(split_blocks=True)
+
+
+def with_funding(data: pd.DataFrame, cfg: dict, log=None) -> pd.DataFrame:
+    """Add funding_est_hourly as of each row's timestamp from the funding cache (no fetches), when enabled."""
+    if not cfg.get('funding', {}).get('enabled') or data.empty:
+        return data
+    from .funding import FundingCache
+    return data.assign(funding_est_hourly=FundingCache.from_config(cfg, log=log).estimate_rows(data))
+
+
+# ── outcomes ───────────────────────────────────────────────────────────────────
+def outcomes(df: pd.DataFrame, sig: pd.DataFrame, since=None, max_hold_hours: float = None,
+             fee_bp: float = 2.0) -> dict:
+    """Entries, hit rate and realized basis convergence of the replayed signals.
+
+    Each active episode (signal_flag on for consecutive snapshots of one instrument)
+    is one trade entered at its first row and closed at the first row where the flag
+    is off, after `max_hold_hours`, or at the instrument's last row (expiry / end of
+    data). Convergence is the future-perp basis move in bp in the trade's favour
+    (rich: basis falls, cheap: basis rises); a hit clears the round-trip fee.
+    """
+    key = pd.factorize(SignalEngine.keys(df))[0]
+    t = ((df['timestamp_utc'] - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+    order = np.lexsort((t, key))
+    k, t = key[order], t[order]
+    fut = df['fut_price'].to_numpy(dtype=float)[order]
+    spot = df['spot_price'].to_numpy(dtype=float)[order]
+    leg = df['perp_price'].to_numpy(dtype=float)[order]
+    leg = np.where(np.isnan(leg), spot, leg)
+    basis = (fut - leg) / leg * 1e4
+    flag = sig['signal_flag'].to_numpy(dtype=bool)[order]
+
+    same_prev = np.r_[False, k[1:] == k[:-1]]
+    same_next = np.r_[k[:-1] == k[1:], False]
+    start = np.nonzero(flag & ~(same_prev & np.r_[False, flag[:-1]]))[0]
+    if since is not None:
+        start = start[t[start] >= pd.Timestamp(since).timestamp()]
+    alerts = sig['alert'].to_numpy(dtype=bool)[order]
+    in_window = np.ones(len(t), dtype=bool) if since is None else t >= pd.Timestamp(since).timestamp()
+    res = {'entries': len(start), 'alerts': int((alerts & in_window).sum()),
+           'flag_rows': int((flag & in_window).sum())}
+    if not len(start):
+        return {**res, **{c: np.nan for c in RESULT_COLUMNS if c not in res}, 'open_at_end': 0}
+
+    # Episode end: last active row of the run; exit on the next row of the same instrument
+    end_rows = np.nonzero(flag & ~(same_next & np.r_[flag[1:], False]))[0]
+    end = end_rows[np.searchsorted(end_rows, start)]
+    last_of_key = np.nonzero(~same_next)[0]
+    key_last = last_of_key[np.searchsorted(last_of_key, start)]
+    exit_ = np.minimum(end + 1, key_last)
+    open_ = (end == key_last)
+    if max_hold_hours:
+        # first row at/after entry + horizon within the instrument (keys sorted, then time)
+        span = int(t.max() - t.min()) + 1
+        pos = k.astype(np.int64) * span + (t - t.min())
+        cap = np.searchsorted(pos, pos[start] + int(max_hold_hours * 3600), side='left')
+        capped = cap < exit_
+        exit_ = np.where(capped, np.minimum(cap, key_last), exit_)
+        open_ &= ~capped
+    side = np.where(fut[start] > spot[start], 1.0, -1.0)   # side_hint: rich shorts the basis, cheap buys it
+    conv = side * (basis[start] - basis[exit_])
+    hold = (t[exit_] - t[start]) / 3600
+    ok = ~np.isnan(conv)
+    return {**res,
+            'hit_rate': float((conv[ok] > 2 * fee_bp).mean()) if ok.any() else np.nan,
+            'conv_bp_mean': float(np.nanmean(conv)) if ok.any() else np.nan,
+            'conv_bp_median': float(np.nanmedian(conv)) if ok.any() else np.nan,
+            'conv_bp_total': float(np.nansum(conv)),
+            'hold_h_mean': float(hold.mean()),
+            'open_at_end': int(open_.sum())}
+
+
+def evaluate(scored: pd.DataFrame, params: dict, since=None) -> dict:
+    """Signal rules + outcomes for one parameter set over already-scored rows."""
+    th = {k: params[k] for k in params if k.startswith(Z_RULES) or k.startswith(('apy_net_', 'liq_depth_'))}
+    if th.get('liq_depth_min_bp') is None:
+        th.pop('liq_depth_min_bp', None)
+    df = scored
+    if params['fee_bp_est'] != scored['fee_bp_est'].iat[0]:
+        df = scored.assign(fee_bp_est=params['fee_bp_est'],
+                           apy_net=scored['apy_annual'] - params['fee_bp_est'] / 10000.0 * 365
+                           - scored['funding_est_hourly'] * 24 * 365)
+    eng = SignalEngine(th, params['debounce_minutes'], params['realert_minutes'])
+    return outcomes(df, eng.evaluate_history(df), since=since, max_hold_hours=params['max_hold_hours'],
+                    fee_bp=params['fee_bp_est'])
+
+
+def score(data: pd.DataFrame, params: dict, term_bins) -> pd.DataFrame:
+    """Metrics for every row as live would have scored it: no row sees data after its own snapshot.
+
+    z_term uses a curve fitted on the trailing lookback window only, never one fitted over
+    the whole replay (that would leak the later term structure into earlier signals).
+    """
+    # A funding_est_hourly column (see with_funding) is the per-row funding cost, as live
+    funding = data['funding_est_hourly'] if 'funding_est_hourly' in data.columns else 0.0
+    curves = TermCurveCache(method=params['term_method'], frac=params['term_frac'], term_bins=term_bins)
+    return compute_metrics_batch(data, term_bins,
+                                 lookback_days_for_hist_z=params['lookback_days_for_hist_z'],
+                                 min_history_rows_per_expiry=params['min_history_rows_per_expiry'],
+                                 fee_bp_est=params['fee_bp_est'], funding_est_hourly=funding,
+                                 term_curve=curves)
+
+
+# ── process pool ───────────────────────────────────────────────────────────────
+_DATA = None
+
+
+def _init(path: str):
+    global _DATA
+    _DATA = read_ipc(path)
+
+
+def _run(task):
+    """One worker task: metrics for one METRIC_KEYS combination, then each of its signal sets."""
+    metric_params, sets, term_bins, since = task
+    scored = score(_DATA, {**sets[0][1], **metric_params}, term_bins)
+    return [(i, evaluate(scored, p, since)) for i, p in sets]
+
+
+def _serial(data: pd.DataFrame, tasks: list) -> list:
+    global _DATA
+    _DATA = data
+    try:
+        return [r for task in tasks for r in _run(task)]
+    finally:
+        _DATA = None
+
+
+def _tasks(configs: list, workers: int, term_bins, since) -> list:
+    groups = {}
+    for i, p in enumerate(configs):
+        groups.setdefault(tuple(p[k] for k in METRIC_KEYS), []).append((i, p))
+    # Split big groups so every worker has something to do (each split re-scores once)
+    per = max(1, -(-len(configs) // max(1, workers * 2)))
+    tasks = []
+    for mk, members in groups.items():
+        for j in range(0, len(members), per):
+            chunk = members[j:j + per]
+            tasks.append((dict(zip(METRIC_KEYS, mk)), chunk, term_bins, since))
+    return tasks
+
+
+def sweep(data: pd.DataFrame, configs: list, term_bins, since=None, workers: int = None, log=None) -> pd.DataFrame:
+    """Results per parameter set: the swept parameters plus RESULT_COLUMNS, in `configs` order."""
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    tasks = _tasks(configs, workers, term_bins, since)
+    res = {}
+    if workers == 1 or len(tasks) == 1:
+        res.update(dict(_serial(data, tasks)))
+    else:
+        with tempfile.TemporaryDirectory(prefix='arb_backtest_') as tmp:
+            path = write_ipc(data, os.path.join(tmp, 'data.arrow'))
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init,
+                                     initargs=(path,)) as ex:
+                for out in ex.map(_run, tasks):
+                    res.update(dict(out))
+    if log:
+        log.info(f"Backtest: {len(configs)} config(s), {len(tasks)} task(s), {len(data):,} rows "
+                 f"in {time.perf_counter() - t0:.1f}s on {workers} worker(s)")
+    out = pd.DataFrame(configs)
+    return pd.concat([out, pd.DataFrame([res[i] for i in range(len(configs))])[RESULT_COLUMNS]], axis=1)
+
+
+def main():
+    import yaml
+    from .utils_logging import setup_logger
+    from .scheduler import load_config
+
+    ap = argparse.ArgumentParser(description="Replay archived days with parameter sweeps")
+    ap.add_argument('--start', help="first UTC date scored (YYYY-MM-DD); earlier days are warm-up only")
+    ap.add_argument('--end', help="last UTC date (YYYY-MM-DD)")
+    ap.add_argument('--config', default='config.yaml')
+    ap.add_argument('--sweep', help="YAML file {param: [values]}; default: backtest.sweep from the config")
+    ap.add_argument('--set', action='append', default=[], metavar='PARAM=V1,V2',
+                    help="sweep values on the command line (repeatable, overrides --sweep)")
+    ap.add_argument('--workers', type=int)
+    ap.add_argument('--synthetic-days', type=int, help="replay N days of synthetic hourly data instead of the archive")
+    ap.add_argument('--out', help="write all results as CSV")
+    ap.add_argument('--top', type=int, default=10)
+    args = ap.parse_args()
+
+    log = setup_logger()
+    cfg = load_config(args.config)
+    bt_cfg = cfg.get('backtest', {})
+    base = base_params(cfg)
+    spec = dict(bt_cfg.get('sweep') or {})
+    if args.sweep:
+        with open(args.sweep) as f:
+            spec = yaml.safe_load(f) or {}
+    for s in args.set:
+        k, _, v = s.partition('=')
+        spec[k] = [yaml.safe_load(x) for x in v.split(',')]
+    configs = grid(base, spec)
+
+    if args.synthetic_days:
+        from .utils_synthetic import synthetic_history
+        data = coerce(synthetic_history(n_snapshots=24 * args.synthetic_days, n_instruments=8),
+                      columns=LOAD_COLUMNS)
+        since = data['timestamp_utc'].min() + pd.Timedelta(days=max(c['lookback_days_for_hist_z'] for c in configs))
+    else:
+        warm = max(c['lookback_days_for_hist_z'] for c in configs)
+        since = pd.Timestamp(args.start, tz='UTC') if args.start else None
+        first = (since - pd.Timedelta(days=warm)).strftime('%Y-%m-%d') if since is not None else None
+        data = load_archive(cfg['archive']['out_dir'], first, args.end)
+    if data.empty:
+        log.info("No archived rows in range.")
+        return
+    data = with_funding(data, cfg, log=log)
+    log.info(f"Replaying {len(data):,} rows ({data['timestamp_utc'].min()} .. {data['timestamp_utc'].max()}), "
+             f"{len(configs)} parameter set(s)")
+    res = sweep(data, configs, cfg['term_curve_bins'], since=since,
+                workers=args.workers or bt_cfg.get('workers'), log=log)
+    if args.out:
+        res.to_csv(args.out, index=False)
+    swept = list(spec)
+    top = res.sort_values('conv_bp_mean', ascending=False).head(args.top)
+    for r in top.to_dict('records'):
+        log.info(' '.join(f"{k}={r[k]}" for k in swept) + f" | entries={r['entries']} hit={r['hit_rate']:.0%} "
+                 f"conv={r['conv_bp_mean']:.1f}bp (median {r['conv_bp_median']:.1f}) hold={r['hold_h_mean']:.0f}h")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/basis_engine.py
+# ───────────────────────────────────────────────────────────────────────────────
+import time, asyncio, argparse, threading
+from datetime import datetime, timezone
+import aiohttp
+import numpy as np
+import pandas as pd
+from .connectors import LEG_COLUMNS, make_connector
+from .utils_logging import setup_logger
+
+# Pair rows are scored as their own "exchange" so z_cross/z_term never mix them with venue rows
+PAIR_EXCHANGE = 'pairs'
+_DAY_MS = 86_400_000
+
+
+def align(legs: pd.DataFrame, now_ms: int, max_skew_ms: float = 5000):
+    """Drop legs quoted more than `max_skew_ms` away from the snapshot's median quote time.
+
+    Returns (kept legs, {venue: median skew in ms vs the reference}). Legs without a
+    quote time are taken as quoted at `now_ms`.
+    """
+    if legs.empty:
+        return legs, {}
+    qt = pd.to_numeric(legs['quote_ts'], errors='coerce').fillna(now_ms).to_numpy(dtype=float)
+    ref = np.median(qt)
+    skew = qt - ref
+    by_venue = pd.Series(skew).groupby(legs['exchange'].to_numpy()).median()
+    keep = np.abs(skew) <= max_skew_ms
+    return legs[keep].reset_index(drop=True), {k: float(v) for k, v in by_venue.items()}
+
+
+def _dte(legs: pd.DataFrame, now_ms: int) -> np.ndarray:
+    # Fractional days; perpetuals count as 0 (they track the index)
+    exp = pd.to_numeric(legs['expiry_ts'], errors='coerce').to_numpy(dtype=float)
+    return np.where(np.isnan(exp), 0.0, np.maximum((exp - now_ms) / _DAY_MS, 0.0))
+
+
+def venue_rows(legs: pd.DataFrame, ts: str, now_ms: int) -> pd.DataFrame:
+    """Per-venue futures vs that venue's index and perp, shaped like `fetch_spot_perp_future_prices`."""
+    perp = legs[legs['kind'] == 'perpetual'].drop_duplicates('exchange').set_index('exchange')['price']
+    fut = legs[legs['kind'] == 'future']
+    if fut.empty:
+        return pd.DataFrame()
+    return pd.DataFrame({
+        'timestamp_utc': ts,
+        'exchange': fut['exchange'].to_numpy(),
+        'base': fut['base'].to_numpy(),
+        'quote': fut['quote'].to_numpy(),
+        'instrument_type': 'future',
+        'instrument': fut['instrument'].to_numpy(),
+        'expiry_ts': fut['expiry_ts'].astype('int64').to_numpy(),
+        'days_to_expiry': np.maximum(1, _dte(fut, now_ms).astype(int)),
+        'spot_price': fut['index_price'].to_numpy(dtype=float),
+        'perp_price': fut['exchange'].map(perp).to_numpy(dtype=float),
+        'fut_price': fut['price'].to_numpy(dtype=float),
+        'quote_ts': pd.to_numeric(fut['quote_ts'], errors='coerce').fillna(now_ms).astype('int64').to_numpy(),
+    })
+
+
+def _pair_index(dte: np.ndarray, ex: np.ndarray, perp: np.ndarray, scope: str = 'cross'):
+    """Upper-triangle (near, far) leg indices over legs sorted by dte; perp/perp pairs are skipped."""
+    i, j = np.triu_indices(len(dte), 1)
+    keep = ~(perp[i] & perp[j])
+    if scope == 'cross':
+        keep &= ex[i] != ex[j]
+    return i[keep], j[keep]
+
+
+def _horizon(d_near: np.ndarray, d_far: np.ndarray) -> np.ndarray:
+    # Calendar pairs carry over the gap between expiries; same-expiry pairs converge at expiry
+    gap = d_far - d_near
+    return np.where(gap < 1, d_far, gap)
+
+
+def basis_matrix(legs: pd.DataFrame, now_ms: int) -> pd.DataFrame:
+    """Dense leg x leg annualized basis: cell (i, j) is long leg i / short leg j.
+
+    Built by broadcasting, so it stays O(legs^2) array work with no Python loop
+    over pairs; perp/perp cells are NaN.
+    """
+    d = _dte(legs, now_ms)
+    p = legs['price'].to_numpy(dtype=float)
+    perp = (legs['kind'] == 'perpetual').to_numpy()
+    near, far = np.minimum.outer(d, d), np.maximum.outer(d, d)
+    h = np.maximum(_horizon(near, far), 1.0)
+    m = (p[None, :] / p[:, None] - 1.0) * 365.0 / h
+    m[np.logical_and.outer(perp, perp)] = np.nan
+    labels = (legs['exchange'] + ':' + legs['instrument']).to_numpy()
+    return pd.DataFrame(m, index=labels, columns=labels)
+
+
+def basis_pairs(legs: pd.DataFrame, ts: str, now_ms: int, scope: str = 'cross') -> pd.DataFrame:
+    """Pairwise future/future and future/perp rows across venues and expiries.
+
+    Each pair is a synthetic instrument `far/near` (legs as `venue:instrument`):
+    fut_price is the far leg, spot_price the near leg (the perp for future/perp
+    pairs) and days_to_expiry the carry horizon, so `compute_all_metrics` yields
+    the pair's annualized basis as apy_annual.
+    """
+    if len(legs) < 2:
+        return pd.DataFrame()
+    d_all = _dte(legs, now_ms)
+    order = np.argsort(d_all, kind='stable')
+    lg = legs.iloc[order].reset_index(drop=True)
+    d = d_all[order]
+    ex = lg['exchange'].to_numpy()
+    perp = (lg['kind'] == 'perpetual').to_numpy()
+    i, j = _pair_index(d, ex, perp, scope)
+    if not len(i):
+        return pd.DataFrame()
+    label = (lg['exchange'] + ':' + lg['instrument']).to_numpy()
+    p = lg['price'].to_numpy(dtype=float)
+    qt = pd.to_numeric(lg['quote_ts'], errors='coerce').fillna(now_ms).to_numpy(dtype=np.int64)
+    exp = pd.to_numeric(lg['expiry_ts'], errors='coerce').to_numpy(dtype=float)
+    return pd.DataFrame({
+        'timestamp_utc': ts,
+        'exchange': PAIR_EXCHANGE,
+        'base': lg['base'].to_numpy()[j],
+        'quote': lg['quote'].to_numpy()[j],
+        'instrument_type': np.where(perp[i], 'fut_perp', 'fut_fut'),
+        'instrument': label[j] + '/' + label[i],
+        'expiry_ts': exp[j].astype(np.int64),
+        'days_to_expiry': np.maximum(1.0, _horizon(d[i], d[j])),  # fractional: calendar gaps are short
+        'spot_price': p[i],
+        'perp_price': np.where(perp[i], p[i], np.nan),
+        'fut_price': p[j],
+        'quote_ts': np.maximum(qt[i], qt[j]),
+    })
+
+
+class BasisEngine:
+    """Concurrent multi-venue snapshots aligned in time, expanded into venue and pair rows.
+
+    All connectors share one aiohttp session on a private event loop thread, so
+    `snapshot()` can be called from any thread (the scheduler's asset pool) and
+    every venue for an asset is fetched concurrently.
+    """
+
+    def __init__(self, venues=('deribit',), pairs: str = 'cross', max_skew_ms: float = 5000,
+                 timeout_s: float = 10, instruments_ttl_s: float = 3600, apis: dict = None, log=None):
+        apis = apis or {}
+        self.connectors = [make_connector(v, api=apis.get(v), instruments_ttl_s=instruments_ttl_s,
+                                          timeout_s=timeout_s) for v in venues]
+        self.pairs = pairs
+        self.max_skew_ms = max_skew_ms
+        self.timeout_s = timeout_s
+        self.log = log or setup_logger()
+        self.last = {}  # base -> {venue: {legs, skew_ms, dropped | error}}
+        self._http = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="basis-engine", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, cfg: dict, log=None):
+        v = cfg.get('venues', {})
+        return cls(v.get('enabled') or ['deribit'], pairs=v.get('pairs', 'cross'),
+                   max_skew_ms=v.get('max_skew_ms', 5000), timeout_s=v.get('timeout_s', 10),
+                   instruments_ttl_s=cfg.get('deribit', {}).get('instruments_ttl_s', 3600),
+                   apis=v.get('api_urls'), log=log)
+
+    def close(self):
+        async def _close():
+            if self._http is not None:
+                await self._http.close()
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(_close(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+        self._loop.close()
+
+    async def _legs(self, base: str, quote: str):
+        if self._http is None:
+            self._http = aiohttp.ClientSession()
+
+        async def one(c):
+            try:
+                return c.name, await c.fetch_legs(self._http, base, quote), None
+            except Exception as e:
+                return c.name, None, e
+        return await asyncio.gather(*(one(c) for c in self.connectors))
+
+    def legs(self, base: str, quote: str):
+        """(legs frame, {venue: error}) for every venue, fetched concurrently."""
+        fut = asyncio.run_coroutine_threadsafe(self._legs(base, quote), self._loop)
+        res = fut.result(self.timeout_s + 5)
+        frames = [df for _, df, _ in res if df is not None and len(df)]
+        errors = {name: e for name, _, e in res if e is not None}
+        legs = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LEG_COLUMNS)
+        return legs, errors
+
+    def snapshot(self, base: str = 'BTC', quote: str = 'USD') -> pd.DataFrame:
+        """Venue rows plus pairwise basis rows for one asset, stamped with one timestamp_utc."""
+        legs, errors = self.legs(base, quote)
+        now = datetime.now(timezone.utc)
+        now_ms = int(now.timestamp() * 1000)
+        ts = now.isoformat()
+        kept, skew = align(legs, now_ms, self.max_skew_ms)
+        info = {}
+        for name, e in errors.items():
+            self.log.warning(f"{base}: {name} snapshot failed: {e}")
+            info[name] = {'error': str(e)}
+        n_all = legs['exchange'].value_counts()
+        n_kept = kept['exchange'].value_counts()
+        for name in n_all.index:
+            info[name] = {'legs': int(n_kept.get(name, 0)), 'dropped': int(n_all[name] - n_kept.get(name, 0)),
+                          'skew_ms': skew.get(name)}
+        self.last[base] = info
+        parts = [venue_rows(kept, ts, now_ms)]
+        if self.pairs != 'none':
+            parts.append(basis_pairs(kept, ts, now_ms, scope=self.pairs))
+        parts = [p for p in parts if len(p)]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def _synthetic_legs(n_venues: int, n_expiries: int, now_ms: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for v in range(n_venues):
+        for k in range(n_expiries + 1):
+            perp = k == 0
+            dte = 7.0 * k
+            rows.append((f"v{v}", 'BTC', 'USD', f"BTC-{k}" if not perp else 'BTC-PERP',
+                         'perpetual' if perp else 'future', None if perp else now_ms + int(dte * _DAY_MS),
+                         100_000 * (1 + 0.08 * dte / 365 + rng.normal(0, 2e-4)), 100_000.0, now_ms))
+    return pd.DataFrame(rows, columns=LEG_COLUMNS)
+
+
+def bench(shapes=((3, 8), (6, 12), (10, 20), (20, 40)), repeat: int = 20, log=None) -> dict:
+    now_ms = int(time.time() * 1000)
+    ts = datetime.now(timezone.utc).isoformat()
+    res = {}
+    for nv, ne in shapes:
+        legs = _synthetic_legs(nv, ne, now_ms)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            rows = basis_pairs(legs, ts, now_ms, scope='all')
+        res[(nv, ne)] = (time.perf_counter() - t0) / repeat
+        if log:
+            log.info(f"basis pairs: {nv:>3} venues x {ne:>3} expiries = {len(legs):>4} legs, "
+                     f"{len(rows):>6} pairs in {res[(nv, ne)]*1000:.2f} ms")
+    return res
+
+
+def main():
+    from .scheduler import load_config
+    ap = argparse.ArgumentParser(description="Cross-exchange basis snapshot")
+    ap.add_argument('--base', default='BTC')
+    ap.add_argument('--quote', default='USD')
+    ap.add_argument('--venues', nargs='*', help="default: venues.enabled from config.yaml")
+    ap.add_argument('--matrix', action='store_true', help="print the dense leg x leg basis matrix")
+    ap.add_argument('--bench', action='store_true', help="time the pair expansion on synthetic legs")
+    args = ap.parse_args()
+
+    log = setup_logger()
+    if args.bench:
+        bench(log=log)
+        return
+    cfg = load_config()
+    if args.venues:
+        cfg.setdefault('venues', {})['enabled'] = args.venues
+    eng = BasisEngine.from_config(cfg, log=log)
+    try:
+        if args.matrix:
+            legs, _ = eng.legs(args.base, args.quote)
+            legs, _ = align(legs, int(time.time() * 1000), eng.max_skew_ms)
+            with pd.option_context('display.width', 250, 'display.max_columns', 50):
+                print(basis_matrix(legs, int(time.time() * 1000)).round(4))
+        else:
+            snap = eng.snapshot(args.base, args.quote)
+            log.info(f"{len(snap)} rows; venues: {eng.last.get(args.base)}")
+            print(snap.to_string())
+    finally:
+        eng.close()
+
+if __name__ == "__main__":
+    main()
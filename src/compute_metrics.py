@@ -5,6 +5,7 @@ import numpy as np
 import pandas as pd
 from datetime import datetime
 from .utils_zscore import cross_sectional_z
+from .schema import coerce
 from .utils_termcurve import fit_term_curve_lowess, fit_term_curve_bins
 
 
@@ -14,7 +15,13 @@ def compute_all_metrics(current_df: pd.DataFrame,
                         lookback_days_for_hist_z: int = 30,
                         min_history_rows_per_expiry: int = 60,
                         fee_bp_est: float = 2.0,
-                        funding_est_hourly: float = 0.0) -> pd.DataFrame:
+                        funding_est_hourly: float = 0.0,
+                        stats_state=None,
+                        term_curve=None) -> pd.DataFrame:
+    # stats_state (StatsState): when given, z_hist/z_term are scored and updated
+    # incrementally instead of from the raw history frame.
+    # term_curve (TermCurveCache): cached/incremental term-curve fit; default is a
+    # full LOWESS over the history window.
     df = current_df.copy()
     # Basic spread & APY
     df['spread'] = df['fut_price'] - df['spot_price']
@@ -28,42 +35,61 @@ def compute_all_metrics(current_df: pd.DataFrame,
     z_term = []
     # Prepare historical set limited by lookback days
     if not history_df.empty:
-        hist = history_df.copy()
-        # coerce types
-        hist['apy_annual'] = pd.to_numeric(hist.get('apy_annual'), errors='coerce')
-        hist['spread'] = pd.to_numeric(hist.get('spread'), errors='coerce')
-        hist['days_to_expiry'] = pd.to_numeric(hist.get('days_to_expiry'), errors='coerce')
-        hist = hist.dropna(subset=['instrument','apy_annual','spread','days_to_expiry'])
-        # For each instrument now, compute z_hist using that instrument's last N rows
-        for _, row in df.iterrows():
-            inst = row['instrument']
-            h = hist[hist['instrument'] == inst].tail(1000)
-            if len(h) >= min_history_rows_per_expiry and h['apy_annual'].std(ddof=0) > 0:
-                z_h = (row['apy_annual'] - h['apy_annual'].mean()) / h['apy_annual'].std(ddof=0)
-            else:
-                z_h = np.nan
-            z_hist.append(z_h)
+        # Typed history (history store) passes straight through; sheet frames are parsed once
+        need = ['instrument', 'apy_annual', 'spread', 'days_to_expiry']
+        hist = coerce(history_df, columns=need + [c for c in ('timestamp_utc', 'exchange', 'base')
+                                                  if c in history_df.columns])
+        hist = hist.dropna(subset=need)
+        # Honor the lookback window (in time, not rows) when history carries timestamps
+        if 'timestamp_utc' in hist.columns and lookback_days_for_hist_z:
+            ts = hist['timestamp_utc']
+            ref = pd.to_datetime(df['timestamp_utc'], errors='coerce', utc=True).max() \
+                if 'timestamp_utc' in df.columns else ts.max()
+            hist = hist[ts >= ref - pd.Timedelta(days=lookback_days_for_hist_z)]
+        # Per-instrument mean/std of apy_annual over the window, one groupby pass
+        if stats_state is None:
+            g = hist.groupby('instrument', observed=True)['apy_annual']
+            n = df['instrument'].map(g.count()).fillna(0)
+            mu = df['instrument'].map(g.mean())
+            sd = df['instrument'].map(g.std(ddof=0))
+            ok = (n >= min_history_rows_per_expiry) & (sd > 0)
+            z_hist = ((df['apy_annual'] - mu) / sd).where(ok).tolist()
         # Term-structure deviation: fit curve on history (all futures)
         h2 = hist[['days_to_expiry','spread']].dropna()
-        predict = fit_term_curve_lowess(h2['days_to_expiry'].values, h2['spread'].values, frac=0.6)
-        if predict is None:
-            predict = fit_term_curve_bins(h2['days_to_expiry'].values, h2['spread'].values, bins=term_bins)
+        if term_curve is not None and 'timestamp_utc' in hist.columns:
+            key = tuple(df[c].iloc[0] for c in ('exchange', 'base') if c in df.columns)
+            predict = term_curve.fit(hist, key=key)
+        else:
+            predict = fit_term_curve_lowess(h2['days_to_expiry'].values, h2['spread'].values, frac=0.6)
+            if predict is None:
+                predict = fit_term_curve_bins(h2['days_to_expiry'].values, h2['spread'].values, bins=term_bins)
         if predict is not None:
-            curve_vals = df['days_to_expiry'].apply(lambda d: predict(float(d)))
+            curve_vals = predict(df['days_to_expiry'].to_numpy(dtype=float))
             dev = df['spread'] - curve_vals
             # Normalize dev using history of dev
             h2['curve'] = predict(h2['days_to_expiry'].values)
             h2['dev'] = h2['spread'] - h2['curve']
-            if h2['dev'].std(ddof=0) > 0:
+            if stats_state is not None:
+                if stats_state.is_empty():
+                    stats_state.warm(hist, h2['dev'])
+                z_hist, z_t = stats_state.score_and_update(df, dev)
+                z_hist, z_term = z_hist.tolist(), z_t.tolist()
+            elif h2['dev'].std(ddof=0) > 0:
                 z_t = (dev - h2['dev'].mean()) / h2['dev'].std(ddof=0)
                 z_term = z_t.tolist()
             else:
                 z_term = [np.nan]*len(df)
         else:
+            if stats_state is not None:
+                if stats_state.is_empty():
+                    stats_state.warm(hist)
+                z_hist = stats_state.score_and_update(df)[0].tolist()
             z_term = [np.nan]*len(df)
     else:
         z_hist = [np.nan]*len(df)
         z_term = [np.nan]*len(df)
+        if stats_state is not None:
+            z_hist = stats_state.score_and_update(df)[0].tolist()
 
     if len(z_hist) != len(df):
         # fill if not computed above due to branch
@@ -71,11 +97,11 @@ def compute_all_metrics(current_df: pd.DataFrame,
     df['z_hist'] = pd.Series(z_hist, index=df.index)
     df['z_term'] = pd.Series(z_term, index=df.index)
 
-    # Fee & funding estimation (simple placeholder)
+    # Fee & funding: the rich (long-perp) leg pays positive funding, so it comes off the carry
     df['funding_est_hourly'] = funding_est_hourly
     df['fee_bp_est'] = fee_bp_est
     fee_frac = df['fee_bp_est'] / 10000.0
-    df['apy_net'] = df['apy_annual'] - fee_frac * 365  # rough annualized fee impact
+    df['apy_net'] = df['apy_annual'] - fee_frac * 365 - df['funding_est_hourly'] * 24 * 365
 
     # Signal logic placeholder; decision refined in scheduler
     return df
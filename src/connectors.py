@@ -0,0 +1,207 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/connectors.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, abc, json, time, asyncio
+import aiohttp
+import numpy as np
+import pandas as pd
+from .utils_metrics import METRICS
+
+# Every connector returns one row per listed leg in this shape; perpetuals have expiry_ts=None
+LEG_COLUMNS = ['exchange', 'base', 'quote', 'instrument', 'kind', 'expiry_ts', 'price', 'index_price', 'quote_ts']
+
+
+def _levels(rows, unit_usd: float = 1.0) -> np.ndarray:
+    # [[price, size, ...], ...] -> float array [n, 2] of (price, USD notional)
+    a = np.asarray([r[:2] for r in rows], dtype=float).reshape(-1, 2)
+    a[:, 1] *= unit_usd
+    return a
+
+
+class Connector(abc.ABC):
+    """Async public-REST quote source for one venue.
+
+    `fetch_legs(http, base, quote)` returns every listed future plus the perpetual
+    with the venue's own index price. Instrument metadata is cached per base for
+    `instruments_ttl_s`, like `fetch_deribit.get_future_instruments`. A venue must
+    implement every abstract method, or it fails at construction.
+    """
+    name = None
+    default_api = None
+
+    def __init__(self, api: str = None, instruments_ttl_s: float = 3600, timeout_s: float = 10):
+        self.api = (api or self.default_api).rstrip('/')
+        self.instruments_ttl_s = instruments_ttl_s
+        self.timeout = aiohttp.ClientTimeout(total=timeout_s)
+        self._meta = {}  # base -> (fetched_at_monotonic, meta)
+
+    async def _get(self, http: aiohttp.ClientSession, path: str, params: dict = None):
+        async with http.get(f"{self.api}{path}", params=params, timeout=self.timeout) as r:
+            body = await r.read()
+            METRICS.http(self.name, r.status, len(body))
+            r.raise_for_status()
+            return json.loads(body)
+
+    async def instruments(self, http, base: str, quote: str, refresh: bool = False) -> dict:
+        hit = self._meta.get(base)
+        if hit and not refresh and time.monotonic() - hit[0] < self.instruments_ttl_s:
+            return hit[1]
+        meta = await self._instruments(http, base, quote)
+        self._meta[base] = (time.monotonic(), meta)
+        return meta
+
+    @abc.abstractmethod
+    async def fetch_legs(self, http, base: str, quote: str) -> pd.DataFrame:
+        ...
+
+    @abc.abstractmethod
+    async def fetch_book(self, http, base: str, quote: str, instrument: str, depth: int = 20) -> tuple:
+        """(bids, asks, ts_ms): level arrays of (price, USD notional), best first, at most `depth` deep."""
+
+    @abc.abstractmethod
+    def perp_instrument(self, base: str, quote: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    async def _instruments(self, http, base: str, quote: str) -> dict:
+        ...
+
+    def _frame(self, base: str, quote: str, rows: list) -> pd.DataFrame:
+        df = pd.DataFrame(rows, columns=['instrument', 'kind', 'expiry_ts', 'price', 'index_price', 'quote_ts'])
+        df.insert(0, 'quote', quote)
+        df.insert(0, 'base', base)
+        df.insert(0, 'exchange', self.name)
+        return df[LEG_COLUMNS]
+
+
+class DeribitConnector(Connector):
+    name = 'deribit'
+    default_api = os.getenv('DERIBIT_API_URL', "https://www.deribit.com/api/v2")
+
+    async def _instruments(self, http, base, quote):
+        res = await self._get(http, '/public/get_instruments',
+                              {'currency': base, 'kind': 'future', 'expired': 'false'})
+        return {it['instrument_name']: it for it in res['result']}
+
+    async def fetch_legs(self, http, base, quote):
+        meta, idx, book = await asyncio.gather(
+            self.instruments(http, base, quote),
+            self._get(http, '/public/get_index_price', {'index_name': f"{base.lower()}_{quote.lower()}"}),
+            self._get(http, '/public/get_book_summary_by_currency', {'currency': base, 'kind': 'future'}))
+        book = book['result']
+        if any(q['instrument_name'] not in meta for q in book):
+            meta = await self.instruments(http, base, quote, refresh=True)
+        spot = idx['result']['index_price']
+        rows = []
+        for q in book:
+            it = meta.get(q['instrument_name'])
+            if it is None:
+                continue
+            perp = it.get('settlement_period') == 'perpetual' or it['instrument_name'].endswith('-PERPETUAL')
+            rows.append((it['instrument_name'], 'perpetual' if perp else 'future',
+                         None if perp else it['expiration_timestamp'],
+                         q.get('last') or q.get('mark_price'), spot, q.get('creation_timestamp')))
+        return self._frame(base, quote, rows)
+
+    def perp_instrument(self, base, quote):
+        return f"{base}-PERPETUAL"
+
+    async def fetch_book(self, http, base, quote, instrument, depth=20):
+        # Inverse contracts: amounts are already USD
+        res = (await self._get(http, '/public/get_order_book', {'instrument_name': instrument, 'depth': depth}))['result']
+        return _levels(res['bids']), _levels(res['asks']), res.get('timestamp')
+
+
+class OKXConnector(Connector):
+    """Coin-margined (inverse) futures and swap, instrument family `<BASE>-<QUOTE>`."""
+    name = 'okx'
+    default_api = os.getenv('OKX_API_URL', "https://www.okx.com")
+
+    async def _get(self, http, path, params=None):
+        res = await super()._get(http, path, params)
+        if str(res.get('code', '0')) != '0':
+            raise RuntimeError(f"OKX {path}: {res.get('code')} {res.get('msg')}")
+        return res['data']
+
+    async def _instruments(self, http, base, quote):
+        data = await self._get(http, '/api/v5/public/instruments',
+                               {'instType': 'FUTURES', 'instFamily': f"{base}-{quote}"})
+        return {it['instId']: it for it in data if it.get('state', 'live') == 'live'}
+
+    async def fetch_legs(self, http, base, quote):
+        family = f"{base}-{quote}"
+        meta, idx, futs, swaps = await asyncio.gather(
+            self.instruments(http, base, quote),
+            self._get(http, '/api/v5/market/index-tickers', {'instId': family}),
+            self._get(http, '/api/v5/market/tickers', {'instType': 'FUTURES', 'instFamily': family}),
+            self._get(http, '/api/v5/market/tickers', {'instType': 'SWAP', 'instFamily': family}))
+        if any(t['instId'] not in meta for t in futs):
+            meta = await self.instruments(http, base, quote, refresh=True)
+        spot = float(idx[0]['idxPx'])
+        rows = [(t['instId'], 'future', int(meta[t['instId']]['expTime']), float(t['last']), spot, int(t['ts']))
+                for t in futs if t['instId'] in meta and t.get('last')]
+        rows += [(t['instId'], 'perpetual', None, float(t['last']), spot, int(t['ts']))
+                 for t in swaps if t['instId'] == f"{family}-SWAP" and t.get('last')]
+        return self._frame(base, quote, rows)
+
+    def perp_instrument(self, base, quote):
+        return f"{base}-{quote}-SWAP"
+
+    async def fetch_book(self, http, base, quote, instrument, depth=20):
+        # Sizes are contracts of ctVal USD (100 for BTC, 10 otherwise; swaps aren't in the futures metadata)
+        meta, data = await asyncio.gather(self.instruments(http, base, quote),
+                                          self._get(http, '/api/v5/market/books', {'instId': instrument, 'sz': depth}))
+        unit = float(meta.get(instrument, {}).get('ctVal') or (100 if base == 'BTC' else 10))
+        book = data[0]
+        return _levels(book['bids'], unit), _levels(book['asks'], unit), int(book['ts'])
+
+
+class BinanceCMConnector(Connector):
+    """Binance COIN-M delivery futures and perpetual for pair `<BASE><QUOTE>`."""
+    name = 'binance_cm'
+    default_api = os.getenv('BINANCE_DAPI_URL', "https://dapi.binance.com")
+
+    async def _instruments(self, http, base, quote):
+        info = await self._get(http, '/dapi/v1/exchangeInfo')
+        pair = f"{base}{quote}"
+        return {s['symbol']: s for s in info['symbols']
+                if s.get('pair') == pair and s.get('contractStatus', 'TRADING') == 'TRADING'}
+
+    async def fetch_legs(self, http, base, quote):
+        pair = f"{base}{quote}"
+        meta, prem, last = await asyncio.gather(
+            self.instruments(http, base, quote),
+            self._get(http, '/dapi/v1/premiumIndex', {'pair': pair}),
+            self._get(http, '/dapi/v1/ticker/price', {'pair': pair}))
+        if any(t['symbol'] not in meta for t in last):
+            meta = await self.instruments(http, base, quote, refresh=True)
+        spot = float(prem[0]['indexPrice']) if prem else None
+        rows = []
+        for t in last:
+            s = meta.get(t['symbol'])
+            if s is None:
+                continue
+            perp = s.get('contractType') == 'PERPETUAL'
+            rows.append((t['symbol'], 'perpetual' if perp else 'future', None if perp else int(s['deliveryDate']),
+                         float(t['price']), spot, int(t['time'])))
+        return self._frame(base, quote, rows)
+
+    def perp_instrument(self, base, quote):
+        return f"{base}{quote}_PERP"
+
+    async def fetch_book(self, http, base, quote, instrument, depth=20):
+        # limit must be one of Binance's fixed sizes; quantities are contracts of contractSize USD
+        limit = next((n for n in (5, 10, 20, 50, 100, 500, 1000) if n >= depth), 1000)
+        meta, book = await asyncio.gather(self.instruments(http, base, quote),
+                                          self._get(http, '/dapi/v1/depth', {'symbol': instrument, 'limit': limit}))
+        unit = float(meta.get(instrument, {}).get('contractSize') or (100 if base == 'BTC' else 10))
+        return _levels(book['bids'][:depth], unit), _levels(book['asks'][:depth], unit), book.get('T')
+
+
+CONNECTORS = {c.name: c for c in (DeribitConnector, OKXConnector, BinanceCMConnector)}
+
+
+def make_connector(name: str, **kw) -> Connector:
+    if name not in CONNECTORS:
+        raise ValueError(f"Unknown venue: {name} (known: {', '.join(CONNECTORS)})")
+    return CONNECTORS[name](**kw)
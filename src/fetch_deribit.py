@@ -1,40 +1,121 @@
 # ───────────────────────────────────────────────────────────────────────────────
 # src/fetch_deribit.py
 # ───────────────────────────────────────────────────────────────────────────────
-import requests, time
+import os, time, threading
+import requests
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from .utils_metrics import METRICS
+
+DERIBIT_API = os.getenv('DERIBIT_API_URL', "https://www.deribit.com/api/v2")
+
+_session = None
+_session_lock = threading.Lock()
+# (api, currency) -> (fetched_at_monotonic, {instrument_name: instrument})
+_instruments_cache = {}
+
+
+def get_session(pool_size: int = 16) -> requests.Session:
+    """Process-wide keep-alive session shared by every Deribit call."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            s.mount('https://', adapter)
+            s.mount('http://', adapter)
+            METRICS.instrument_session(s, 'deribit')
+            _session = s
+    return _session
 
-DERIBIT_API = "https://www.deribit.com/api/v2"
 
 def _get(url, params=None):
-    r = requests.get(url, params=params, timeout=15)
+    r = get_session().get(url, params=params, timeout=15)
     r.raise_for_status()
     return r.json()
 
 
-def fetch_spot_perp_future_prices(base="BTC", quote="USD") -> pd.DataFrame:
+def get_future_instruments(base="BTC", api=DERIBIT_API, ttl_s: float = 3600, refresh: bool = False) -> dict:
+    # Expiries only change on listing/expiry, so metadata is cached between runs
+    key = (api, base)
+    hit = _instruments_cache.get(key)
+    if hit and not refresh and time.monotonic() - hit[0] < ttl_s:
+        return hit[1]
+    insts = _get(f"{api}/public/get_instruments", {"currency": base, "kind": "future", "expired": "false"})['result']
+    meta = {it['instrument_name']: it for it in insts}
+    _instruments_cache[key] = (time.monotonic(), meta)
+    return meta
+
+
+def _is_perpetual(it: dict) -> bool:
+    return it.get('settlement_period') == 'perpetual' or it['instrument_name'].endswith('-PERPETUAL')
+
+
+def _quotes_bulk(base, api):
+    # One call returns every future (and the perpetual) with its quote time
+    res = _get(f"{api}/public/get_book_summary_by_currency", {"currency": base, "kind": "future"})['result']
+    return {
+        q['instrument_name']: (q.get('last') or q.get('mark_price'), q.get('creation_timestamp'))
+        for q in res
+    }
+
+
+def _quotes_ticker(names, api, max_workers):
+    def one(name):
+        try:
+            t = _get(f"{api}/public/ticker", {"instrument_name": name})['result']
+        except requests.HTTPError as e:
+            # Expired since the metadata was cached: no quote, the caller refreshes the metadata
+            if e.response is not None and e.response.status_code == 400:
+                return name, None
+            raise
+        return name, (t['last_price'] or t['mark_price'], t.get('timestamp'))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names)))) as ex:
+        return {n: q for n, q in ex.map(one, names) if q is not None}
+
+
+def fetch_spot_perp_future_prices(base="BTC", quote="USD", mode: str = "bulk",
+                                  max_workers: int = 8, instruments_ttl_s: float = 3600,
+                                  api: str = DERIBIT_API) -> pd.DataFrame:
     # Deribit doesn't have classic spot; use index price for spot proxy
     # 1) Index price
-    idx = _get(f"{DERIBIT_API}/public/get_index_price", {"index_name": f"{base}-{quote}"})
+    idx = _get(f"{api}/public/get_index_price", {"index_name": f"{base.lower()}_{quote.lower()}"})
     spot = idx['result']['index_price']
+    spot_ts = int(time.time() * 1000)
 
-    # 2) Perp price via ticker
+    # 2) Futures metadata (cached) and quotes for futures + perpetual
+    meta = get_future_instruments(base, api=api, ttl_s=instruments_ttl_s)
     perp_instr = f"{base}-PERPETUAL"
-    perp = _get(f"{DERIBIT_API}/public/ticker", {"instrument_name": perp_instr})['result']
-    perp_price = perp['last_price'] or perp['mark_price']
+    if mode == "bulk":
+        quotes = _quotes_bulk(base, api)
+        if any(n not in meta for n in quotes):
+            # New listing since the metadata was cached
+            meta = get_future_instruments(base, api=api, ttl_s=instruments_ttl_s, refresh=True)
+    elif mode == "ticker":
+        names = [perp_instr] + [n for n, it in meta.items() if not _is_perpetual(it)]
+        quotes = _quotes_ticker(names, api, max_workers)
+        if len(quotes) < len(names):
+            meta = get_future_instruments(base, api=api, ttl_s=instruments_ttl_s, refresh=True)
+    else:
+        raise ValueError(f"Unknown Deribit fetch mode: {mode}")
+
+    if perp_instr not in quotes:
+        # Partial response: without the perp leg no row can be scored
+        raise RuntimeError(f"Deribit returned no {perp_instr} quote ({len(quotes)} instrument(s) quoted)")
+    perp_price, _ = quotes[perp_instr]
 
-    # 3) Futures instruments and last price
-    insts = _get(f"{DERIBIT_API}/public/get_instruments", {"currency": base, "kind": "future", "expired": False})['result']
+    # 3) One row per listed future
     rows = []
     now = datetime.utcnow().replace(tzinfo=timezone.utc)
     ts = now.isoformat()
-    for it in insts:
-        name = it['instrument_name']
+    for name, it in meta.items():
+        if _is_perpetual(it) or name not in quotes:
+            continue
         exp_ms = it['expiration_timestamp']
         dte = max(1, int((datetime.fromtimestamp(exp_ms/1000, tz=timezone.utc) - now).days))
-        t = _get(f"{DERIBIT_API}/public/ticker", {"instrument_name": name})['result']
-        fut_price = t['last_price'] or t['mark_price']
+        fut_price, quote_ts = quotes[name]
         rows.append({
             'timestamp_utc': ts,
             'exchange': 'deribit',
@@ -47,5 +128,6 @@ def fetch_spot_perp_future_prices(base="BTC", quote="USD") -> pd.DataFrame:
             'spot_price': spot,
             'perp_price': perp_price,
             'fut_price': fut_price,
+            'quote_ts': quote_ts or spot_ts,
         })
     return pd.DataFrame(rows)
@@ -0,0 +1,159 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/funding.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, time, argparse, threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .fetch_deribit import DERIBIT_API, _get
+from .utils_metrics import METRICS
+
+# Deribit perpetual funding: hourly `interest_1h` records cached per instrument in
+# <dir>/<PERP>.parquet. Each run only asks for records newer than the cached tail
+# (none at all until the next hourly record is due), and the estimate fed into
+# apy_net is a trailing mean over `window_hours`.
+
+HOUR_MS = 3_600_000
+FUNDING_SCHEMA = pa.schema([('timestamp', pa.int64()), ('interest_1h', pa.float64()),
+                            ('interest_8h', pa.float64()), ('index_price', pa.float64())])
+
+
+def perp_instrument(base: str) -> str:
+    return f"{base}-PERPETUAL"
+
+
+class FundingCache:
+    """Incrementally cached funding history and its rolling hourly estimate, per asset."""
+
+    def __init__(self, root: str, api: str = DERIBIT_API, window_hours: float = 72, retain_days: float = 90,
+                 backfill_days: float = 30, chunk_hours: int = 720, log=None):
+        self.root = root
+        self.api = api.rstrip('/')
+        self.window_hours = window_hours
+        self.retain_ms = int(retain_days * 86400e3)
+        self.backfill_ms = int(backfill_days * 86400e3)
+        self.chunk_ms = int(chunk_hours) * HOUR_MS   # Deribit caps one response at ~744 hourly records
+        self.log = log
+        self._hist = {}    # instrument -> frame, loaded once then kept in memory
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict, log=None):
+        f_cfg = cfg.get('funding', {})
+        api = (cfg.get('venues', {}).get('api_urls') or {}).get('deribit') or DERIBIT_API
+        return cls(f_cfg.get('dir') or os.path.join(cfg['state']['dir'], 'funding'), api=api,
+                   window_hours=f_cfg.get('window_hours', 72), retain_days=f_cfg.get('retain_days', 90),
+                   backfill_days=f_cfg.get('backfill_days', 30), log=log)
+
+    def path(self, instrument: str) -> str:
+        return os.path.join(self.root, f"{instrument}.parquet")
+
+    def _instrument_lock(self, instrument: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(instrument, threading.Lock())
+
+    def history(self, instrument: str) -> pd.DataFrame:
+        if instrument not in self._hist:
+            p = self.path(instrument)
+            self._hist[instrument] = pq.read_table(p).to_pandas() if os.path.exists(p) \
+                else FUNDING_SCHEMA.empty_table().to_pandas()
+        return self._hist[instrument]
+
+    def _fetch(self, instrument: str, start_ms: int, end_ms: int) -> pd.DataFrame:
+        rows = []
+        while start_ms <= end_ms:
+            stop = min(end_ms, start_ms + self.chunk_ms)
+            res = _get(f"{self.api}/public/get_funding_rate_history",
+                       {'instrument_name': instrument, 'start_timestamp': start_ms, 'end_timestamp': stop})['result']
+            rows += res
+            start_ms = stop + 1
+        cols = [f.name for f in FUNDING_SCHEMA]
+        return pd.DataFrame([{c: r.get(c) for c in cols} for r in rows], columns=cols).astype(
+            {f.name: f.type.to_pandas_dtype() for f in FUNDING_SCHEMA})
+
+    def update(self, base: str, now_ms: int = None) -> int:
+        """Fetch records after the cached tail; returns rows added (0 without a request when none are due)."""
+        inst = perp_instrument(base)
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        with self._instrument_lock(inst):
+            h = self.history(inst)
+            last = int(h['timestamp'].iat[-1]) if len(h) else now_ms - self.backfill_ms - 1
+            if last >= now_ms // HOUR_MS * HOUR_MS:
+                return 0   # the next hourly record isn't published yet
+            new = self._fetch(inst, last + 1, now_ms)
+            new = new[new['timestamp'] > last]
+            if new.empty:
+                return 0
+            h = pd.concat([h, new], ignore_index=True) if len(h) else new.reset_index(drop=True)
+            h = h.drop_duplicates('timestamp', keep='last').sort_values('timestamp', ignore_index=True)
+            h = h[h['timestamp'] >= now_ms - self.retain_ms].reset_index(drop=True)
+            os.makedirs(self.root, exist_ok=True)
+            tmp = self.path(inst) + '.tmp'
+            pq.write_table(pa.Table.from_pandas(h, schema=FUNDING_SCHEMA, preserve_index=False), tmp)
+            os.replace(tmp, self.path(inst))
+            self._hist[inst] = h
+            METRICS.rows('write', 'funding', len(new))
+            return len(new)
+
+    def rolling(self, base: str) -> pd.Series:
+        """Trailing mean of interest_1h over `window_hours`, indexed by record time (UTC)."""
+        h = self.history(perp_instrument(base))
+        s = pd.Series(h['interest_1h'].to_numpy(dtype=float),
+                      index=pd.to_datetime(h['timestamp'].to_numpy(), unit='ms', utc=True))
+        return s.rolling(pd.Timedelta(hours=self.window_hours), min_periods=1).mean()
+
+    def estimate(self, base: str, refresh: bool = True) -> float:
+        """Latest rolling hourly funding rate (fraction per hour); the last cached value if a fetch fails."""
+        if refresh:
+            try:
+                self.update(base)
+            except Exception as e:
+                METRICS.inc('funding_fetch_errors_total', asset=base)
+                if self.log:
+                    self.log.warning(f"{base}: funding fetch failed, using cached estimate ({e})")
+        r = self.rolling(base)
+        if r.empty:
+            return 0.0
+        METRICS.set('funding_age_seconds', time.time() - r.index[-1].timestamp(), asset=base)
+        return float(r.iat[-1])
+
+    def estimate_rows(self, df: pd.DataFrame, exchange: str = 'deribit') -> np.ndarray:
+        """Rolling estimate as of each row's timestamp (backfills); 0 for other venues or before the cache."""
+        out = np.zeros(len(df))
+        if df.empty:
+            return out
+        ts = pd.to_datetime(df['timestamp_utc'], utc=True)
+        mask = (df['exchange'].astype(str) == exchange).to_numpy() if 'exchange' in df.columns \
+            else np.ones(len(df), dtype=bool)
+        for base in pd.unique(df['base'].astype(str)[mask]):
+            r = self.rolling(base)
+            if r.empty:
+                continue
+            m = mask & (df['base'].astype(str) == base).to_numpy()
+            t = ts[m].to_numpy(dtype='datetime64[ns]')
+            i = np.searchsorted(r.index.to_numpy(dtype='datetime64[ns]'), t, side='right') - 1
+            out[m] = np.where(i >= 0, r.to_numpy()[np.maximum(i, 0)], 0.0)
+        return out
+
+
+def main():
+    from .utils_logging import setup_logger
+    from .scheduler import load_config, assets
+
+    ap = argparse.ArgumentParser(description="Deribit perpetual funding cache")
+    ap.add_argument('--config', default='config.yaml')
+    args = ap.parse_args()
+    log = setup_logger()
+    cfg = load_config(args.config)
+    fc = FundingCache.from_config(cfg, log=log)
+    for base, _ in assets(cfg):
+        n = fc.update(base)
+        h = fc.history(perp_instrument(base))
+        est = fc.estimate(base, refresh=False)
+        log.info(f"{perp_instrument(base)}: +{n} record(s), {len(h)} cached; "
+                 f"{fc.window_hours:g}h funding {est:.3e}/h ({est * 24 * 365:.2%} annualized)")
+
+if __name__ == "__main__":
+    main()
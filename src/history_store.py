@@ -0,0 +1,188 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/history_store.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, time, uuid, argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from datetime import datetime, timedelta, timezone
+
+from .schema import ARROW_SCHEMA as SCHEMA, READ_SCHEMA, PARQUET_FORMAT, CATEGORICAL, coerce, from_arrow, validate
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+
+# Low-cardinality string columns are dictionary-encoded; numerics stay plain so
+# per-row-group min/max statistics remain usable for predicate pushdown
+WRITE_OPTS = dict(compression='zstd', use_dictionary=CATEGORICAL, write_statistics=True,
+                  row_group_size=64 * 1024, data_page_size=1 << 20)
+
+
+def write_table(df: pd.DataFrame, path: str, **opts) -> int:
+    """Write a coerced frame to `path` atomically with the shared Parquet options."""
+    tmp = path + '.tmp'
+    pq.write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False), tmp, **{**WRITE_OPTS, **opts})
+    os.replace(tmp, path)  # readers never see half-written files
+    return os.path.getsize(path)
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+class HistoryStore:
+    """Append-only, date-partitioned Parquet history (root/date=YYYY-MM-DD/*.parquet)."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        arch = cfg['archive']
+        return cls(arch.get('history_dir') or os.path.join(arch['out_dir'], 'history'))
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.root) and any(d.startswith('date=') for d in os.listdir(self.root))
+
+    def dates(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d.split('=', 1)[1] for d in os.listdir(self.root) if d.startswith('date='))
+
+    def append(self, df: pd.DataFrame, tag: str = None) -> int:
+        if df.empty:
+            return 0
+        validate(df, typed=False)
+        out = coerce(df)
+        tag = tag or uuid.uuid4().hex[:8]
+        days = out['timestamp_utc'].dt.strftime('%Y-%m-%d')
+        for day, part in out.groupby(days, sort=True):
+            d = os.path.join(self.root, f"date={day}")
+            os.makedirs(d, exist_ok=True)
+            write_table(part, os.path.join(d, f"part-{tag}.parquet"))
+        return len(out)
+
+    def replace_day(self, day: str, df: pd.DataFrame) -> int:
+        """Rewrite one date partition as a single file (backfill / compaction).
+
+        An empty frame (failed or empty re-read) leaves the partition untouched;
+        rows stamped on any other date are rejected rather than written elsewhere.
+        """
+        if df.empty:
+            return 0
+        validate(df, typed=False)
+        out = coerce(df)
+        other = sorted(set(out['timestamp_utc'].dt.strftime('%Y-%m-%d')) - {day})
+        if other:
+            raise ValueError(f"replace_day({day!r}) got rows from other dates: {', '.join(other)}")
+        d = os.path.join(self.root, f"date={day}")
+        old = self.files(day)
+        os.makedirs(d, exist_ok=True)
+        new = f"part-rewrite-{uuid.uuid4().hex[:8]}.parquet"
+        write_table(out, os.path.join(d, new))
+        for f in old:
+            os.remove(os.path.join(d, f))
+        return len(out)
+
+    def files(self, day: str) -> list:
+        d = os.path.join(self.root, f"date={day}")
+        return sorted(f for f in os.listdir(d) if f.endswith('.parquet')) if os.path.isdir(d) else []
+
+    def read_day(self, day: str, columns: list = None) -> pd.DataFrame:
+        """One partition only; no dataset discovery over the other dates."""
+        d = os.path.join(self.root, f"date={day}")
+        files = [os.path.join(d, f) for f in self.files(day)]
+        if not files:
+            return coerce(pd.DataFrame(), columns=columns)
+        df = from_arrow(ds.dataset(files, format=PARQUET_FORMAT, schema=READ_SCHEMA).to_table(columns=columns))
+        return df.sort_values('timestamp_utc', kind='stable', ignore_index=True) if 'timestamp_utc' in df.columns else df
+
+    def compact_day(self, day: str) -> int:
+        """Merge the per-run part files of one date into a single file; no-op if already single."""
+        if len(self.files(day)) <= 1:
+            return 0
+        return self.replace_day(day, self.read_day(day))
+
+    def dataset(self):
+        return ds.dataset(self.root, format=PARQUET_FORMAT, schema=READ_SCHEMA.append(pa.field('date', pa.string())),
+                          partitioning=PARTITIONING, exclude_invalid_files=True)
+
+    def read(self, start: datetime = None, end: datetime = None, columns: list = None,
+             instruments: list = None) -> pd.DataFrame:
+        if not self.exists():
+            return coerce(pd.DataFrame(), columns=columns)
+        # Partition pruning on `date`, then row-group statistics on timestamp_utc
+        conds = []
+        if start is not None:
+            start = _utc(start)
+            conds += [ds.field('date') >= start.strftime('%Y-%m-%d'), ds.field('timestamp_utc') >= start]
+        if end is not None:
+            end = _utc(end)
+            conds += [ds.field('date') <= end.strftime('%Y-%m-%d'), ds.field('timestamp_utc') < end]
+        if instruments:
+            conds.append(ds.field('instrument').isin(list(instruments)))
+        flt = None
+        for c in conds:
+            flt = c if flt is None else flt & c
+        cols = columns or SCHEMA.names
+        df = from_arrow(self.dataset().to_table(columns=cols, filter=flt))
+        if 'timestamp_utc' in df.columns:
+            df = df.sort_values('timestamp_utc', kind='stable', ignore_index=True)
+        return df
+
+    def read_lookback(self, days: float, now: datetime = None, **kw) -> pd.DataFrame:
+        now = now or datetime.now(timezone.utc)
+        return self.read(start=now - timedelta(days=days), **kw)
+
+
+def backfill_from_sheet(gc, sheet_cfg: dict, store: HistoryStore) -> int:
+    """One-time import of the existing Google Sheet history (every rotated tab) into the store."""
+    df = gc.read_sheet_window(sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'])
+    if df.empty:
+        return 0
+    return store.append(df, tag='backfill')
+
+
+def bench_reads(store: HistoryStore, windows=(30, 90, 365), repeat: int = 3) -> dict:
+    """Best-of-N wall time and row count for trailing windows ending at the newest partition."""
+    dates = store.dates()
+    if not dates:
+        return {}
+    end = pd.Timestamp(dates[-1], tz='UTC') + pd.Timedelta(days=1)
+    res = {}
+    for w in windows:
+        best, n = float('inf'), 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            n = len(store.read(start=end - pd.Timedelta(days=w), end=end))
+            best = min(best, time.perf_counter() - t0)
+        res[w] = {'seconds': best, 'rows': n}
+    return res
+
+
+def main():
+    from dotenv import load_dotenv
+    from .utils_logging import setup_logger
+    from .utils_google import GoogleClients
+    from .scheduler import load_config
+
+    ap = argparse.ArgumentParser(description="Local Parquet history store")
+    ap.add_argument('--backfill', action='store_true', help="import the Google Sheet history once")
+    ap.add_argument('--bench', action='store_true', help="time 30/90/365-day window reads")
+    args = ap.parse_args()
+
+    log = setup_logger()
+    load_dotenv()
+    cfg = load_config()
+    store = HistoryStore.from_config(cfg)
+    if args.backfill:
+        gc = GoogleClients(os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON'))
+        n = backfill_from_sheet(gc, cfg['sheet'], store)
+        log.info(f"Backfilled {n} rows into {store.root}")
+    if args.bench:
+        for w, r in bench_reads(store).items():
+            log.info(f"read {w:>3}d window: {r['rows']} rows in {r['seconds']*1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
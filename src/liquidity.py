@@ -0,0 +1,261 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/liquidity.py
+# ───────────────────────────────────────────────────────────────────────────────
+import time, asyncio, argparse, threading
+import aiohttp
+import numpy as np
+import pandas as pd
+from .connectors import make_connector
+from .basis_engine import PAIR_EXCHANGE
+from .utils_logging import setup_logger
+
+# Book levels are (price, USD notional) on every venue, so one walk covers all of them.
+# liq_depth_bp is the two-leg executable basis: the edge left (in bp) after selling
+# `notional_usd` of the rich leg into its bids and buying the cheap leg from its asks;
+# liq_depth_usd is the thinner side's size within `band_bp` of mid and liq_slippage_bp
+# the two walks' cost against mid. All three are persisted with the metrics row.
+# A fetched book too thin to fill the notional gives liq_depth_bp = -inf (measured,
+# fails any floor); NaN means the book was not measured (not a candidate, or the fetch failed).
+LIQ_COLUMNS = ['liq_depth_bp', 'liq_depth_usd', 'liq_slippage_bp']
+
+
+# ── vectorized book math ───────────────────────────────────────────────────────
+def pad_books(books: list, depth: int) -> tuple:
+    """[n_i, 2] level arrays -> (price, usd) arrays [n_books, depth]; missing levels are NaN / 0."""
+    px = np.full((len(books), depth), np.nan)
+    usd = np.zeros((len(books), depth))
+    for k, b in enumerate(books):
+        n = min(len(b), depth)
+        px[k, :n], usd[k, :n] = b[:n, 0], b[:n, 1]
+    return px, usd
+
+
+def walk(px: np.ndarray, usd: np.ndarray, notional: float) -> np.ndarray:
+    """Average fill price for `notional` USD per book; NaN where the fetched depth can't fill it.
+
+    Levels are USD-sized, so the fill is USD paid over coins received (harmonic mean of prices).
+    """
+    before = np.cumsum(usd, axis=1) - usd
+    take = np.clip(notional - before, 0.0, usd)
+    filled = take.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        coins = np.where(take > 0, take / px, 0.0).sum(axis=1)
+        return np.where(filled >= notional * (1 - 1e-9), filled / coins, np.nan)
+
+
+def depth_within(px: np.ndarray, usd: np.ndarray, mid: np.ndarray, band_bp: float) -> np.ndarray:
+    """USD resting within `band_bp` of mid per book."""
+    with np.errstate(invalid='ignore'):
+        near = np.abs(px / mid[:, None] - 1.0) * 1e4 <= band_bp
+    return np.where(near, usd, 0.0).sum(axis=1)
+
+
+def book_metrics(bids: list, asks: list, notional: float, band_bp: float, depth: int) -> pd.DataFrame:
+    """Mid, fill prices, slippage and in-band depth for many books at once."""
+    bp, bu = pad_books(bids, depth)
+    ap, au = pad_books(asks, depth)
+    mid = (bp[:, 0] + ap[:, 0]) / 2
+    sell, buy = walk(bp, bu, notional), walk(ap, au, notional)
+    return pd.DataFrame({
+        'mid': mid,
+        'sell_px': sell,
+        'buy_px': buy,
+        'slip_sell_bp': (1.0 - sell / mid) * 1e4,
+        'slip_buy_bp': (buy / mid - 1.0) * 1e4,
+        'bid_usd': depth_within(bp, bu, mid, band_bp),
+        'ask_usd': depth_within(ap, au, mid, band_bp),
+    })
+
+
+def executable_basis_bp(far: pd.DataFrame, near: pd.DataFrame, rich: np.ndarray) -> np.ndarray:
+    """Rich (far above near): sell far, buy near; cheap: buy far, sell near. Edge after both walks, in bp."""
+    f_sell, f_buy = far['sell_px'].to_numpy(), far['buy_px'].to_numpy()
+    n_sell, n_buy = near['sell_px'].to_numpy(), near['buy_px'].to_numpy()
+    return np.where(rich, f_sell / n_buy - 1.0, n_sell / f_buy - 1.0) * 1e4
+
+
+# ── engine ─────────────────────────────────────────────────────────────────────
+class LiquidityEngine:
+    """Order-book liquidity for signal candidates, both legs' books fetched concurrently.
+
+    One pooled aiohttp session (at most `max_concurrency` connections) on a private
+    event-loop thread, like `BasisEngine`; every book is requested `depth` levels
+    deep. `assess()` only fetches books for the rows it is given, so the scheduler
+    spends API calls on z-screen candidates alone.
+    """
+
+    def __init__(self, venues=('deribit',), notional_usd: float = 50_000, band_bp: float = 10, depth: int = 20,
+                 max_concurrency: int = 16, timeout_s: float = 5, apis: dict = None, log=None):
+        apis = apis or {}
+        self.connectors = {v: make_connector(v, api=apis.get(v), timeout_s=timeout_s) for v in venues}
+        self.notional_usd = notional_usd
+        self.band_bp = band_bp
+        self.depth = depth
+        self.max_concurrency = max_concurrency
+        self.timeout_s = timeout_s
+        self.log = log or setup_logger()
+        self.last = {}
+        self._http = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="liquidity", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, cfg: dict, log=None):
+        liq = cfg.get('liquidity', {})
+        v = cfg.get('venues', {})
+        venues = list(dict.fromkeys(['deribit', *(v.get('enabled') or [])]))
+        return cls(venues, notional_usd=liq.get('notional_usd', 50_000), band_bp=liq.get('band_bp', 10),
+                   depth=liq.get('depth', 20), max_concurrency=liq.get('max_concurrency', 16),
+                   timeout_s=liq.get('timeout_s', 5), apis=v.get('api_urls'), log=log)
+
+    def close(self):
+        async def _close():
+            if self._http is not None:
+                await self._http.close()
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(_close(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+        self._loop.close()
+
+    async def _books(self, legs: list):
+        if self._http is None:
+            self._http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_concurrency))
+
+        async def one(venue, base, quote, instrument):
+            try:
+                return await self.connectors[venue].fetch_book(self._http, base, quote, instrument, self.depth), None
+            except Exception as e:
+                return None, e
+        return await asyncio.gather(*(one(*leg) for leg in legs))
+
+    def books(self, legs: list) -> tuple:
+        """{(venue, base, quote, instrument): (bids, asks, ts)} and {leg: error}, all fetched concurrently."""
+        fut = asyncio.run_coroutine_threadsafe(self._books(legs), self._loop)
+        res = fut.result(self.timeout_s + 5)
+        return ({leg: b for leg, (b, _) in zip(legs, res) if b is not None},
+                {leg: e for leg, (_, e) in zip(legs, res) if e is not None})
+
+    def legs(self, df: pd.DataFrame) -> tuple:
+        """(far, near) leg tuples per row: a venue future against that venue's perp, or a pair's two legs."""
+        far, near = [], []
+        for ex, base, quote, inst in zip(df['exchange'].astype(str), df['base'].astype(str),
+                                         df['quote'].astype(str), df['instrument'].astype(str)):
+            if ex == PAIR_EXCHANGE:
+                (fv, fi), (nv, ni) = (leg.split(':', 1) for leg in inst.split('/', 1))
+            elif ex in self.connectors:
+                fv, fi, nv, ni = ex, inst, ex, self.connectors[ex].perp_instrument(base, quote)
+            else:
+                fv = fi = nv = ni = None
+            far.append((fv, base, quote, fi))
+            near.append((nv, base, quote, ni))
+        return far, near
+
+    def assess(self, df: pd.DataFrame) -> pd.DataFrame:
+        """liq_depth_bp (executable basis; -inf if a book can't fill), liq_depth_usd (in-band, thinner side)
+        and liq_slippage_bp per row."""
+        out = pd.DataFrame(np.nan, index=df.index, columns=LIQ_COLUMNS)
+        if df.empty:
+            self.last = {'rows': 0, 'books': 0, 'errors': {}, 'ms': 0.0}
+            return out
+        t0 = time.perf_counter()
+        far, near = self.legs(df)
+        wanted = [leg for leg in dict.fromkeys(far + near) if leg[0] in self.connectors]
+        books, errors = self.books(wanted)
+        for leg, e in errors.items():
+            self.log.warning(f"Order book {leg[0]}:{leg[3]} failed: {e}")
+        self.last = {'rows': len(df), 'books': len(wanted), 'errors': {f"{k[0]}:{k[3]}": str(e) for k, e in errors.items()}}
+        if not books:
+            self.last['ms'] = (time.perf_counter() - t0) * 1000
+            return out
+        keys = list(books)
+        m = book_metrics([books[k][0] for k in keys], [books[k][1] for k in keys],
+                         self.notional_usd, self.band_bp, self.depth)
+        m.index = pd.MultiIndex.from_tuples(keys)
+        f, n = m.reindex(pd.MultiIndex.from_tuples(far)), m.reindex(pd.MultiIndex.from_tuples(near))
+        # Same side convention as the signal's side_hint: spread > 0 means the future/far leg is rich
+        rich = pd.to_numeric(df['spread'], errors='coerce').to_numpy(dtype=float) > 0
+        bp = executable_basis_bp(f, n, rich)
+        fetched = np.isfinite(f['mid'].to_numpy()) & np.isfinite(n['mid'].to_numpy())
+        out['liq_depth_bp'] = np.where(fetched & np.isnan(bp), -np.inf, bp)
+        out['liq_depth_usd'] = np.minimum(np.where(rich, f['bid_usd'], f['ask_usd']),
+                                      np.where(rich, n['ask_usd'], n['bid_usd']))
+        out['liq_slippage_bp'] = np.where(rich, f['slip_sell_bp'].to_numpy() + n['slip_buy_bp'].to_numpy(),
+                                      f['slip_buy_bp'].to_numpy() + n['slip_sell_bp'].to_numpy())
+        self.last['ms'] = (time.perf_counter() - t0) * 1000
+        return out
+
+
+# ── bench ──────────────────────────────────────────────────────────────────────
+def _synthetic_books(n_books: int, depth: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    mid = 100_000 * (1 + rng.normal(0, 0.01, n_books))
+    steps = np.cumsum(rng.uniform(0.2, 2.0, (n_books, depth)), axis=1) * 1e-4
+    size = rng.lognormal(10, 1, (n_books, depth))
+    bids = [np.column_stack([m * (1 - s), q]) for m, s, q in zip(mid, steps, size)]
+    asks = [np.column_stack([m * (1 + s), q]) for m, s, q in zip(mid, steps, size)]
+    return bids, asks
+
+
+def _walk_loop(book: np.ndarray, notional: float) -> float:
+    left, coins = notional, 0.0
+    for px, usd in book:
+        take = min(left, usd)
+        coins += take / px
+        left -= take
+        if left <= 0:
+            return notional / coins
+    return float('nan')
+
+
+def bench(n_books=(10, 100, 1000), depth: int = 50, notional: float = 250_000, repeat: int = 5, log=None) -> dict:
+    """Vectorized walk over all books vs a per-level Python loop per book."""
+    res = {}
+    for n in n_books:
+        bids, asks = _synthetic_books(n, depth)
+        best_v = best_l = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            v = book_metrics(bids, asks, notional, 10, depth)['sell_px'].to_numpy()
+            t1 = time.perf_counter()
+            loop = np.array([_walk_loop(b, notional) for b in bids])
+            t2 = time.perf_counter()
+            best_v, best_l = min(best_v, t1 - t0), min(best_l, t2 - t1)
+        assert np.allclose(v, loop, equal_nan=True)
+        res[n] = {'vectorized_s': best_v, 'loop_s': best_l}
+        if log:
+            log.info(f"{n:>5} books x {depth} levels: vectorized {best_v*1000:.2f} ms, loop {best_l*1000:.2f} ms")
+    return res
+
+
+def main():
+    from .scheduler import load_config
+    ap = argparse.ArgumentParser(description="Order-book liquidity for every listed future vs its perp")
+    ap.add_argument('--config', default='config.yaml')
+    ap.add_argument('--base', default=None)
+    ap.add_argument('--quote', default=None)
+    ap.add_argument('--bench', action='store_true', help="time the vectorized book walk")
+    args = ap.parse_args()
+    log = setup_logger()
+    if args.bench:
+        bench(log=log)
+        return
+    cfg = load_config(args.config)
+    base, quote = args.base or cfg['app']['base_asset'], args.quote or cfg['app'].get('quote_asset', 'USD')
+    from .basis_engine import BasisEngine
+    basis = BasisEngine.from_config(cfg, log=log)
+    liq = LiquidityEngine.from_config(cfg, log=log)
+    try:
+        snap = basis.snapshot(base, quote)
+        snap['spread'] = snap['fut_price'] - snap['spot_price']
+        res = pd.concat([snap[['exchange', 'instrument', 'spread']], liq.assess(snap)], axis=1)
+        with pd.option_context('display.width', 200, 'display.max_rows', 500):
+            print(res.round(2).to_string(index=False))
+        log.info(f"{liq.last['books']} books in {liq.last['ms']:.0f} ms")
+    finally:
+        basis.close()
+        liq.close()
+
+if __name__ == "__main__":
+    main()
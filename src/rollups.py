@@ -0,0 +1,262 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/rollups.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, time, argparse
+import numpy as np
+import pandas as pd
+from .history_store import _utc
+
+# Materialized per-instrument rollups for the dashboard:
+#   <root>/hourly/<YYYY-MM-DD>.parquet   bucket x instrument, <metric>_{min,mean,max,last,n}
+#   <root>/daily.parquet                 same columns, one row per day x instrument
+#   <root>/zcross/<YYYY-MM-DD>.parquet   dense hour x instrument matrix of mean z_cross
+# Each scheduler run folds its snapshot into the current hour/day cells, so only
+# today's files are rewritten; readers never touch raw history.
+
+METRICS = ['apy_annual', 'spread', 'z_hist', 'z_cross', 'z_term', 'apy_net']
+KEYS = ['exchange', 'base', 'instrument']
+STATS = ('min', 'mean', 'max', 'last', 'n')
+_BUCKET_NS = {'h': 3600 * 10**9, 'D': 86400 * 10**9}
+
+
+class RollupTable:
+    """min/sum/max/last/n per (bucket, exchange, base, instrument) x metric, held as arrays.
+
+    Cells are located through a dict and reduced with ufunc.at, so folding in a
+    snapshot costs O(rows in the snapshot), independent of the table size.
+    """
+
+    def __init__(self):
+        self.pos = {}
+        self.keys = []
+        M = len(METRICS)
+        self.mn, self.mx, self.last = (np.empty((0, M)) for _ in range(3))
+        self.sum, self.n = np.zeros((0, M)), np.zeros((0, M))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _locate(self, keys: list) -> np.ndarray:
+        idx = np.fromiter((self.pos.setdefault(k, len(self.pos)) for k in keys), dtype=np.int64, count=len(keys))
+        grow = len(self.pos) - len(self.mn)
+        if grow > 0:
+            self.keys.extend(k for k, i in self.pos.items() if i >= len(self.keys))
+            nan, zero = np.full((grow, len(METRICS)), np.nan), np.zeros((grow, len(METRICS)))
+            self.mn, self.mx, self.last = (np.vstack([a, nan]) for a in (self.mn, self.mx, self.last))
+            self.sum, self.n = np.vstack([self.sum, zero]), np.vstack([self.n, zero])
+        return idx
+
+    def add(self, keys: list, v: np.ndarray):
+        """Fold raw observations `v` (rows x METRICS, time-ordered) into the cells named by `keys`."""
+        if not len(keys):
+            return
+        idx = self._locate(keys)
+        ok = ~np.isnan(v)
+        np.fmin.at(self.mn, idx, v)
+        np.fmax.at(self.mx, idx, v)
+        np.add.at(self.sum, idx, np.where(ok, v, 0.0))
+        np.add.at(self.n, idx, ok)
+        for j in range(v.shape[1]):
+            # newest non-NaN observation per cell
+            r = np.nonzero(ok[:, j])[0][::-1]
+            cells, first = np.unique(idx[r], return_index=True)
+            self.last[cells, j] = v[r[first], j]
+
+    def drop(self, bucket: pd.Timestamp):
+        keep = [i for i, k in enumerate(self.keys) if k[0] != bucket]
+        self.keys = [self.keys[i] for i in keep]
+        self.pos = {k: i for i, k in enumerate(self.keys)}
+        self.mn, self.mx, self.last, self.sum, self.n = (a[keep] for a in (self.mn, self.mx, self.last, self.sum, self.n))
+
+    def frame(self) -> pd.DataFrame:
+        k = list(zip(*self.keys)) if self.keys else [[]] * (1 + len(KEYS))
+        data = {'bucket': pd.DatetimeIndex(k[0], tz='UTC') if self.keys else pd.DatetimeIndex([], tz='UTC')}
+        data.update({c: list(k[i + 1]) for i, c in enumerate(KEYS)})
+        with np.errstate(invalid='ignore'):
+            mean = self.sum / np.where(self.n > 0, self.n, np.nan)
+        stats = {'min': self.mn, 'mean': mean, 'max': self.mx, 'last': self.last, 'n': self.n.astype(np.int64)}
+        data.update({f"{m}_{s}": stats[s][:, j] for j, m in enumerate(METRICS) for s in STATS})
+        return pd.DataFrame(data).sort_values(['bucket'] + KEYS, kind='stable', ignore_index=True)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        t = cls()
+        if df.empty:
+            return t
+        t.keys = list(zip(pd.to_datetime(df['bucket'], utc=True).dt.tz_localize(None),
+                          *(df[c].astype(str) for c in KEYS)))
+        t.pos = {k: i for i, k in enumerate(t.keys)}
+        col = lambda s: df.reindex(columns=[f"{m}_{s}" for m in METRICS]).to_numpy(dtype=float, copy=True)
+        t.mn, t.mx, t.last = col('min'), col('max'), col('last')
+        t.n = np.nan_to_num(col('n'))
+        t.sum = np.nan_to_num(col('mean') * t.n)
+        return t
+
+
+def _observations(df: pd.DataFrame):
+    """Time-ordered (epoch ns, key columns, values rows x METRICS) from raw rows."""
+    t = pd.to_datetime(df['timestamp_utc'], errors='coerce', utc=True)
+    ns = ((t - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(1, 'ns')).to_numpy(dtype=float)
+    ok = ~np.isnan(ns)
+    order = np.argsort(ns[ok], kind='stable')
+    ns = ns[ok][order].astype(np.int64)
+    cols = [df[c].astype(str).to_numpy()[ok][order] if c in df.columns else np.full(len(ns), '') for c in KEYS]
+    v = np.column_stack([pd.to_numeric(df[m], errors='coerce').to_numpy(dtype=float)[ok][order]
+                         if m in df.columns else np.full(len(ns), np.nan) for m in METRICS])
+    return ns, cols, v
+
+
+def _bucket_keys(ns: np.ndarray, cols: list, freq: str) -> list:
+    b = ns - ns % _BUCKET_NS[freq]
+    return list(zip(pd.DatetimeIndex(b), *cols))
+
+
+def zcross_matrix(hourly: pd.DataFrame) -> pd.DataFrame:
+    """Dense hour x instrument matrix of mean z_cross (missing cells NaN)."""
+    if hourly.empty or 'z_cross_mean' not in hourly.columns:
+        return pd.DataFrame()
+    day = hourly['bucket'].min().floor('D')
+    row = ((hourly['bucket'] - day) // pd.Timedelta(hours=1)).to_numpy(dtype=np.int64)
+    names, col = np.unique(hourly['instrument'].astype(str).to_numpy(), return_inverse=True)
+    z = hourly['z_cross_mean'].to_numpy(dtype=float)
+    ok = ~np.isnan(z)
+    tot, cnt = np.zeros((24, len(names))), np.zeros((24, len(names)))
+    np.add.at(tot, (row[ok], col[ok]), z[ok])  # several exchanges/bases may share a name
+    np.add.at(cnt, (row[ok], col[ok]), 1)
+    with np.errstate(invalid='ignore'):
+        m = tot / np.where(cnt > 0, cnt, np.nan)
+    return pd.DataFrame(m, index=pd.date_range(day, periods=24, freq='h', name='bucket'),
+                        columns=pd.Index(names, name='instrument'))
+
+
+def _write(df: pd.DataFrame, path: str, index: bool = False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    df.to_parquet(tmp, index=index, compression='zstd')
+    os.replace(tmp, path)  # dashboard readers never see half-written files
+
+
+class Rollups:
+    """Hourly/daily rollup tables kept warm in the scheduler and updated per snapshot."""
+
+    def __init__(self, root: str, keep_days: int = 2):
+        self.root = root
+        self.keep_days = keep_days
+        self._hourly = {}  # day -> RollupTable for recently touched days
+        self._daily = None
+        self._dirty = set()
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        arch = cfg['archive']
+        return cls(arch.get('rollup_dir') or os.path.join(arch['out_dir'], 'rollups'))
+
+    def _path(self, kind: str, day: str = None) -> str:
+        return os.path.join(self.root, 'daily.parquet') if kind == 'daily' else \
+            os.path.join(self.root, kind, f"{day}.parquet")
+
+    def _table(self, day: str = None) -> RollupTable:
+        if day is None:
+            if self._daily is None:
+                p = self._path('daily')
+                self._daily = RollupTable.from_frame(pd.read_parquet(p) if os.path.exists(p) else pd.DataFrame())
+            return self._daily
+        if day not in self._hourly:
+            p = self._path('hourly', day)
+            self._hourly[day] = RollupTable.from_frame(pd.read_parquet(p) if os.path.exists(p) else pd.DataFrame())
+        return self._hourly[day]
+
+    def update(self, df: pd.DataFrame, replace: bool = False) -> int:
+        """Fold raw rows into their hourly and daily cells (`replace` rebuilds those days first)."""
+        if df.empty:
+            return 0
+        ns, cols, v = _observations(df)
+        day_ns = ns - ns % _BUCKET_NS['D']
+        for d in np.unique(day_ns):
+            day = pd.Timestamp(int(d)).strftime('%Y-%m-%d')
+            m = day_ns == d
+            sub = [c[m] for c in cols]
+            if replace:
+                self._hourly[day] = RollupTable()
+                self._table().drop(pd.Timestamp(int(d)))
+            self._table(day).add(_bucket_keys(ns[m], sub, 'h'), v[m])
+            self._table().add(_bucket_keys(ns[m], sub, 'D'), v[m])
+            self._dirty.add(day)
+        return len(ns)
+
+    def flush(self):
+        if not self._dirty:
+            return
+        for day in sorted(self._dirty):
+            hourly = self._hourly[day].frame()
+            _write(hourly, self._path('hourly', day))
+            _write(zcross_matrix(hourly), self._path('zcross', day), index=True)
+        _write(self._table().frame(), self._path('daily'))
+        self._dirty.clear()
+        # Only the most recent days keep receiving snapshots
+        for day in sorted(self._hourly)[:-self.keep_days]:
+            self._hourly.pop(day)
+
+    def rebuild(self, store, start: str, end: str, log=None) -> int:
+        """Recompute rollups for [start, end] from the history store, one day at a time."""
+        n = 0
+        for day in pd.date_range(start, end, freq='D').strftime('%Y-%m-%d'):
+            raw = store.read_day(day)
+            if raw.empty:
+                continue
+            n += self.update(raw, replace=True)
+            self.flush()
+            if log:
+                log.info(f"rollups {day}: {len(raw)} rows")
+        return n
+
+    # ── reads ──────────────────────────────────────────────────────────────
+    def days(self, kind: str = 'hourly') -> list:
+        d = os.path.join(self.root, kind)
+        return sorted(f[:-8] for f in os.listdir(d) if f.endswith('.parquet')) if os.path.isdir(d) else []
+
+    def read(self, start, end=None, freq: str = 'h', base: str = None) -> pd.DataFrame:
+        start = _utc(start)
+        end = pd.Timestamp.now(tz='UTC') if end is None else _utc(end)
+        if freq == 'D':
+            df = pd.read_parquet(self._path('daily')) if os.path.exists(self._path('daily')) else pd.DataFrame()
+        else:
+            lo, hi = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+            files = [self._path('hourly', d) for d in self.days('hourly') if lo <= d <= hi]
+            df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True) if files else pd.DataFrame()
+        if df.empty:
+            return df
+        df = df[(df['bucket'] >= start.floor(freq)) & (df['bucket'] <= end)]
+        if base and 'base' in df.columns:
+            df = df[df['base'] == base]
+        return df.reset_index(drop=True)
+
+    def read_zcross(self, start, end=None) -> pd.DataFrame:
+        start = _utc(start)
+        end = pd.Timestamp.now(tz='UTC') if end is None else _utc(end)
+        lo, hi = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+        files = [self._path('zcross', d) for d in self.days('zcross') if lo <= d <= hi]
+        if not files:
+            return pd.DataFrame()
+        m = pd.concat([pd.read_parquet(f) for f in files]).sort_index()
+        return m[(m.index >= start.floor('h')) & (m.index <= end)]
+
+
+def main():
+    from .utils_logging import setup_logger
+    from .scheduler import load_config
+    from .history_store import HistoryStore
+
+    ap = argparse.ArgumentParser(description="Rebuild dashboard rollups from the history store")
+    ap.add_argument('--start', required=True, help="first UTC date (YYYY-MM-DD)")
+    ap.add_argument('--end', help="last UTC date, default: start")
+    args = ap.parse_args()
+
+    log = setup_logger()
+    cfg = load_config()
+    t0 = time.perf_counter()
+    n = Rollups.from_config(cfg).rebuild(HistoryStore.from_config(cfg), args.start, args.end or args.start, log=log)
+    log.info(f"Rebuilt {n} hourly rollup rows in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
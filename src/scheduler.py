@@ -1,15 +1,30 @@
 # ───────────────────────────────────────────────────────────────────────────────
 # src/scheduler.py
 # ───────────────────────────────────────────────────────────────────────────────
-import os, uuid, yaml
+import os, time, uuid, json, yaml, fcntl, argparse, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from .utils_logging import setup_logger
+from .utils_metrics import METRICS
 from .utils_google import GoogleClients
-from .fetch_deribit import fetch_spot_perp_future_prices
+from .fetch_deribit import fetch_spot_perp_future_prices, get_session
 from .compute_metrics import compute_all_metrics
 from .write_google_sheet import append_metrics_to_sheet
-from .alerts import send_alerts
+from .sheet_queue import SheetQueue
+from .alerts import AlertDispatcher
+from .history_store import HistoryStore, backfill_from_sheet
+from .stats_state import StatsState
+from .utils_termcurve import TermCurveCache
+from .signals import SignalEngine
+from .rollups import Rollups
+from .basis_engine import BasisEngine
+from .liquidity import LIQ_COLUMNS, LiquidityEngine
+from .funding import FundingCache
+from .schema import coerce, concat
 
 
 def load_config(path: str = 'config.yaml'):
@@ -17,65 +32,473 @@ def load_config(path: str = 'config.yaml'):
         return yaml.safe_load(f)
 
 
-def main():
-    log = setup_logger()
-    load_dotenv()
-    cfg = load_config()
+def assets(cfg: dict) -> list:
+    """[(base, quote), ...] from app.assets, else the single app.base_asset/quote_asset pair."""
+    app_cfg = cfg['app']
+    quote = app_cfg.get('quote_asset', 'USD')
+    items = app_cfg.get('assets') or [{'base': app_cfg['base_asset'], 'quote': quote}]
+    return [(a['base'], a.get('quote', quote)) if isinstance(a, dict) else (str(a), quote) for a in items]
+
+
+def state_key(base: str, exchange: str) -> str:
+    # Deribit keeps the per-asset file name it had before other venues existed
+    return base if exchange == 'deribit' else f"{base}_{exchange}"
+
+
+class Pipeline:
+    """Fetch → compute → signal → alert/write, with clients and state kept warm between runs.
+
+    A one-shot cron run builds one of these and calls `run_once()`; the daemon keeps
+    it alive, so Google auth, HTTP sessions, the stats/signal state, cached term curves
+    and the lookback history frame are reused from cycle to cycle. Assets are fetched
+    and scored in parallel, then written together as one batch.
+    """
+
+    def __init__(self, cfg_path: str = 'config.yaml', log=None):
+        self.log = log or setup_logger()
+        self.cfg_path = cfg_path
+        self.cfg = load_config(cfg_path)
+        self.cfg_mtime = os.path.getmtime(cfg_path)
+        self.gc = GoogleClients(os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON'))
+        self.streams = {}
+        self.dispatcher = None
+        self.pool = None
+        self.basis = None
+        self.liquidity = None
+        self.funding = None
+        self.sheet_queue = None
+        self._hist = None
+        self._stats_saved = time.monotonic()
+        self._build()
+
+    # ── config-dependent components ────────────────────────────────────────
+    def _build(self):
+        cfg = self.cfg
+        app_cfg = cfg['app']
+        state_dir = cfg['state']['dir']
+        METRICS.configure(cfg, self.log)
+        self.store = HistoryStore.from_config(cfg)
+        self.rollups = Rollups.from_config(cfg)
+        self.assets = assets(cfg)
+        # One stats state per asset and venue, loaded on first use: z_term's
+        # deviation window must not mix currencies or venues
+        self.stats, self.stats_paths = {}, {}
+        self.curves = TermCurveCache.from_config(cfg)
+        self.engine = SignalEngine.from_config(cfg, state_path=os.path.join(state_dir, 'signal_state.json'))
+        notif_cfg = cfg['notifications']
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+        self.dispatcher = AlertDispatcher(notif_cfg, notif_cfg.get('enabled_channels', []), log=self.log)
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        if self.basis is not None:
+            self.basis.close()
+        if self.sheet_queue is not None:
+            self.sheet_queue.close(drain_s=0)  # waits out an in-flight batch; queued rows stay on disk for the new queue
+        # Sheet rows go through a durable local queue flushed in the background, unless disabled
+        self.sheet_queue = SheetQueue.from_config(cfg, self.gc, log=self.log).start() \
+            if cfg['sheet'].get('write_behind', True) else None
+        venues = cfg.get('venues', {}).get('enabled') or ['deribit']
+        # Any venue besides Deribit switches fetching to the async cross-exchange engine
+        self.basis = BasisEngine.from_config(cfg, log=self.log) if list(venues) != ['deribit'] else None
+        if self.liquidity is not None:
+            self.liquidity.close()
+        self.liquidity = LiquidityEngine.from_config(cfg, log=self.log) \
+            if cfg.get('liquidity', {}).get('enabled') else None
+        # Perpetual funding history cached under state.dir, topped up once per hourly record
+        self.funding = FundingCache.from_config(cfg, log=self.log) \
+            if cfg.get('funding', {}).get('enabled') else None
+        self.pool = ThreadPoolExecutor(max_workers=len(self.assets), thread_name_prefix='asset')
+        # Every asset shares one keep-alive pool; size it for all concurrent ticker requests
+        drb_cfg = cfg.get('deribit', {})
+        get_session(pool_size=max(16, drb_cfg.get('max_workers', 8) * len(self.assets)))
+        self._hist = None
+
+    def state(self, base: str, exchange: str) -> StatsState:
+        key = state_key(base, exchange)
+        if key not in self.stats:
+            app_cfg = self.cfg['app']
+            path = self.stats_paths[key] = os.path.join(self.cfg['state']['dir'], f'stats_state_{key}.npz')
+            legacy = os.path.join(self.cfg['state']['dir'], 'stats_state.npz')
+            if not os.path.exists(path) and key == app_cfg.get('base_asset') and os.path.exists(legacy):
+                path = legacy  # single-asset state from before app.assets
+            self.stats[key] = StatsState.load(path, app_cfg['lookback_days_for_hist_z'],
+                                              app_cfg['min_history_rows_per_expiry'],
+                                              bucket_s=self.cfg['state'].get('bucket_s', 3600))
+        return self.stats[key]
+
+    def start_stream(self):
+        drb_cfg = self.cfg.get('deribit', {})
+        if not drb_cfg.get('stream') or self.streams or self.basis is not None:
+            return
+        from .stream_deribit import DeribitStream
+        for base, quote in self.assets:
+            self.streams[base] = DeribitStream(base=base, quote=quote,
+                                               interval=drb_cfg.get('stream_interval', '100ms'),
+                                               ring_size=drb_cfg.get('stream_ring_size', 512),
+                                               instruments_ttl_s=drb_cfg.get('instruments_ttl_s', 3600)).start()
+        for st in self.streams.values():
+            st.wait_ready(10)
+
+    def stop_streams(self):
+        for st in self.streams.values():
+            st.stop()
+        self.streams = {}
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.path.getmtime(self.cfg_path)
+        except OSError:
+            return False
+        if mtime == self.cfg_mtime:
+            return False
+        try:
+            cfg = load_config(self.cfg_path)
+        except Exception as e:
+            self.log.warning(f"Config reload failed, keeping previous config: {e}")
+            return False
+        self.cfg_mtime = mtime
+        self.save_state()
+        self.cfg = cfg
+        self._build()
+        if self.streams:
+            self.stop_streams()
+            self.start_stream()
+        self.log.info(f"Reloaded {self.cfg_path}")
+        return True
+
+    def save_state(self, force: bool = True):
+        """Signal state every call; rolling stats at most every state.save_interval_s unless forced."""
+        now = time.monotonic()
+        if force or now - self._stats_saved >= self.cfg['state'].get('save_interval_s', 300):
+            for k, st in list(self.stats.items()):
+                st.save(self.stats_paths[k])
+            self._stats_saved = now
+        self.engine.save()
+
+    def close(self):
+        self.save_state()
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        if self.basis is not None:
+            self.basis.close()
+        if self.liquidity is not None:
+            self.liquidity.close()
+        if self.sheet_queue is not None:
+            self.sheet_queue.close()
+        self.stop_streams()
+
+    # ── one cycle ──────────────────────────────────────────────────────────
+    def fetch(self, base: str, quote: str) -> pd.DataFrame:
+        drb_cfg = self.cfg.get('deribit', {})
+        if self.basis is not None:
+            return self.basis.snapshot(base, quote)
+        if base in self.streams:
+            snap = self.streams[base].snapshot()
+            if not snap.empty:
+                return snap
+        return fetch_spot_perp_future_prices(base=base, quote=quote,
+                                             mode=drb_cfg.get('fetch_mode', 'bulk'),
+                                             max_workers=drb_cfg.get('max_workers', 8),
+                                             instruments_ttl_s=drb_cfg.get('instruments_ttl_s', 3600))
+
+    def history(self, now: pd.Timestamp) -> pd.DataFrame:
+        # Read the lookback window once, then keep it rolling in memory
+        days = self.cfg['app']['lookback_days_for_hist_z']
+        if self._hist is None:
+            if not self.store.exists():
+                n = backfill_from_sheet(self.gc, self.cfg['sheet'], self.store)
+                self.log.info(f"History store empty; backfilled {n} rows from sheet into {self.store.root}")
+            self._hist = self.store.read_lookback(days)
+        h = self._hist
+        if len(h):
+            h = h[h['timestamp_utc'] >= now - pd.Timedelta(days=days)]
+        self._hist = h
+        return h
+
+    def score_asset(self, base: str, quote: str, hist: pd.DataFrame):
+        """Fetch + compute for one asset (runs on the asset pool); returns (rows, timings)."""
+        app_cfg = self.cfg['app']
+        t0 = time.perf_counter()
+        with METRICS.span('fetch', asset=base):
+            cur = self.fetch(base, quote)
+        t1 = time.perf_counter()
+        METRICS.rows('read', 'quotes', len(cur))
+        if cur.empty:
+            return cur, {'fetch': t1 - t0, 'compute': 0.0, 'rows': 0}
+        if len(hist) and 'base' in hist.columns:
+            hist = hist[hist['base'] == base]
+        funding = 0.0
+        if self.funding is not None:
+            with METRICS.span('funding', asset=base):
+                funding = self.funding.estimate(base)
+        # z_cross/z_hist/z_term are computed within one asset and venue (or the pair set) only
+        parts = []
+        with METRICS.span('compute', asset=base), METRICS.profile('compute'):
+            for exchange, snap in cur.groupby('exchange', sort=False):
+                h = hist[hist['exchange'] == exchange] if len(hist) and 'exchange' in hist.columns else hist
+                parts.append(compute_all_metrics(snap, h, self.cfg['term_curve_bins'],
+                                                 lookback_days_for_hist_z=app_cfg['lookback_days_for_hist_z'],
+                                                 min_history_rows_per_expiry=app_cfg['min_history_rows_per_expiry'],
+                                                 funding_est_hourly=funding if exchange == 'deribit' else 0.0,
+                                                 stats_state=self.state(base, exchange), term_curve=self.curves))
+        df = pd.concat(parts, ignore_index=True)
+        info = {'fetch': t1 - t0, 'compute': time.perf_counter() - t1, 'rows': len(df)}
+        if self.basis is not None:
+            info['venues'] = self.basis.last.get(base, {})
+        return df, info
+
+    def run_once(self) -> dict:
+        cfg = self.cfg
+        sheet_cfg = cfg['sheet']
+        timings = {}
+        t = start = time.perf_counter()
+        before = METRICS.snapshot()
+
+        def lap(name):
+            nonlocal t
+            now = time.perf_counter()
+            timings[name] = now - t
+            METRICS.observe(name, timings[name])
+            t = now
+
+        # 1) Lookback window from the local history store (sheet is a sink only)
+        hist = self.history(pd.Timestamp.now(tz='UTC'))
+        METRICS.set('history_window_rows', len(hist))
+        lap('history')
+
+        # 2-3) Fetch and compute every asset in parallel over the shared HTTP session
+        futs = {base: self.pool.submit(self.score_asset, base, quote, hist) for base, quote in self.assets}
+        parts, by_asset = [], {}
+        for base, fut in futs.items():
+            try:
+                part, by_asset[base] = fut.result()
+            except Exception as e:
+                # One failing venue/currency must not block the others
+                self.log.exception(f"{base}: fetch/compute failed: {e}")
+                by_asset[base] = {'error': str(e)}
+                continue
+            parts.append(part)
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            raise RuntimeError("No asset returned a snapshot")
+        df = pd.concat(parts, ignore_index=True)
+        run_id = str(uuid.uuid4())[:8]
+        df['run_id'] = run_id
+        lap('assets')
+
+        # 4) Order books only for rows passing the z/apy screens, then decide signals
+        #    (vectorized thresholds with hysteresis/debounce state and the liquidity floor)
+        liq = None
+        if self.liquidity is not None:
+            _, screened, _ = self.engine.masks(df)
+            liq = self.liquidity.assess(df[screened])
+            for c in LIQ_COLUMNS:
+                df[c] = liq[c].reindex(df.index)
+            lap('liquidity')
+        df = self.engine.apply(df)
+        self.save_state(force=False)
+        lap('signals')
 
-    sa = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-    gc = GoogleClients(sa)
+        # 5) Send alerts in the background: one batched message per channel, channels in parallel
+        alerts = df[df['alert']]
+        pending = self.dispatcher.dispatch(alerts)
 
-    sheet_cfg = cfg['sheet']
-    notif_cfg = cfg['notifications']
+        # 6) Persist locally, then queue for (or write to) Google Sheet
+        self.store.append(df, tag=run_id)
+        METRICS.rows('write', 'store', len(df))
+        # Keep the rolling window in the compact dtypes (categorical labels, float32 scores)
+        self._hist = concat([hist, coerce(df, columns=list(hist.columns))])
+        lap('store')
+        self.rollups.update(df)
+        self.rollups.flush()
+        lap('rollups')
+        if self.sheet_queue is not None:
+            self.sheet_queue.put(run_id, df)
+            METRICS.rows('write', 'sheet_queue', len(df))
+        else:
+            append_metrics_to_sheet(self.gc, sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'], df,
+                                    rotate=sheet_cfg.get('rotate'))
+        lap('sheet')
+        self.log.info(f"{'Queued' if self.sheet_queue is not None else 'Appended'} {len(df)} rows for sheet. run_id={run_id} "
+                      + ' '.join(f"{b}[rows={a.get('rows', 0)} fetch={a.get('fetch', 0)*1000:.0f}ms "
+                                 f"compute={a.get('compute', 0)*1000:.0f}ms]" if 'error' not in a else f"{b}[failed]"
+                                 for b, a in by_asset.items()))
+        if len(alerts):
+            self.log.info(f"Alerts queued for {len(alerts)} instrument(s): {', '.join(alerts['instrument'])}")
+        if liq is not None and len(liq):
+            best = liq['liq_depth_bp'].nlargest(3)
+            self.log.info(f"Liquidity: {len(liq)} candidate(s), {self.liquidity.last['books']} book(s) in "
+                          f"{self.liquidity.last['ms']:.0f} ms, {int(liq['liq_depth_bp'].isna().sum())} unmeasured; best "
+                          + ', '.join(f"{df.at[i, 'instrument']} {v:.1f}bp" for i, v in best.items()))
+        METRICS.observe('run', time.perf_counter() - start)
+        METRICS.set('last_run_timestamp_seconds', time.time())
+        METRICS.inc('alerts_total', len(alerts))
+        if self.sheet_queue is not None:
+            METRICS.set('sheet_queue_pending_rows', self.sheet_queue.pending()[1])
+        if METRICS.enabled:
+            self.log.info("run metrics", extra={'fields': {
+                'event': 'run', 'run_id': run_id, 'rows': len(df), 'alerts': len(alerts),
+                'timings_ms': {k: round(v * 1000, 1) for k, v in timings.items()},
+                'counters': METRICS.delta(before)}})
+        METRICS.write_textfile()
+        return {'run_id': run_id, 'rows': len(df), 'alerts': len(alerts), 'timings': timings,
+                'assets': by_asset, 'pending': pending,
+                'liquidity': self.liquidity.last if self.liquidity is not None else None}
+
+
+# ── daemon ─────────────────────────────────────────────────────────────────────
+class _RunLock:
+    """Non-blocking flock so cron runs and daemons never overlap on the same state dir."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.f = open(path, 'a+')
+
+    def acquire(self) -> bool:
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def release(self):
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+
+
+def interval_seconds(cfg: dict) -> float:
     app_cfg = cfg['app']
+    if app_cfg.get('run_interval_seconds'):
+        return float(app_cfg['run_interval_seconds'])
+    return float(app_cfg['run_interval_minutes']) * 60
+
+
+def _archive_due(cfg: dict, last_date, now: datetime) -> bool:
+    at = str(cfg['archive'].get('run_at_utc', '00:05'))
+    hh, mm = (int(x) for x in at.split(':'))
+    return last_date != now.date() and (now.hour, now.minute) >= (hh, mm)
+
+
+def _archive_last_date(cfg: dict, now: datetime):
+    """Today if yesterday's file is already in the upload manifest, so restarts don't re-archive it."""
+    from .archive_parquet import uploaded, default_target_date
+    return now.date() if uploaded(cfg, default_target_date()) else None
+
 
-    # 1) Fetch current snapshot from Deribit
-    cur = fetch_spot_perp_future_prices(base=app_cfg['base_asset'], quote=app_cfg['quote_asset'])
-    run_id = str(uuid.uuid4())[:8]
-    cur['run_id'] = run_id
-
-    # 2) Pull history tail from Google Sheet for rolling stats
-    hist = gc.read_sheet_tail(sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'], n_rows=sheet_cfg['history_pull_rows'])
-
-    # 3) Compute metrics
-    term_bins = cfg['term_curve_bins']
-    df = compute_all_metrics(cur, hist, term_bins,
-                             lookback_days_for_hist_z=app_cfg['lookback_days_for_hist_z'],
-                             min_history_rows_per_expiry=app_cfg['min_history_rows_per_expiry'])
-
-    # 4) Decide signals (apply thresholds & basic side hint)
-    th = cfg['thresholds']
-    def decide(row):
-        cond = (
-            (abs(row.get('z_hist',0)) >= th['z_hist_enter']) or
-            (abs(row.get('z_cross',0)) >= th['z_cross_enter']) or
-            (abs(row.get('z_term',0)) >= th['z_term_enter'])
-        ) and (row.get('apy_net',0) >= th['apy_net_min'])
-        # side hint: if future rich vs spot → short future / long perp
-        side = 'Short Future (rich) / Long Perp (cheap)' if row['spread']>0 else 'Long Future (cheap) / Short Perp (rich)'
-        reason = []
-        if abs(row.get('z_hist',0)) >= th['z_hist_enter']: reason.append('z_hist')
-        if abs(row.get('z_cross',0)) >= th['z_cross_enter']: reason.append('z_cross')
-        if abs(row.get('z_term',0)) >= th['z_term_enter']: reason.append('z_term')
-        return pd.Series({
-            'signal_flag': bool(cond),
-            'signal_reason': ','.join(reason),
-            'side_hint': side,
-            'liq_depth_bp': None,  # future: compute from orderbook
-        })
-
-    sig = df.apply(decide, axis=1)
-    df = pd.concat([df, sig], axis=1)
-
-    # 5) Write to Google Sheet
-    append_metrics_to_sheet(gc, sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'], df)
-    log.info(f"Appended {len(df)} rows to sheet. run_id={run_id}")
-
-    # 6) Send alerts for rows with signal
-    enabled = notif_cfg.get('enabled_channels', [])
-    for _, row in df[df['signal_flag']==True].iterrows():
-        send_alerts(row, enabled, notif_cfg)
-        log.info(f"Alert sent for {row['instrument']}")
+def run_daemon(pipe: Pipeline, max_cycles: int = None, clock=time.monotonic, sleep=time.sleep):
+    """Drift-free loop: cycle k starts at t0 + k*interval; overrunning cycles skip missed slots.
+
+    `clock`/`sleep` default to the monotonic clock and time.sleep (injectable for tests).
+    """
+    log = pipe.log
+    lock = _RunLock(os.path.join(pipe.cfg['state']['dir'], 'scheduler.lock'))
+    if not lock.acquire():
+        log.error("Another scheduler holds the run lock; exiting.")
+        return
+    status_path = os.path.join(pipe.cfg['state']['dir'], 'daemon_status.json')
+    lat = deque(maxlen=500)
+    counters = {'cycles': 0, 'errors': 0, 'skipped_slots': 0}
+    archive = {'thread': None, 'last_date': _archive_last_date(pipe.cfg, datetime.now(timezone.utc))}
+    pipe.start_stream()
+
+    interval = interval_seconds(pipe.cfg)
+    t0 = clock()
+    k = 0
+    try:
+        while max_cycles is None or counters['cycles'] < max_cycles:
+            if pipe.reload_if_changed():
+                new_interval = interval_seconds(pipe.cfg)
+                if new_interval != interval:
+                    interval, t0, k = new_interval, clock(), 0
+
+            started = clock()
+            info = {}
+            try:
+                info = pipe.run_once()
+            except Exception as e:
+                counters['errors'] += 1
+                METRICS.inc('cycle_errors_total')
+                METRICS.write_textfile()
+                log.exception(f"Cycle failed: {e}")
+            elapsed = clock() - started
+            lat.append(elapsed)
+            counters['cycles'] += 1
+
+            # Nightly archive in the same process, off the cycle thread
+            now = datetime.now(timezone.utc)
+            if _archive_due(pipe.cfg, archive['last_date'], now) and \
+                    (archive['thread'] is None or not archive['thread'].is_alive()):
+                from .archive_parquet import archive_day, default_target_date
+                archive['last_date'] = now.date()
+                archive['thread'] = threading.Thread(
+                    target=archive_day, args=(pipe.cfg, pipe.gc, default_target_date(), log),
+                    kwargs={'compact': True}, name="nightly-archive", daemon=True)
+                archive['thread'].start()
+
+            arr = np.fromiter(lat, dtype=float)
+            status = {
+                'updated_utc': now.isoformat(),
+                'interval_s': interval,
+                'last_cycle_s': elapsed,
+                'p50_s': float(np.percentile(arr, 50)),
+                'p95_s': float(np.percentile(arr, 95)),
+                'max_s': float(arr.max()),
+                'last_timings_s': info.get('timings', {}),
+                'last_asset_timings_s': info.get('assets', {}),
+                'last_run_id': info.get('run_id'),
+                'sheet_queue': pipe.sheet_queue.stats() if pipe.sheet_queue is not None else None,
+                **counters,
+            }
+            tmp = status_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(status, f)
+            os.replace(tmp, status_path)
+            log.info(f"cycle {elapsed*1000:.0f} ms (p50 {status['p50_s']*1000:.0f} / p95 {status['p95_s']*1000:.0f} ms) "
+                     + ' '.join(f"{k_}={v*1000:.0f}ms" for k_, v in info.get('timings', {}).items()))
+
+            # Next slot on the fixed grid; skip any slots this cycle overran
+            k += 1
+            next_t = t0 + k * interval
+            now_m = clock()
+            if now_m > next_t:
+                missed = int((now_m - next_t) // interval) + 1
+                counters['skipped_slots'] += missed
+                METRICS.inc('skipped_slots_total', missed)
+                k += missed
+                next_t = t0 + k * interval
+                log.warning(f"Cycle overran its slot; skipped {missed} slot(s)")
+            sleep(max(0.0, next_t - clock()))
+    except KeyboardInterrupt:
+        log.info("Stopping scheduler daemon")
+    finally:
+        pipe.close()
+        lock.release()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Arbitrage metrics scheduler")
+    ap.add_argument('--daemon', action='store_true', help="stay resident and run on app.run_interval_*")
+    ap.add_argument('--config', default='config.yaml')
+    ap.add_argument('--cycles', type=int, default=None, help="daemon: stop after N cycles")
+    args = ap.parse_args()
+
+    log = setup_logger()
+    load_dotenv()
+    pipe = Pipeline(args.config, log=log)
+    if args.daemon:
+        run_daemon(pipe, max_cycles=args.cycles)
+        return
+    lock = _RunLock(os.path.join(pipe.cfg['state']['dir'], 'scheduler.lock'))
+    if not lock.acquire():
+        log.error("Another scheduler holds the run lock; skipping this run.")
+        return
+    try:
+        pipe.run_once()
+    finally:
+        pipe.close()
+        lock.release()
 
 if __name__ == "__main__":
     main()
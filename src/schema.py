@@ -0,0 +1,249 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/schema.py
+# ───────────────────────────────────────────────────────────────────────────────
+import time, argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# One definition of the metrics row, shared by the sheet writer, history store,
+# metrics, archive and dashboard. Kinds:
+#   ts    timestamp (datetime64[us, UTC] in memory, an int64 epoch under the hood)
+#   cat   low-cardinality label -> pandas category / Arrow dictionary
+#   int   int64 epoch milliseconds (nullable)
+#   f64   prices, where float32 would lose cents on a 6-figure spot
+#   f32   derived ratios and scores
+#   bool  nullable flag
+#   str   free text
+FIELDS = [
+    ('timestamp_utc', 'ts'),
+    ('exchange', 'cat'),
+    ('base', 'cat'),
+    ('quote', 'cat'),
+    ('instrument_type', 'cat'),
+    ('instrument', 'cat'),
+    ('expiry_ts', 'int'),
+    ('days_to_expiry', 'f32'),
+    ('spot_price', 'f64'),
+    ('perp_price', 'f64'),
+    ('fut_price', 'f64'),
+    ('spread', 'f32'),
+    ('apy_annual', 'f32'),
+    ('z_hist', 'f32'),
+    ('z_cross', 'f32'),
+    ('z_term', 'f32'),
+    ('funding_est_hourly', 'f32'),
+    ('fee_bp_est', 'f32'),
+    ('apy_net', 'f32'),
+    ('liq_depth_bp', 'f32'),
+    ('liq_depth_usd', 'f32'),
+    ('liq_slippage_bp', 'f32'),
+    ('signal_flag', 'bool'),
+    ('signal_reason', 'cat'),
+    ('side_hint', 'cat'),
+    ('run_id', 'str'),
+    ('quote_ts', 'int'),
+]
+COLUMNS = [c for c, _ in FIELDS]
+KIND = dict(FIELDS)
+CATEGORICAL = [c for c, k in FIELDS if k == 'cat']
+NUMERIC = [c for c, k in FIELDS if k in ('f32', 'f64', 'int')]
+KEY_COLUMNS = ['timestamp_utc', 'instrument']
+
+_PANDAS = {'ts': 'datetime64[us, UTC]', 'cat': 'category', 'int': 'Int64', 'f64': 'float64',
+           'f32': 'float32', 'bool': 'boolean', 'str': 'string'}
+DTYPES = {c: _PANDAS[k] for c, k in FIELDS}
+
+# On disk everything stays wide (float64, plain strings): Parquet dictionary-encodes
+# the labels anyway and older files keep unifying into one dataset
+_ARROW_DISK = {'ts': pa.timestamp('us', tz='UTC'), 'cat': pa.string(), 'int': pa.int64(), 'f64': pa.float64(),
+               'f32': pa.float64(), 'bool': pa.bool_(), 'str': pa.string()}
+_ARROW_MEM = {**_ARROW_DISK, 'cat': pa.dictionary(pa.int32(), pa.string()), 'f32': pa.float32()}
+ARROW_SCHEMA = pa.schema([(c, _ARROW_DISK[k]) for c, k in FIELDS])
+# Scans decode dictionary pages straight into dictionary arrays (no re-hashing into categories)
+READ_SCHEMA = pa.schema([(c, _ARROW_MEM[k] if k == 'cat' else _ARROW_DISK[k]) for c, k in FIELDS])
+PARQUET_FORMAT = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(
+    dictionary_columns=[c for c, k in FIELDS if k == 'cat']))
+_BOOL = {'TRUE': True, 'FALSE': False, '1': True, '0': False, '1.0': True, '0.0': False}
+
+
+class SchemaError(ValueError):
+    pass
+
+
+# ── coercion ───────────────────────────────────────────────────────────────────
+def _arrow_parse(s: pd.Series, kind: str):
+    """Strings -> values via an Arrow cast (several times faster than to_numeric); None if any cell fails."""
+    if not (s.dtype == object or isinstance(s.dtype, pd.StringDtype)):
+        return None
+    try:
+        arr = pc.cast(pa.array(s, type=pa.string(), from_pandas=True), _ARROW_MEM[kind])
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+    return pd.Series(arr.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get), index=s.index, name=s.name)
+
+
+def _timestamps(s: pd.Series) -> pd.Series:
+    if isinstance(s.dtype, pd.DatetimeTZDtype):
+        return s.dt.tz_convert('UTC').astype(DTYPES['timestamp_utc'])
+    out = _arrow_parse(s, 'ts')
+    if out is not None:
+        return out
+    # Non-ISO cells (sheet locale formats, missing offsets) go through pandas
+    out = pd.to_datetime(s, errors='coerce', utc=True, format='ISO8601')
+    bad = out.isna() & s.notna()
+    if bad.any():
+        out[bad] = pd.to_datetime(s[bad], errors='coerce', utc=True, format='mixed')
+    return out.astype(DTYPES['timestamp_utc'])
+
+
+def _bools(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s):
+        return s.astype('boolean')
+    return s.astype('string').str.strip().str.upper().map(_BOOL).astype('boolean')
+
+
+def coerce_column(s: pd.Series, kind: str) -> pd.Series:
+    if str(s.dtype) == _PANDAS[kind]:
+        return s
+    if kind == 'ts':
+        return _timestamps(s)
+    if kind == 'cat':
+        return s.astype('string').astype('category') if s.dtype == object else s.astype('category')
+    if kind in ('int', 'f32', 'f64'):
+        out = _arrow_parse(s, kind)
+        if out is not None:
+            return out
+        out = pd.to_numeric(s, errors='coerce')
+        return out.round().astype('Int64') if kind == 'int' else out.astype(_PANDAS[kind])
+    if kind == 'bool':
+        return _bools(s)
+    return s.astype('string')
+
+
+def coerce(df: pd.DataFrame, columns: list = None, drop_invalid: bool = True) -> pd.DataFrame:
+    """Bulk-convert a frame (sheet strings, fresh snapshots, Parquet reads) to the compact dtypes.
+
+    Returns `columns` (default: every schema column), adding missing ones as nulls;
+    columns outside the schema pass through as-is, and columns already in their
+    target dtype are not touched, so coercing typed history is close to free. Rows
+    without a timestamp or instrument are dropped.
+    """
+    out = df.reindex(columns=columns or COLUMNS).copy(deep=False)
+    for c in out.columns:
+        if c in KIND:
+            out[c] = coerce_column(out[c], KIND[c])
+    if drop_invalid:
+        keys = [c for c in KEY_COLUMNS if c in out.columns]
+        if keys and out[keys].isna().to_numpy().any():
+            out = out.dropna(subset=keys)
+    return out
+
+
+def from_arrow(table: pa.Table) -> pd.DataFrame:
+    """Arrow table (Parquet read) -> compact frame, casting in Arrow before pandas sees it."""
+    fields = [pa.field(f.name, _ARROW_MEM[KIND[f.name]]) if f.name in KIND else f for f in table.schema]
+    table = table.cast(pa.schema(fields))
+    return table.to_pandas(types_mapper={pa.bool_(): pd.BooleanDtype(), pa.int64(): pd.Int64Dtype(),
+                                         pa.string(): pd.StringDtype()}.get)
+
+
+def concat(frames: list) -> pd.DataFrame:
+    """pd.concat that keeps categoricals categorical (pandas falls back to object on differing categories)."""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    if len(frames) == 1:
+        return frames[0]
+    frames = [f.copy(deep=False) for f in frames]
+    for c in CATEGORICAL:
+        cats = [f[c] for f in frames if c in f.columns]
+        if not cats or not all(isinstance(s.dtype, pd.CategoricalDtype) for s in cats):
+            continue
+        union = pd.Index(cats[0].cat.categories)
+        for s in cats[1:]:
+            union = union.append(s.cat.categories.difference(union))
+        for f in frames:
+            if c in f.columns:
+                f[c] = f[c].cat.set_categories(union)
+    return pd.concat(frames, ignore_index=True)
+
+
+def validate(df: pd.DataFrame, required: list = None, typed: bool = True, raise_on_error: bool = True) -> list:
+    """Check required columns and, for typed frames, dtypes and null keys; returns or raises the problems.
+
+    `typed=False` only checks the columns, for raw input that `coerce` is about to clean.
+    """
+    problems = []
+    missing = [c for c in (required or KEY_COLUMNS) if c not in df.columns]
+    if missing:
+        problems.append(f"missing columns: {', '.join(missing)}")
+    if typed:
+        wrong = [f"{c}={df[c].dtype} (want {DTYPES[c]})" for c in df.columns
+                 if c in DTYPES and str(df[c].dtype) != DTYPES[c]]
+        if wrong:
+            problems.append(f"dtypes: {', '.join(wrong)}")
+        nulls = {c: int(n) for c in KEY_COLUMNS if c in df.columns and (n := df[c].isna().sum())}
+        if nulls:
+            problems.append(f"null keys: {nulls}")
+    if problems and raise_on_error:
+        raise SchemaError('; '.join(problems))
+    return problems
+
+
+# ── bench ──────────────────────────────────────────────────────────────────────
+def _sheet_frame(n_rows: int) -> pd.DataFrame:
+    """Synthetic history as the sheet hands it over: every cell a string."""
+    from .utils_synthetic import synthetic_history
+    h = synthetic_history(n_rows=n_rows, n_instruments=8)
+    rng = np.random.default_rng(0)
+    for c in ('z_hist', 'z_cross', 'z_term'):
+        h[c] = rng.standard_normal(len(h))
+    h['apy_net'] = h['apy_annual'] - 0.073
+    h['fee_bp_est'], h['funding_est_hourly'] = 2.0, 0.0
+    h['signal_flag'] = rng.random(len(h)) < 0.05
+    h['signal_reason'] = np.where(h['signal_flag'], 'z_hist', '')
+    h['quote_ts'] = h['expiry_ts'] - 86_400_000
+    h['timestamp_utc'] = h['timestamp_utc'].map(pd.Timestamp.isoformat)
+    h['signal_flag'] = np.where(h['signal_flag'], 'TRUE', 'FALSE')
+    h = h.reindex(columns=COLUMNS)
+    return h.astype(object).where(h.notna(), '').astype(str).astype(object).replace('', np.nan)
+
+
+def bench(sizes=(10**5, 10**6), log=None) -> dict:
+    """Memory and parse time: untyped sheet frame vs per-column to_numeric vs `coerce`."""
+    res = {}
+    for n in sizes:
+        raw = _sheet_frame(n)
+        t0 = time.perf_counter()
+        loose = raw.copy()
+        loose['timestamp_utc'] = pd.to_datetime(loose['timestamp_utc'], errors='coerce', utc=True)
+        for c in NUMERIC:
+            loose[c] = pd.to_numeric(loose[c], errors='coerce')
+        t1 = time.perf_counter()
+        typed = coerce(raw)
+        t2 = time.perf_counter()
+        mb = {k: f.memory_usage(deep=True).sum() / 1e6 for k, f in (('raw', raw), ('loose', loose), ('typed', typed))}
+        res[n] = {'mb': mb, 'loose_s': t1 - t0, 'typed_s': t2 - t1}
+        if log:
+            log.info(f"{n:>9,} rows: raw {mb['raw']:.0f} MB, to_numeric {mb['loose']:.0f} MB in {t1 - t0:.2f}s, "
+                     f"schema {mb['typed']:.0f} MB in {t2 - t1:.2f}s")
+    return res
+
+
+def main():
+    from .utils_logging import setup_logger
+    ap = argparse.ArgumentParser(description="Metrics row schema")
+    ap.add_argument('--bench', nargs='*', type=int, metavar='ROWS', help="memory/parse benchmark (default 1e5 1e6)")
+    args = ap.parse_args()
+    log = setup_logger()
+    if args.bench is not None:
+        bench(args.bench or (10**5, 10**6), log=log)
+        return
+    for c, k in FIELDS:
+        print(f"{c:<20} {DTYPES[c]:<22} {ARROW_SCHEMA.field(c).type}")
+
+if __name__ == "__main__":
+    main()
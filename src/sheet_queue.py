@@ -0,0 +1,211 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/sheet_queue.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, json, time, uuid, random, sqlite3, threading
+import pandas as pd
+from .schema import COLUMNS, validate
+from .utils_google import to_sheet_values
+from .sheet_tabs import tab_name
+from .write_google_sheet import append_metrics_to_sheet
+from .utils_logging import setup_logger
+from .utils_metrics import METRICS
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id     TEXT PRIMARY KEY,
+    queued_at  REAL NOT NULL,
+    n_rows     INTEGER NOT NULL,
+    payload    TEXT NOT NULL,      -- JSON row lists in schema.COLUMNS order
+    batch_id   TEXT,               -- set from send until confirmed: outcome unknown if still set
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    sent_at    REAL
+);
+CREATE INDEX IF NOT EXISTS runs_pending ON runs (sent_at, queued_at);
+"""
+
+
+def _json_default(o):
+    return o.item() if hasattr(o, 'item') else str(o)
+
+
+class SheetQueue:
+    """Durable write-behind queue between the pipeline and Google Sheets.
+
+    `put()` commits a run's rows to a local SQLite (WAL) file and returns, so Sheets
+    latency and outages never reach the cycle. A flusher thread coalesces every
+    pending run into one append per `flush_interval_s` (up to `max_batch_rows`) and
+    retries with exponential backoff. Runs are keyed by run_id, so a run is queued
+    at most once; a batch whose send failed part-way is checked against the sheet's
+    run_id column before it is sent again, so rows are never duplicated.
+    """
+
+    def __init__(self, path: str, gc, spreadsheet_id: str, worksheet: str, flush_interval_s: float = 10,
+                 max_batch_rows: int = 5000, max_backoff_s: float = 300, retain_days: float = 7, rotate: str = None, log=None):
+        self.path = path
+        self.gc = gc
+        self.spreadsheet_id, self.worksheet = spreadsheet_id, worksheet
+        self.rotate = rotate
+        self.flush_interval_s = flush_interval_s
+        self.max_batch_rows = max_batch_rows
+        self.max_backoff_s = max_backoff_s
+        self.retain_s = retain_days * 86400
+        self.log = log or setup_logger()
+        self.stats_ = {'batches': 0, 'rows_sent': 0, 'failures': 0, 'deduped_runs': 0, 'last_error': None}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')  # a committed put survives a crash
+        self._db.executescript(_DDL)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._backoff = 0.0
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, cfg: dict, gc, log=None):
+        sheet_cfg = cfg['sheet']
+        path = sheet_cfg.get('queue_path') or os.path.join(cfg['state']['dir'], 'sheet_queue.sqlite3')
+        return cls(path, gc, sheet_cfg['spreadsheet_id'], sheet_cfg['worksheet_name'],
+                   flush_interval_s=sheet_cfg.get('flush_interval_s', 10),
+                   max_batch_rows=sheet_cfg.get('max_batch_rows', 5000),
+                   max_backoff_s=sheet_cfg.get('max_backoff_s', 300),
+                   retain_days=sheet_cfg.get('queue_retain_days', 7), rotate=sheet_cfg.get('rotate'), log=log)
+
+    # ── producer side ──────────────────────────────────────────────────────
+    def put(self, run_id: str, df: pd.DataFrame) -> bool:
+        """Queue one run's rows; False if this run_id was already queued."""
+        if df.empty:
+            return False
+        validate(df, typed=False)
+        payload = json.dumps(to_sheet_values(df.reindex(columns=COLUMNS)), default=_json_default)
+        with self._lock:
+            cur = self._db.execute('INSERT OR IGNORE INTO runs (run_id, queued_at, n_rows, payload) VALUES (?, ?, ?, ?)',
+                                   (run_id, time.time(), len(df), payload))
+        return cur.rowcount > 0
+
+    def pending(self) -> tuple:
+        with self._lock:
+            n, rows, oldest = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(n_rows), 0), MIN(queued_at) FROM runs WHERE sent_at IS NULL').fetchone()
+        return n, rows, oldest
+
+    def stats(self) -> dict:
+        n, rows, oldest = self.pending()
+        return {**self.stats_, 'pending_runs': n, 'pending_rows': rows, 'backoff_s': self._backoff,
+                'oldest_pending_s': time.time() - oldest if oldest else 0.0}
+
+    # ── flushing ───────────────────────────────────────────────────────────
+    def _sheet_run_ids(self, rows: list) -> set:
+        # run_ids already in the tab(s) these rows would have gone to
+        i = COLUMNS.index('timestamp_utc')
+        tabs = {tab_name(self.worksheet, r[i], self.rotate) for r in rows}
+        return {v for tab in tabs for v in self.gc.column_values(self.spreadsheet_id, tab, 'run_id')}
+
+    def _mark_sent(self, run_ids: list):
+        marks = ','.join('?' * len(run_ids))
+        with self._lock:
+            self._db.execute(f'UPDATE runs SET sent_at = ?, batch_id = NULL WHERE run_id IN ({marks})',
+                             [time.time(), *run_ids])
+
+    def flush_once(self) -> int:
+        """Send one coalesced batch of pending runs; returns rows sent (0 if nothing was pending)."""
+        with self._lock:
+            todo = self._db.execute('SELECT run_id, n_rows, payload, batch_id FROM runs WHERE sent_at IS NULL '
+                                    'ORDER BY queued_at').fetchall()
+        batch, n = [], 0
+        for r in todo:
+            if batch and n + r[1] > self.max_batch_rows:
+                break
+            batch.append(r)
+            n += r[1]
+        if not batch:
+            return 0
+        unsure = [r for r in batch if r[3] is not None]
+        if unsure:
+            # A previous send of these failed after the request may have landed
+            on_sheet = self._sheet_run_ids([row for r in unsure for row in json.loads(r[2])])
+            landed = [r[0] for r in unsure if r[0] in on_sheet]
+            if landed:
+                self._mark_sent(landed)
+                self.stats_['deduped_runs'] += len(landed)
+                METRICS.inc('sheet_queue_deduped_runs_total', len(landed))
+                batch = [r for r in batch if r[0] not in landed]
+                if not batch:
+                    return 0
+        run_ids = [r[0] for r in batch]
+        marks = ','.join('?' * len(run_ids))
+        with self._lock:
+            self._db.execute(f'UPDATE runs SET batch_id = ?, attempts = attempts + 1 WHERE run_id IN ({marks})',
+                             [uuid.uuid4().hex[:8], *run_ids])
+        values = [row for r in batch for row in json.loads(r[2])]
+        append_metrics_to_sheet(self.gc, self.spreadsheet_id, self.worksheet, pd.DataFrame(values, columns=COLUMNS),
+                                rotate=self.rotate)
+        self._mark_sent(run_ids)
+        self.stats_['batches'] += 1
+        self.stats_['rows_sent'] += len(values)
+        return len(values)
+
+    def drain(self, deadline_s: float = None, stop: threading.Event = None) -> int:
+        """Flush batches until the queue is empty, a send fails, `deadline_s` passes or `stop` is set."""
+        end = None if deadline_s is None else time.monotonic() + deadline_s
+        sent = 0
+        while (end is None or time.monotonic() < end) and not (stop and stop.is_set()):
+            n = self.flush_once()
+            if not n and not self.pending()[0]:
+                break
+            sent += n
+        return sent
+
+    def prune(self):
+        with self._lock:
+            self._db.execute('DELETE FROM runs WHERE sent_at IS NOT NULL AND sent_at < ?', (time.time() - self.retain_s,))
+
+    def _loop(self):
+        failures = 0
+        while not self._stop.is_set():
+            self._wake.wait(self._backoff or self.flush_interval_s)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                if self.drain(deadline_s=self.flush_interval_s * 5, stop=self._stop):
+                    self.prune()
+                failures, self._backoff = 0, 0.0
+            except Exception as e:
+                failures += 1
+                self.stats_['failures'] += 1
+                METRICS.retry('sheets')
+                self.stats_['last_error'] = f"{type(e).__name__}: {e}"
+                self._backoff = min(self.max_backoff_s, self.flush_interval_s * 2 ** failures) * random.uniform(0.8, 1.2)
+                self.log.warning(f"Sheet flush failed ({e}); {self.pending()[1]} row(s) queued, "
+                                 f"retrying in {self._backoff:.0f}s")
+
+    # ── lifecycle ──────────────────────────────────────────────────────────
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="sheet-flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, drain_s: float = 30.0):
+        """Stop the flusher and try one last drain; anything unsent stays queued for the next start.
+
+        Waits for an in-flight batch to finish (and be marked sent) before the DB is
+        closed, so a queue reopened on the same file never re-sends it.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            t0 = time.monotonic()
+            while self._thread.is_alive():
+                self._thread.join(5)
+                if self._thread.is_alive():
+                    self.log.warning(f"Waiting for the sheet flusher's in-flight batch ({time.monotonic() - t0:.0f}s)")
+            self._thread = None
+        if drain_s:
+            try:
+                self.drain(deadline_s=drain_s)
+            except Exception as e:
+                self.log.warning(f"Sheet flush on close failed ({e}); {self.pending()[1]} row(s) stay queued")
+        self._db.close()
@@ -0,0 +1,96 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/sheet_tabs.py
+# ───────────────────────────────────────────────────────────────────────────────
+import numpy as np
+import pandas as pd
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import rowcol_to_a1
+
+# With sheet.rotate set, rows for `live_metrics` go to one tab per period
+# (live_metrics_2026_10, or live_metrics_2026_W42 for weekly) and a small
+# `live_metrics_index` tab lists every tab with the UTC range it covers
+# (end exclusive, blank = open), so readers open only the tabs their window
+# overlaps. Works on plain gspread objects: the dashboard uses it too.
+ROTATIONS = ('month', 'week')
+INDEX_HEADER = ['tab', 'start_utc', 'end_utc']
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+def period(ts, rotate: str) -> tuple:
+    ts = _utc(ts)
+    if rotate == 'month':
+        start = ts.normalize().replace(day=1)
+        return start, start + pd.DateOffset(months=1)
+    if rotate == 'week':
+        start = ts.normalize() - pd.Timedelta(days=ts.weekday())
+        return start, start + pd.Timedelta(days=7)
+    raise ValueError(f"Unknown sheet rotation: {rotate} (use one of {', '.join(ROTATIONS)})")
+
+
+def tab_name(worksheet: str, ts, rotate: str = None) -> str:
+    if not rotate:
+        return worksheet
+    start, _ = period(ts, rotate)
+    return f"{worksheet}_{start:%Y_%m}" if rotate == 'month' else f"{worksheet}_{start:%G_W%V}"
+
+
+def index_name(worksheet: str) -> str:
+    return f"{worksheet}_index"
+
+
+def last_col(n_cols: int) -> str:
+    return rowcol_to_a1(1, n_cols).rstrip('0123456789')
+
+
+def rows_frame(header: list, rows: list) -> pd.DataFrame:
+    """Ragged value rows (trailing blanks trimmed by the API) -> frame of strings, '' -> NaN."""
+    width = len(header)
+    df = pd.DataFrame([r[:width] + [''] * (width - len(r)) for r in rows], columns=header)
+    return df.replace('', np.nan)
+
+
+def read_index(sh, worksheet: str) -> pd.DataFrame:
+    """Index rows as [tab, start_utc, end_utc] (NaT for open bounds); empty if the sheet never rotated."""
+    try:
+        values = sh.worksheet(index_name(worksheet)).get_all_values()
+    except WorksheetNotFound:
+        values = []
+    idx = rows_frame(INDEX_HEADER, values[1:]) if values else pd.DataFrame(columns=INDEX_HEADER)
+    for c in ('start_utc', 'end_utc'):
+        idx[c] = pd.to_datetime(idx[c], utc=True, errors='coerce', format='ISO8601')
+    return idx.dropna(subset=['tab']).sort_values('start_utc', na_position='first', ignore_index=True)
+
+
+def register(sh, worksheet: str, tab: str, start, end, idx: pd.DataFrame) -> pd.DataFrame:
+    """Add `tab` to the index (creating the index on first rotation); returns the updated index."""
+    rows = []
+    try:
+        ws = sh.worksheet(index_name(worksheet))
+    except WorksheetNotFound:
+        ws = sh.add_worksheet(title=index_name(worksheet), rows=100, cols=len(INDEX_HEADER))
+        ws.update(values=[INDEX_HEADER], range_name='A1')
+        # Rows written before rotation stay in the original tab: open start, ends now
+        if worksheet in [w.title for w in sh.worksheets()]:
+            rows.append([worksheet, '', max(pd.Timestamp.now(tz='UTC').ceil('s'), start).isoformat()])
+    rows.append([tab, start.isoformat(), end.isoformat()])
+    ws.append_rows(rows, value_input_option='RAW', insert_data_option='INSERT_ROWS', table_range='A1')
+    new = pd.DataFrame(rows, columns=INDEX_HEADER).replace('', np.nan)
+    for c in ('start_utc', 'end_utc'):
+        new[c] = pd.to_datetime(new[c], utc=True, format='ISO8601')
+    return pd.concat([idx, new], ignore_index=True) if len(idx) else new
+
+
+def overlapping(idx: pd.DataFrame, worksheet: str, start=None, end=None) -> list:
+    """Tabs whose range overlaps [start, end), oldest first; just `worksheet` without an index."""
+    if idx.empty:
+        return [worksheet]
+    keep = pd.Series(True, index=idx.index)
+    if start is not None:
+        keep &= idx['end_utc'].isna() | (idx['end_utc'] > _utc(start))
+    if end is not None:
+        keep &= idx['start_utc'].isna() | (idx['start_utc'] < _utc(end))
+    return idx.loc[keep, 'tab'].tolist()
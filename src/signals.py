@@ -0,0 +1,180 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/signals.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, json
+import numpy as np
+import pandas as pd
+
+Z_RULES = ('z_hist', 'z_cross', 'z_term')
+SIDE_RICH = 'Short Future (rich) / Long Perp (cheap)'
+SIDE_CHEAP = 'Long Future (cheap) / Short Perp (rich)'
+
+
+def _now_s(df: pd.DataFrame) -> float:
+    if 'timestamp_utc' in df.columns and len(df):
+        t = pd.to_datetime(df['timestamp_utc'], errors='coerce', utc=True).max()
+        if pd.notna(t):
+            return t.timestamp()
+    return pd.Timestamp.now(tz='UTC').timestamp()
+
+
+class SignalEngine:
+    """Compiles `thresholds` into column-wise masks with enter/exit hysteresis and alert debounce.
+
+    A row enters when any |z| >= <rule>_enter and apy_net >= apy_net_min and, if
+    liq_depth_min_bp is set and the frame carries liq_depth_bp, its executable basis
+    after slippage is >= that floor: an unmeasured book (NaN) or one too thin to fill
+    the notional (-inf) blocks entry. An active signal is held while any |z| >=
+    <rule>_exit (defaults to enter) and apy_net stays >= apy_net_exit (defaults to
+    apy_net_min). `alert` is raised on entry (or every `realert_minutes`
+    while active), never twice within `debounce_minutes`.
+    """
+
+    def __init__(self, thresholds: dict, debounce_minutes: float = 0, realert_minutes: float = 0,
+                 state_path: str = None, state_ttl_days: float = 7):
+        self.enter = {r: float(thresholds[f'{r}_enter']) for r in Z_RULES}
+        self.exit = {r: float(thresholds.get(f'{r}_exit', self.enter[r])) for r in Z_RULES}
+        self.apy_min = float(thresholds['apy_net_min'])
+        self.apy_exit = float(thresholds.get('apy_net_exit', self.apy_min))
+        liq_min = thresholds.get('liq_depth_min_bp')
+        self.liq_min = None if liq_min is None else float(liq_min)
+        self.debounce_s = float(debounce_minutes or 0) * 60
+        self.realert_s = float(realert_minutes or 0) * 60
+        self.state_path = state_path
+        self.state_ttl_s = state_ttl_days * 86400
+        self.state = self._load()
+
+    @classmethod
+    def from_config(cls, cfg: dict, state_path: str = None):
+        app = cfg['app']
+        return cls(cfg['thresholds'], app.get('debounced_minutes', 0), app.get('realert_minutes', 0), state_path)
+
+    # ── state ──────────────────────────────────────────────────────────────
+    def _load(self) -> pd.DataFrame:
+        st = pd.DataFrame(columns=['active', 'last_alert', 'last_seen']).astype(
+            {'active': bool, 'last_alert': float, 'last_seen': float})
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                raw = json.load(f)
+            if raw:
+                st = pd.DataFrame.from_dict(raw, orient='index').astype(
+                    {'active': bool, 'last_alert': float, 'last_seen': float})
+        return st
+
+    def save(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state.to_dict(orient='index'), f)
+        os.replace(tmp, self.state_path)
+
+    @staticmethod
+    def keys(df: pd.DataFrame) -> pd.Series:
+        if 'exchange' in df.columns:
+            return df['exchange'].astype(str) + ':' + df['instrument'].astype(str)
+        return df['instrument'].astype(str)
+
+    # ── rules ──────────────────────────────────────────────────────────────
+    def masks(self, df: pd.DataFrame):
+        """(enter, hold, per-rule enter masks) as numpy bool arrays; NaN never passes, liquidity included."""
+        absz = {r: np.abs(pd.to_numeric(df[r], errors='coerce').to_numpy(dtype=float))
+                if r in df.columns else np.full(len(df), np.nan) for r in Z_RULES}
+        apy = pd.to_numeric(df['apy_net'], errors='coerce').to_numpy(dtype=float) \
+            if 'apy_net' in df.columns else np.full(len(df), np.nan)
+        by_rule = {r: absz[r] >= self.enter[r] for r in Z_RULES}
+        enter = np.logical_or.reduce(list(by_rule.values())) & (apy >= self.apy_min)
+        if self.liq_min is not None and 'liq_depth_bp' in df.columns:
+            liq = pd.to_numeric(df['liq_depth_bp'], errors='coerce').to_numpy(dtype=float)
+            enter &= liq >= self.liq_min
+        hold = np.logical_or.reduce([absz[r] >= self.exit[r] for r in Z_RULES]) & (apy >= self.apy_exit)
+        return enter, hold | enter, by_rule
+
+    @staticmethod
+    def _labels(df: pd.DataFrame, by_rule: dict):
+        reason = pd.Series('', index=df.index, dtype=object)
+        for r, m in by_rule.items():
+            reason = reason + np.where(m, r + ',', '')
+        spread = pd.to_numeric(df['spread'], errors='coerce').to_numpy(dtype=float)
+        return reason.str.rstrip(','), np.where(spread > 0, SIDE_RICH, SIDE_CHEAP)
+
+    def evaluate(self, df: pd.DataFrame, now: float = None) -> pd.DataFrame:
+        """Score one snapshot against the persisted per-instrument state and update it."""
+        now = _now_s(df) if now is None else now
+        enter, hold, by_rule = self.masks(df)
+        keys = self.keys(df)
+        prev = self.state.reindex(keys.to_numpy())
+        was_active = prev['active'].fillna(False).to_numpy(dtype=bool)
+        last_alert = prev['last_alert'].to_numpy(dtype=float)
+
+        active = np.where(was_active, hold, enter)
+        since = np.where(np.isnan(last_alert), np.inf, now - last_alert)
+        due = ~was_active | ((self.realert_s > 0) & (since >= self.realert_s))
+        alert = active & due & ~(since < self.debounce_s)
+
+        reason, side = self._labels(df, by_rule)
+        out = pd.DataFrame({
+            'signal_flag': active,
+            'signal_reason': reason.to_numpy(),
+            'side_hint': side,
+            'alert': alert,
+        }, index=df.index)
+
+        upd = pd.DataFrame({
+            'active': active,
+            'last_alert': np.where(alert, now, last_alert),
+            'last_seen': now,
+        }, index=keys.to_numpy())
+        upd = upd[~upd.index.duplicated(keep='last')]
+        st = pd.concat([self.state[~self.state.index.isin(upd.index)], upd])
+        self.state = st[st['last_seen'] >= now - self.state_ttl_s]
+        return out
+
+    def apply(self, df: pd.DataFrame, now: float = None) -> pd.DataFrame:
+        out = df.drop(columns=[c for c in ('signal_flag', 'signal_reason', 'side_hint', 'alert') if c in df.columns])
+        return pd.concat([out, self.evaluate(out, now)], axis=1)
+
+    def evaluate_history(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Stateless replay over many snapshots (backfill/backtest); state starts flat."""
+        if df.empty:
+            return pd.DataFrame(columns=['signal_flag', 'signal_reason', 'side_hint', 'alert'], index=df.index)
+        enter, hold, by_rule = self.masks(df)
+        t = pd.to_datetime(df['timestamp_utc'], errors='coerce', utc=True)
+        t = ((t - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy(dtype=float)
+        codes = pd.factorize(self.keys(df))[0]
+        order = np.lexsort((t, codes))
+        c, e, h = codes[order], enter[order], hold[order]
+
+        # Hysteresis: 1 on enter, 0 when hold fails, otherwise carry the previous state
+        raw = pd.Series(np.where(e, 1.0, np.where(h, np.nan, 0.0)))
+        active = raw.groupby(c).ffill().fillna(0.0).to_numpy() > 0
+        first = np.r_[True, c[1:] != c[:-1]]
+        rising = active & (first | ~np.r_[False, active[:-1]])
+
+        # Debounce/realert only touch alert candidates, so the loop is over events not rows
+        ts = t[order]
+        cand = rising.copy()
+        if self.realert_s > 0:
+            cand |= active
+        alert = np.zeros(len(c), dtype=bool)
+        last = {}
+        for i in np.nonzero(cand)[0]:
+            k = c[i]
+            since = ts[i] - last.get(k, -np.inf)
+            if since < self.debounce_s:
+                continue
+            if not rising[i] and since < self.realert_s:
+                continue
+            alert[i] = True
+            last[k] = ts[i]
+
+        reason, side = self._labels(df, by_rule)
+        out = pd.DataFrame(index=df.index)
+        flag = np.empty(len(c), dtype=bool); flag[order] = active
+        alr = np.empty(len(c), dtype=bool); alr[order] = alert
+        out['signal_flag'] = flag
+        out['signal_reason'] = reason.to_numpy()
+        out['side_hint'] = side
+        out['alert'] = alr
+        return out
@@ -0,0 +1,172 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/stats_state.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+class WindowStats:
+    """Time-windowed mean/std (population, ddof=0) over fixed-width buckets.
+
+    Each `bucket_s` slot keeps only (start, n, mean, m2), so memory grows with the
+    lookback span, not with rows. A bucket is evicted once it lies wholly before the
+    cutoff, so the window can hold up to one extra bucket of older history.
+    """
+    __slots__ = ('bucket_s', 'buckets', 'n', 'mean', 'm2')
+
+    def __init__(self, bucket_s: int = 3600):
+        self.bucket_s = int(bucket_s)
+        self.buckets = deque()   # [start_s, n, mean, m2], oldest first
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, ts: int, x: float):
+        start = ts - ts % self.bucket_s
+        if not self.buckets or start > self.buckets[-1][0]:
+            self.buckets.append([start, 0, 0.0, 0.0])
+        b = self.buckets[-1]   # late rows fold into the newest bucket
+        b[1] += 1
+        d = x - b[2]
+        b[2] += d / b[1]
+        b[3] += d * (x - b[2])
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def evict(self, cutoff: int):
+        while self.buckets and self.buckets[0][0] + self.bucket_s <= cutoff:
+            _, nb, mb, m2b = self.buckets.popleft()
+            n = self.n - nb
+            if n <= 0:
+                self.n, self.mean, self.m2 = 0, 0.0, 0.0
+                continue
+            # Chan et al. merge, run backwards
+            mean = (self.n * self.mean - nb * mb) / n
+            self.m2 -= m2b + (mb - mean) ** 2 * nb * n / self.n
+            self.n, self.mean = n, mean
+        if self.m2 < 0:
+            self.recompute()
+
+    def recompute(self):
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        for _, nb, mb, m2b in self.buckets:
+            n = self.n + nb
+            d = mb - self.mean
+            self.mean += d * nb / n
+            self.m2 += m2b + d * d * self.n * nb / n
+            self.n = n
+
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / self.n)) if self.n else float('nan')
+
+    def z(self, x, min_rows: int = 1):
+        sd = self.std()
+        if self.n < min_rows or not sd > 0:
+            return np.full(np.shape(x), np.nan) if np.ndim(x) else float('nan')
+        return (np.asarray(x, dtype=float) - self.mean) / sd
+
+    def to_array(self) -> np.ndarray:
+        return np.array(self.buckets, dtype=np.float64).reshape(-1, 4)
+
+    @classmethod
+    def from_array(cls, a: np.ndarray, bucket_s: int = 3600):
+        w = cls(bucket_s)
+        w.buckets.extend([int(r[0]), int(r[1]), float(r[2]), float(r[3])] for r in a)
+        w.recompute()
+        return w
+
+
+def _epoch_s(ts) -> np.ndarray:
+    t = pd.to_datetime(pd.Series(ts), errors='coerce', utc=True)
+    return ((t - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy()
+
+
+class StatsState:
+    """Per-instrument apy_annual windows plus one term-deviation window, persisted as .npz.
+
+    Scores a new snapshot in O(instruments) against the previous `lookback_days`,
+    matching the batch formulas in `compute_all_metrics` (history excludes the
+    snapshot itself) up to the `bucket_s` eviction granularity.
+    """
+
+    def __init__(self, lookback_days: float = 30, min_rows: int = 60, bucket_s: int = 3600):
+        self.lookback_s = int(lookback_days * 86400)
+        self.min_rows = min_rows
+        self.bucket_s = int(bucket_s)
+        self.apy = {}
+        self.term = WindowStats(self.bucket_s)
+
+    def is_empty(self) -> bool:
+        return not self.apy and self.term.n == 0
+
+    def _evict(self, now_s: int):
+        cutoff = now_s - self.lookback_s
+        for w in self.apy.values():
+            w.evict(cutoff)
+        self.apy = {k: w for k, w in self.apy.items() if w.n}
+        self.term.evict(cutoff)
+
+    def warm(self, hist: pd.DataFrame, term_dev: pd.Series = None):
+        """Seed windows from a history frame (used once when no state file exists)."""
+        if hist.empty or 'timestamp_utc' not in hist.columns:
+            return
+        h = hist.assign(_ts=_epoch_s(hist['timestamp_utc'])).sort_values('_ts', kind='stable')
+        for inst, g in h.groupby('instrument', sort=False, observed=True):
+            w = self.apy.setdefault(inst, WindowStats(self.bucket_s))
+            for t, x in zip(g['_ts'].to_numpy(), g['apy_annual'].to_numpy(dtype=float)):
+                if np.isfinite(x):
+                    w.push(int(t), float(x))
+        if term_dev is not None:
+            for t, x in zip(h['_ts'].to_numpy(), term_dev.reindex(h.index).to_numpy(dtype=float)):
+                if np.isfinite(x):
+                    self.term.push(int(t), float(x))
+
+    def score_and_update(self, df: pd.DataFrame, term_dev: pd.Series = None):
+        """Return (z_hist, z_term) for the snapshot, then fold it into the windows."""
+        now_s = int(_epoch_s(df['timestamp_utc']).max())
+        self._evict(now_s)
+        apy = df['apy_annual'].to_numpy(dtype=float)
+        empty = WindowStats()
+        z_hist = np.array([self.apy.get(inst, empty).z(x, self.min_rows) for inst, x in zip(df['instrument'], apy)],
+                          dtype=float)
+        z_term = None
+        if term_dev is not None:
+            z_term = self.term.z(term_dev.to_numpy(dtype=float))
+        for inst, x in zip(df['instrument'], apy):
+            if np.isfinite(x):
+                self.apy.setdefault(inst, WindowStats(self.bucket_s)).push(now_s, float(x))
+        if term_dev is not None:
+            for x in term_dev.to_numpy(dtype=float):
+                if np.isfinite(x):
+                    self.term.push(now_s, x)
+        return z_hist, z_term
+
+    # ── persistence ────────────────────────────────────────────────────────
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        insts = list(self.apy)
+        arrs = [self.apy[k].to_array() for k in insts]
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, insts=np.array(insts, dtype=str),
+                            lens=np.array([len(a) for a in arrs], dtype=np.int64),
+                            buckets=np.concatenate(arrs) if arrs else np.empty((0, 4)),
+                            term=self.term.to_array(), bucket_s=np.int64(self.bucket_s))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, lookback_days: float = 30, min_rows: int = 60, bucket_s: int = 3600):
+        st = cls(lookback_days, min_rows, bucket_s)
+        if not os.path.exists(path):
+            return st
+        z = np.load(path, allow_pickle=False)
+        if 'buckets' not in z.files or int(z['bucket_s']) != st.bucket_s:
+            return st   # raw-row or differently bucketed state: re-warmed from history on first use
+        offs = np.r_[0, np.cumsum(z['lens'])]
+        for i, inst in enumerate(z['insts'].tolist()):
+            st.apy[inst] = WindowStats.from_array(z['buckets'][offs[i]:offs[i + 1]], st.bucket_s)
+        st.term = WindowStats.from_array(z['term'], st.bucket_s)
+        return st
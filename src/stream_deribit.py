@@ -0,0 +1,210 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/stream_deribit.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, json, time, asyncio, threading
+from collections import deque
+from datetime import datetime, timezone
+import aiohttp
+import pandas as pd
+from .fetch_deribit import DERIBIT_API, get_future_instruments, _is_perpetual
+from .utils_logging import setup_logger
+
+DERIBIT_WS = os.getenv('DERIBIT_WS_URL', "wss://www.deribit.com/ws/api/v2")
+
+
+class QuoteBook:
+    """Latest quote per instrument plus a bounded ring of recent ticks."""
+
+    def __init__(self, ring_size: int = 512):
+        self._lock = threading.Lock()
+        self.ring_size = ring_size
+        self.latest = {}   # instrument -> (price, quote_ts)
+        self.ticks = {}    # instrument -> deque[(quote_ts, price)]
+        self.index = None  # (price, quote_ts)
+
+    def on_ticker(self, data: dict):
+        name = data['instrument_name']
+        price = data.get('last_price') or data.get('mark_price')
+        ts = data.get('timestamp')
+        with self._lock:
+            self.latest[name] = (price, ts)
+            ring = self.ticks.get(name)
+            if ring is None:
+                ring = self.ticks[name] = deque(maxlen=self.ring_size)
+            ring.append((ts, price))
+
+    def on_index(self, data: dict):
+        with self._lock:
+            self.index = (data['price'], data.get('timestamp'))
+
+    def recent(self, name: str) -> list:
+        with self._lock:
+            return list(self.ticks.get(name, ()))
+
+    def snapshot(self, base: str, quote: str, meta: dict) -> pd.DataFrame:
+        with self._lock:
+            latest = dict(self.latest)
+            index = self.index
+        perp = latest.get(f"{base}-PERPETUAL")
+        if index is None or perp is None:
+            return pd.DataFrame()
+        now = datetime.utcnow().replace(tzinfo=timezone.utc)
+        ts = now.isoformat()
+        rows = []
+        for name, it in meta.items():
+            if _is_perpetual(it) or name not in latest:
+                continue
+            exp_ms = it['expiration_timestamp']
+            fut_price, quote_ts = latest[name]
+            rows.append({
+                'timestamp_utc': ts,
+                'exchange': 'deribit',
+                'base': base,
+                'quote': quote,
+                'instrument_type': 'future',
+                'instrument': name,
+                'expiry_ts': exp_ms,
+                'days_to_expiry': max(1, int((datetime.fromtimestamp(exp_ms/1000, tz=timezone.utc) - now).days)),
+                'spot_price': index[0],
+                'perp_price': perp[0],
+                'fut_price': fut_price,
+                'quote_ts': quote_ts,
+            })
+        return pd.DataFrame(rows)
+
+
+class DeribitStream:
+    """Long-lived JSON-RPC WebSocket ingestor for ticker and index channels.
+
+    Runs its own event loop on a daemon thread; `snapshot()` can be called from
+    any thread and returns the same frame shape as `fetch_spot_perp_future_prices`.
+    """
+
+    def __init__(self, base="BTC", quote="USD", url: str = DERIBIT_WS, api: str = DERIBIT_API,
+                 interval: str = "100ms", heartbeat_s: int = 10, ring_size: int = 512,
+                 instruments_ttl_s: float = 3600, max_backoff_s: float = 30.0):
+        self.base, self.quote = base, quote
+        self.url, self.api = url, api
+        self.interval = interval
+        self.heartbeat_s = heartbeat_s
+        self.instruments_ttl_s = instruments_ttl_s
+        self.max_backoff_s = max_backoff_s
+        self.book = QuoteBook(ring_size)
+        self.meta = {}
+        self.stats = {'messages': 0, 'reconnects': 0, 'last_message_ts': None}
+        self.log = setup_logger()
+        self._subscribed = set()
+        self._msg_id = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._task = None
+
+    # ── lifecycle ──────────────────────────────────────────────────────────
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._thread_main, name="deribit-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        # Cancel the loop's task so a pending receive or backoff sleep returns at once
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass   # loop already closed
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wait_ready(self, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.book.index is not None and f"{self.base}-PERPETUAL" in self.book.latest:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def snapshot(self) -> pd.DataFrame:
+        return self.book.snapshot(self.base, self.quote, self.meta)
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self.run())
+        if self._stop.is_set():
+            self._task.cancel()
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    # ── protocol ───────────────────────────────────────────────────────────
+    def _channels(self) -> list:
+        names = [n for n in self.meta] + [f"{self.base}-PERPETUAL"]
+        chans = [f"ticker.{n}.{self.interval}" for n in dict.fromkeys(names)]
+        chans.append(f"deribit_price_index.{self.base.lower()}_{self.quote.lower()}")
+        return chans
+
+    async def _send(self, ws, method: str, params: dict):
+        self._msg_id += 1
+        await ws.send_str(json.dumps({'jsonrpc': '2.0', 'id': self._msg_id, 'method': method, 'params': params}))
+
+    async def _refresh_subscriptions(self, ws, refresh: bool = False):
+        self.meta = await asyncio.to_thread(get_future_instruments, self.base, self.api,
+                                            self.instruments_ttl_s, refresh)
+        new = [c for c in self._channels() if c not in self._subscribed]
+        if new:
+            await self._send(ws, 'public/subscribe', {'channels': new})
+            self._subscribed.update(new)
+
+    async def _handle(self, ws, msg: dict):
+        method = msg.get('method')
+        if method == 'subscription':
+            params = msg['params']
+            chan = params['channel']
+            if chan.startswith('ticker.'):
+                self.book.on_ticker(params['data'])
+            elif chan.startswith('deribit_price_index.'):
+                self.book.on_index(params['data'])
+        elif method == 'heartbeat':
+            if msg['params'].get('type') == 'test_request':
+                await self._send(ws, 'public/test', {})
+            # Heartbeats are a cheap point to pick up newly listed expiries
+            await self._refresh_subscriptions(ws)
+
+    async def _session(self, http: aiohttp.ClientSession):
+        async with http.ws_connect(self.url, heartbeat=None, max_msg_size=0) as ws:
+            self._subscribed = set()
+            await self._send(ws, 'public/set_heartbeat', {'interval': self.heartbeat_s})
+            await self._refresh_subscriptions(ws, refresh=True)
+            while not self._stop.is_set():
+                try:
+                    raw = await ws.receive(timeout=self.heartbeat_s * 3)
+                except asyncio.TimeoutError:
+                    raise ConnectionError("no message within heartbeat window")
+                if raw.type == aiohttp.WSMsgType.TEXT:
+                    self.stats['messages'] += 1
+                    self.stats['last_message_ts'] = time.time()
+                    await self._handle(ws, json.loads(raw.data))
+                elif raw.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                    raise ConnectionError(f"websocket closed: {raw.type.name}")
+
+    async def run(self):
+        backoff = 0.5
+        async with aiohttp.ClientSession() as http:
+            while not self._stop.is_set():
+                try:
+                    await self._session(http)
+                    backoff = 0.5
+                except Exception as e:
+                    if self._stop.is_set():
+                        break
+                    self.stats['reconnects'] += 1
+                    self.log.warning(f"Deribit stream disconnected ({e}); reconnecting in {backoff:.1f}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff_s)
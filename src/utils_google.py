@@ -2,57 +2,174 @@
 # src/utils_google.py
 # ───────────────────────────────────────────────────────────────────────────────
 import os, io, json, time
+import numpy as np
 import pandas as pd
 from oauth2client.service_account import ServiceAccountCredentials
 import gspread
-from gspread_dataframe import set_with_dataframe, get_as_dataframe
+from gspread_dataframe import get_as_dataframe
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
+from .utils_metrics import METRICS
+from .sheet_tabs import period, tab_name, read_index, register, overlapping
 
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
     'https://www.googleapis.com/auth/drive'
 ]
 
+def to_sheet_values(df: pd.DataFrame) -> list:
+    """Serialize a frame to JSON-safe row lists (NaN/inf/None -> '', numpy -> python)."""
+    out = df.copy()
+    for c in out.columns:
+        if pd.api.types.is_datetime64_any_dtype(out[c]):
+            out[c] = out[c].map(lambda t: t.isoformat() if pd.notna(t) else None)
+        elif pd.api.types.is_float_dtype(out[c]):
+            out[c] = out[c].where(np.isfinite(out[c]))
+    out = out.astype(object).where(out.notna(), '')
+    return out.values.tolist()
+
+
 class GoogleClients:
     def __init__(self, sa_json_path: str):
-        creds = ServiceAccountCredentials.from_json_keyfile_name(sa_json_path, SCOPES)
-        self.gc = gspread.authorize(creds)
-        # PyDrive2 auth
-        gauth = GoogleAuth()
-        gauth.credentials = creds
-        self.drive = GoogleDrive(gauth)
+        self.creds = ServiceAccountCredentials.from_json_keyfile_name(sa_json_path, SCOPES)
+        self.gc = gspread.authorize(self.creds)
+        METRICS.instrument_session(self.gc.http_client.session, 'sheets')
+        self._drive = None
+        self._worksheets = {}
+        self._headers = {}
+        self._index = {}   # (sheet, worksheet) -> rotation index
+
+    @property
+    def drive(self):
+        # PyDrive2 auth is only needed by the archiver, so it is set up on first use
+        if self._drive is None:
+            gauth = GoogleAuth()
+            gauth.credentials = self.creds
+            self._drive = GoogleDrive(gauth)
+        return self._drive
 
     def open_sheet(self, spreadsheet_id: str, worksheet_name: str):
+        key = (spreadsheet_id, worksheet_name)
+        if key in self._worksheets:
+            return self._worksheets[key]
         sh = self.gc.open_by_key(spreadsheet_id)
         try:
             ws = sh.worksheet(worksheet_name)
         except gspread.exceptions.WorksheetNotFound:
             ws = sh.add_worksheet(title=worksheet_name, rows=1000, cols=30)
+        self._worksheets[key] = ws
         return ws
 
-    def read_sheet_tail(self, spreadsheet_id: str, worksheet_name: str, n_rows: int = 2000) -> pd.DataFrame:
+    def ensure_header(self, spreadsheet_id: str, worksheet_name: str, columns) -> list:
+        # Header row is read once per worksheet and cached; new columns are appended to it
+        key = (spreadsheet_id, worksheet_name)
+        if key in self._headers:
+            header = self._headers[key]
+            if all(c in header for c in columns):
+                return header
         ws = self.open_sheet(spreadsheet_id, worksheet_name)
-        df = get_as_dataframe(ws, evaluate_formulas=True, header=0)
-        df = df.dropna(how='all')
-        if len(df) > n_rows:
-            df = df.tail(n_rows)
-        return df
+        header = self._headers.get(key) or [h for h in ws.row_values(1) if h]
+        missing = [c for c in columns if c not in header]
+        if missing:
+            header = header + missing
+            if len(header) > ws.col_count:
+                ws.add_cols(len(header) - ws.col_count)
+            ws.update(values=[header], range_name='A1')
+        self._headers[key] = header
+        return header
 
     def read_sheet_all(self, spreadsheet_id: str, worksheet_name: str) -> pd.DataFrame:
         ws = self.open_sheet(spreadsheet_id, worksheet_name)
-        df = get_as_dataframe(ws, evaluate_formulas=True, header=0)
-        return df.dropna(how='all')
+        df = get_as_dataframe(ws, evaluate_formulas=True, header=0).dropna(how='all')
+        METRICS.rows('read', 'sheet', len(df))
+        return df
+
+    def column_values(self, spreadsheet_id: str, worksheet_name: str, column: str) -> list:
+        # One column by header name (values.get on a single column), e.g. run_ids for dedup checks
+        header = self.ensure_header(spreadsheet_id, worksheet_name, [column])
+        ws = self.open_sheet(spreadsheet_id, worksheet_name)
+        return ws.col_values(header.index(column) + 1)[1:]
 
-    def append_rows(self, spreadsheet_id: str, worksheet_name: str, df: pd.DataFrame):
+    # ── rotation ───────────────────────────────────────────────────────────
+    def sheet_index(self, spreadsheet_id: str, worksheet_name: str, refresh: bool = False):
+        key = (spreadsheet_id, worksheet_name)
+        if refresh or key not in self._index:
+            self._index[key] = read_index(self.gc.open_by_key(spreadsheet_id), worksheet_name)
+        return self._index[key]
+
+    def rotated_tab(self, spreadsheet_id: str, worksheet_name: str, ts, rotate: str = None) -> str:
+        """Tab for rows stamped `ts`, registering it in the index the first time it is used."""
+        tab = tab_name(worksheet_name, ts, rotate)
+        if rotate and tab not in set(self.sheet_index(spreadsheet_id, worksheet_name)['tab']):
+            start, end = period(ts, rotate)
+            self._index[(spreadsheet_id, worksheet_name)] = register(
+                self.gc.open_by_key(spreadsheet_id), worksheet_name, tab, start, end,
+                self.sheet_index(spreadsheet_id, worksheet_name))
+        return tab
+
+    def sheet_tabs(self, spreadsheet_id: str, worksheet_name: str, start=None, end=None) -> list:
+        return overlapping(self.sheet_index(spreadsheet_id, worksheet_name), worksheet_name, start, end)
+
+    def read_sheet_window(self, spreadsheet_id: str, worksheet_name: str, start=None, end=None) -> pd.DataFrame:
+        """Rows of every tab overlapping [start, end); rows are not filtered by timestamp."""
+        frames = [self.read_sheet_all(spreadsheet_id, tab)
+                  for tab in self.sheet_tabs(spreadsheet_id, worksheet_name, start, end)]
+        frames = [f for f in frames if len(f)]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def append_rows(self, spreadsheet_id: str, worksheet_name: str, df: pd.DataFrame, chunk_rows: int = 5000):
+        # Sends only the new rows (values.append), so cost no longer grows with sheet size
+        if df.empty:
+            return
+        header = self.ensure_header(spreadsheet_id, worksheet_name, list(df.columns))
+        values = to_sheet_values(df.reindex(columns=header))
         ws = self.open_sheet(spreadsheet_id, worksheet_name)
-        existing = get_as_dataframe(ws, evaluate_formulas=True, header=0)
-        existing = existing.dropna(how='all')
-        out = pd.concat([existing, df], ignore_index=True)
-        set_with_dataframe(ws, out)
-
-    def upload_to_drive(self, folder_id: str, local_path: str, remote_name: str):
-        file = self.drive.CreateFile({'parents': [{'id': folder_id}], 'title': remote_name})
-        file.SetContentFile(local_path)
-        file.Upload()
-        return file['id']
+        for i in range(0, len(values), chunk_rows):
+            chunk = values[i:i + chunk_rows]
+            ws.append_rows(chunk, value_input_option='USER_ENTERED',
+                           insert_data_option='INSERT_ROWS', table_range='A1')
+            METRICS.rows('write', 'sheet', len(chunk))
+
+    def drive_service(self):
+        # Raw Drive v2 resource behind PyDrive2, for chunked uploads
+        auth = self.drive.auth
+        if auth.service is None:
+            auth.Authorize()
+        return auth.service
+
+    def upload_to_drive(self, folder_id: str, local_path: str, remote_name: str,
+                        chunk_mb: int = 8, num_retries: int = 5, service=None, log=None,
+                        max_resumes: int = 3, resume_backoff_s: float = 2.0):
+        """Resumable upload in `chunk_mb` chunks.
+
+        Each chunk is retried with backoff on 5xx/network errors inside the client; if a
+        chunk still fails, the session is resumed from the server's offset up to
+        `max_resumes` times instead of restarting the file.
+        """
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaFileUpload
+        service = service or self.drive_service()
+        media = MediaFileUpload(local_path, mimetype='application/octet-stream',
+                                chunksize=max(1, int(chunk_mb)) * 1024 * 1024, resumable=True)
+        req = service.files().insert(body={'title': remote_name, 'parents': [{'id': folder_id}]},
+                                     media_body=media, fields='id', supportsAllDrives=True)
+        resp, sent, size, resumes = None, 0, os.path.getsize(local_path), 0
+        while resp is None:
+            try:
+                status, resp = req.next_chunk(num_retries=num_retries)
+            except (HttpError, OSError) as e:
+                code = e.resp.status if isinstance(e, HttpError) else 0
+                if resumes >= max_resumes or 400 <= code < 500 and code != 429:
+                    raise
+                resumes += 1
+                METRICS.retry('drive')
+                if log:
+                    log.warning(f"Drive upload {remote_name} interrupted ({e}); resuming ({resumes}/{max_resumes})")
+                time.sleep(resume_backoff_s * 2 ** (resumes - 1))
+                continue   # the request is in error state: next_chunk asks Drive where to resume
+            done = status.resumable_progress if status is not None else size
+            METRICS.http('drive', 200, done - sent)
+            sent = done
+            if status is not None and log:
+                log.info(f"Drive upload {remote_name}: {status.progress() * 100:.0f}%")
+        return resp['id']
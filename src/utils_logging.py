@@ -1,7 +1,40 @@
 # ───────────────────────────────────────────────────────────────────────────────
 # src/utils_logging.py
 # ───────────────────────────────────────────────────────────────────────────────
-import logging, sys
+import os, json, time, logging, sys
+
+
+class _TextFormatter(logging.Formatter):
+    # Structured fields (log.info(msg, extra={'fields': {...}})) follow the message as JSON
+    def format(self, record):
+        s = super().format(record)
+        fields = getattr(record, 'fields', None)
+        return f"{s} {json.dumps(fields, default=str, separators=(',', ':'))}" if fields else s
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any structured fields."""
+    converter = time.gmtime
+
+    def format(self, record):
+        out = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        out.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            out['exc'] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+
+def use_json(logger):
+    for h in logger.handlers:
+        if not isinstance(h.formatter, JsonFormatter):
+            h.setFormatter(JsonFormatter())
+    return logger
+
 
 def setup_logger(name: str = "arb"):
     logger = logging.getLogger(name)
@@ -9,7 +42,10 @@ def setup_logger(name: str = "arb"):
         return logger
     logger.setLevel(logging.INFO)
     handler = logging.StreamHandler(sys.stdout)
-    fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
+    fmt = _TextFormatter("%(asctime)s | %(levelname)s | %(message)s")
     handler.setFormatter(fmt)
     logger.addHandler(handler)
+    # ARB_LOG_FORMAT=json (or metrics.json_logs) switches to one JSON object per line
+    if os.getenv('ARB_LOG_FORMAT', '').lower() == 'json':
+        use_json(logger)
     return logger
@@ -0,0 +1,292 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/utils_metrics.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, sys, time, threading
+from collections import Counter
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Process-wide instrumentation: stage spans, HTTP/row/retry counters, Prometheus
+# text export and an opt-in sampling profiler. Everything goes through METRICS;
+# when disabled, spans are a shared null context and counters return at once.
+
+PREFIX = 'arb'
+_NULL = nullcontext()
+
+# Host suffix -> service label for HTTP accounting
+SERVICES = (
+    ('deribit.com', 'deribit'), ('okx.com', 'okx'), ('binance.com', 'binance'),
+    ('sheets.googleapis.com', 'sheets'), ('googleapis.com', 'google'),
+    ('discord.com', 'discord'), ('telegram.org', 'telegram'), ('line.me', 'line'),
+)
+
+
+def service_of(url: str) -> str:
+    host = urlparse(url).hostname or ''
+    return next((s for suffix, s in SERVICES if host.endswith(suffix)), host or 'unknown')
+
+
+class _Span:
+    __slots__ = ('reg', 'stage', 'labels', 't0')
+
+    def __init__(self, reg, stage, labels):
+        self.reg, self.stage, self.labels = reg, stage, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.reg.observe(self.stage, time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+class Metrics:
+    """Counters and gauges keyed by (name, sorted labels), rendered as Prometheus text.
+
+    Stage spans feed `<prefix>_stage_seconds_total`, `_stage_runs_total` and
+    `_stage_last_seconds`; `http()` feeds request/byte/error counters per service.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.counters = Counter()
+        self.gauges = {}
+        self.started = time.time()
+        self.profiler = None
+        self.textfile = None
+        self.job = 'scheduler'
+        self._lock = threading.Lock()
+        self._server = None
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    # ── recording ──────────────────────────────────────────────────────────
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        k = self._key(name, labels)
+        with self._lock:
+            self.counters[k] += value
+
+    def set(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[self._key(name, labels)] = float(value)
+
+    def observe(self, stage: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        labels = {'stage': stage, **labels}
+        k = self._key('stage', labels)
+        with self._lock:
+            self.counters[('stage_seconds_total', k[1])] += seconds
+            self.counters[('stage_runs_total', k[1])] += 1
+            self.gauges[('stage_last_seconds', k[1])] = seconds
+
+    def span(self, stage: str, **labels):
+        """`with METRICS.span('fetch', asset='BTC'):` times the block as one stage run."""
+        return _Span(self, stage, labels) if self.enabled else _NULL
+
+    def rows(self, io: str, sink: str, n: int):
+        self.inc('rows_total', n, io=io, sink=sink)
+
+    def retry(self, service: str, n: int = 1):
+        self.inc('retries_total', n, service=service)
+
+    def http(self, service: str, status: int, nbytes: int):
+        if not self.enabled:
+            return
+        self.inc('http_requests_total', service=service, code=f"{status // 100}xx")
+        self.inc('http_bytes_total', nbytes, service=service)
+
+    def requests_hook(self, service: str = None):
+        """Response hook for a requests.Session: counts calls and body bytes per service."""
+        def hook(r, *args, **kw):
+            if self.enabled:
+                n = int(r.headers.get('Content-Length') or 0) if kw.get('stream') else len(r.content or b'')
+                self.http(service or service_of(r.url), r.status_code, n)
+            return r
+        return hook
+
+    def instrument_session(self, session, service: str = None):
+        hook = self.requests_hook(service)
+        session.hooks.setdefault('response', []).append(hook)
+        return session
+
+    def profile(self, name: str):
+        """Sample the calling thread's stacks while the block runs (only when a profiler is set)."""
+        return self.profiler.session(name) if self.enabled and self.profiler is not None else _NULL
+
+    # ── reading / export ───────────────────────────────────────────────────
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges)}
+
+    def delta(self, before: dict, stages: bool = False) -> dict:
+        """Counters accumulated since `before` (a snapshot), flattened to 'name{k=v}' keys."""
+        now = self.snapshot()['counters']
+        prev = before['counters'] if before else {}
+        return {_flat(k): round(v - prev.get(k, 0), 6) for k, v in now.items()
+                if v != prev.get(k, 0) and (stages or not k[0].startswith('stage_'))}
+
+    def render(self) -> str:
+        snap = self.snapshot()
+        job = (('job', self.job),)   # scheduler and archive files can sit in one textfile dir
+        lines, seen = [], set()
+        for kind, items in (('counter', snap['counters']), ('gauge', snap['gauges'])):
+            for (name, labels), v in sorted(items.items()):
+                full = f"{PREFIX}_{name}"
+                if full not in seen:
+                    lines.append(f"# TYPE {full} {kind}")
+                    seen.add(full)
+                lines.append(f"{full}{_labels(job + labels)} {v:.10g}")
+        lines.append(f"# TYPE {PREFIX}_process_start_time_seconds gauge")
+        lines.append(f"{PREFIX}_process_start_time_seconds{_labels(job)} {self.started:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str = None):
+        """Atomic rewrite, as node_exporter's textfile collector expects."""
+        path = path or self.textfile
+        if not (self.enabled and path):
+            return
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port: int, host: str = '0.0.0.0'):
+        """GET /metrics on a daemon thread (once per process)."""
+        if self._server is not None or not self.enabled:
+            return self._server
+        reg = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *a):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                b = reg.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(b)))
+                self.end_headers()
+                self.wfile.write(b)
+
+        self._server = ThreadingHTTPServer((host, int(port)), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self._server
+
+    def configure(self, cfg: dict, log=None, job: str = 'scheduler', serve: bool = True):
+        """Apply the `metrics:` config section (safe to call again on reload).
+
+        Jobs other than the scheduler write `<textfile>_<job>.prom` next to it and never serve.
+        """
+        m = (cfg or {}).get('metrics', {}) or {}
+        self.enabled = bool(m.get('enabled', True))
+        self.job = job
+        self.textfile = m.get('textfile')
+        if self.textfile and job != 'scheduler':
+            root, ext = os.path.splitext(self.textfile)
+            self.textfile = f"{root}_{job}{ext}"
+            serve = False
+        if m.get('json_logs') and log is not None:
+            from .utils_logging import use_json
+            use_json(log)
+        if m.get('profile') and self.enabled:
+            out = m.get('profile_dir') or os.path.join(cfg.get('state', {}).get('dir', '.'), 'profiles')
+            if self.profiler is None or self.profiler.out_dir != out:
+                self.profiler = SamplingProfiler(out, interval_ms=m.get('profile_interval_ms', 5))
+        else:
+            self.profiler = None
+        if m.get('port') and self.enabled and serve:
+            self.serve(m['port'])
+        return self
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    esc = lambda s: s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in labels) + '}'
+
+
+def _flat(key) -> str:
+    name, labels = key
+    return name + ('{' + ','.join(f"{k}={v}" for k, v in labels) + '}' if labels else '')
+
+
+# ── sampling profiler ──────────────────────────────────────────────────────────
+class SamplingProfiler:
+    """Pure-Python stack sampler: while a session is open, a helper thread reads the
+    target thread's frame every `interval_ms` and counts collapsed stacks.
+
+    Stacks accumulate per session name in `<out_dir>/<name>.folded` (one
+    `frame;frame;... count` line per stack, the flamegraph.pl / speedscope input).
+    """
+
+    def __init__(self, out_dir: str, interval_ms: float = 5, max_depth: int = 64):
+        self.out_dir = out_dir
+        self.interval_s = max(0.001, float(interval_ms) / 1000)
+        self.max_depth = max_depth
+        self.stacks = {}   # name -> Counter(stack -> samples)
+        self._lock = threading.Lock()
+
+    def _stack(self, frame) -> str:
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            co = frame.f_code
+            parts.append(f"{os.path.basename(co.co_filename)}:{co.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(parts))
+
+    def session(self, name: str):
+        return _ProfileSession(self, name, threading.get_ident())
+
+    def record(self, name: str, samples: Counter):
+        with self._lock:
+            acc = self.stacks.setdefault(name, Counter())
+            acc.update(samples)
+            os.makedirs(self.out_dir, exist_ok=True)
+            path = os.path.join(self.out_dir, f"{name}.folded")
+            tmp = path + '.tmp'
+            with open(tmp, 'w') as f:
+                for stack, n in acc.most_common():
+                    f.write(f"{stack} {n}\n")
+            os.replace(tmp, path)
+
+
+class _ProfileSession:
+    def __init__(self, prof: SamplingProfiler, name: str, ident: int):
+        self.prof, self.name, self.ident = prof, name, ident
+        self.samples = Counter()
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.prof.interval_s):
+            frame = sys._current_frames().get(self.ident)
+            if frame is not None:
+                self.samples[self.prof._stack(frame)] += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name=f"profile-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if self.samples:
+            self.prof.record(self.name, self.samples)
+        return False
+
+
+METRICS = Metrics()
@@ -0,0 +1,76 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# src/utils_synthetic.py
+# ───────────────────────────────────────────────────────────────────────────────
+import numpy as np
+import pandas as pd
+
+# Synthetic futures curves / histories for benchmarks and offline runs.
+
+
+def synthetic_history(n_rows: int = None, n_snapshots: int = 720, n_instruments: int = 8,
+                      base: str = 'BTC', quote: str = 'USD', freq: str = 'h',
+                      start: str = '2024-01-01', seed: int = 0) -> pd.DataFrame:
+    """Snapshots x instruments of raw quotes (+ spread/apy) in the sheet's column layout.
+
+    Spot follows a geometric random walk, each expiry carries a noisy contango
+    around 8% APY, and expiries roll off and re-list as they reach zero DTE.
+    """
+    if n_rows is not None:
+        n_snapshots = max(1, n_rows // n_instruments)
+    rng = np.random.default_rng(seed)
+    T, I = n_snapshots, n_instruments
+    ts = pd.date_range(pd.Timestamp(start, tz='UTC'), periods=T, freq=freq)
+    step_days = (ts[1] - ts[0]).total_seconds() / 86400 if T > 1 else 1 / 24
+    spot = 50000.0 * np.exp(np.cumsum(rng.normal(0, 0.004, T)))
+
+    # Expiry ladder: instrument i expires every 7*(i+1) days, rolling forward
+    period = 7.0 * (np.arange(I) + 1)
+    elapsed = np.arange(T) * step_days
+    dte = period[None, :] - np.mod(elapsed[:, None], period[None, :])
+    cycle = np.floor_divide(elapsed[:, None], period[None, :]).astype(np.int64)
+    names = np.char.add(np.char.add(f"{base}-W", (np.arange(I) + 1).astype(str)[None, :].repeat(T, 0)),
+                        np.char.add("C", cycle.astype(str)))
+
+    apy = 0.08 + 0.02 * np.sin(elapsed[:, None] / 30.0) + 0.01 * rng.standard_normal((T, I))
+    fut = spot[:, None] * (1 + apy * dte / 365.0)
+    ts_ms = ((ts - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64)
+    expiry = ts_ms[:, None] + (dte * 86400e3).astype(np.int64)
+
+    df = pd.DataFrame({
+        'timestamp_utc': np.repeat(ts, I),
+        'exchange': 'deribit',
+        'base': base,
+        'quote': quote,
+        'instrument_type': 'future',
+        'instrument': names.ravel(),
+        'expiry_ts': expiry.ravel(),
+        'days_to_expiry': np.maximum(1, np.floor(dte)).ravel(),
+        'spot_price': np.repeat(spot, I),
+        'perp_price': np.repeat(spot * (1 + 0.0002 * rng.standard_normal(T)), I),
+        'fut_price': fut.ravel(),
+    })
+    df['spread'] = df['fut_price'] - df['spot_price']
+    df['apy_annual'] = (df['spread'] / df['spot_price']) * (365.0 / df['days_to_expiry'].clip(lower=1))
+    df['run_id'] = np.repeat(np.char.mod('%08x', np.arange(T)), I)
+    return df
+
+
+def synthetic_curve(n_expiries: int = 8, base: str = 'BTC', spot: float = 50000.0, now_ms: int = None,
+                    seed: int = 0) -> list:
+    """One live futures curve as Deribit-style instrument dicts (+ 'price'), perpetual last.
+
+    Weekly expiries out to n_expiries, contango around 8% APY with noise.
+    """
+    rng = np.random.default_rng(seed)
+    now_ms = int(pd.Timestamp.now(tz='UTC').timestamp() * 1000) if now_ms is None else int(now_ms)
+    dte = 7.0 * (np.arange(n_expiries) + 1) - 3.0
+    apy = 0.08 + 0.01 * rng.standard_normal(n_expiries)
+    out = [{
+        'instrument_name': f"{base}-S{i + 1:04d}",
+        'expiration_timestamp': now_ms + int(d * 86400e3),
+        'settlement_period': 'week',
+        'price': float(spot * (1 + a * d / 365.0)),
+    } for i, (d, a) in enumerate(zip(dte, apy))]
+    out.append({'instrument_name': f"{base}-PERPETUAL", 'expiration_timestamp': 32503708800000,
+                'settlement_period': 'perpetual', 'price': float(spot * (1 + 0.0002 * rng.standard_normal()))})
+    return out
@@ -1,6 +1,7 @@
 # ───────────────────────────────────────────────────────────────────────────────
 # src/utils_termcurve.py
 # ───────────────────────────────────────────────────────────────────────────────
+import time, argparse
 import numpy as np
 import pandas as pd
 from statsmodels.nonparametric.smoothers_lowess import lowess
@@ -25,10 +26,203 @@ def fit_term_curve_bins(dte: np.ndarray, spread: np.ndarray, bins):
     if df.empty:
         return None
     df['bin'] = pd.cut(df['dte'], bins=bins, include_lowest=True)
-    means = df.groupby('bin')['spread'].mean()
+    means = df.groupby('bin', observed=False)['spread'].mean()
     edges = [b.left for b in means.index.categories] + [means.index.categories[-1].right]
-    vals = means.values
+    # empty bins borrow from their neighbours instead of poisoning interp with NaN
+    vals = pd.Series(means.values).interpolate(limit_direction='both').values
     def predict(d):
         # piecewise constant by bin mid; interpolate edges to be safe
         return np.interp(d, np.array(edges, dtype=float), np.r_[vals[0], vals])
     return predict
+
+
+# ── DTE-grid curves ────────────────────────────────────────────────────────────
+# History is reduced to per-grid-cell sums/counts (O(n), incrementally updatable);
+# smoothing then runs on at most a few hundred cells instead of every history row.
+
+class TermGrid:
+    """Spread sums and counts on a fixed DTE grid."""
+
+    def __init__(self, step: float = 1.0, max_dte: float = 400.0):
+        self.step = float(step)
+        self.size = int(np.ceil(max_dte / self.step)) + 1
+        self.cnt = np.zeros(self.size)
+        self.sum = np.zeros(self.size)
+
+    def index(self, dte: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(np.asarray(dte, dtype=float) / self.step), 0, self.size - 1).astype(np.int64)
+
+    def add(self, dte: np.ndarray, spread: np.ndarray, sign: float = 1.0):
+        idx = self.index(dte)
+        self.cnt += sign * np.bincount(idx, minlength=self.size)
+        self.sum += sign * np.bincount(idx, weights=np.asarray(spread, dtype=float), minlength=self.size)
+
+    def points(self):
+        ok = self.cnt > 0.5
+        x = np.nonzero(ok)[0] * self.step
+        return x, self.sum[ok] / self.cnt[ok], self.cnt[ok]
+
+
+def _interp_predict(xs: np.ndarray, ys: np.ndarray):
+    def predict(d):
+        return np.interp(d, xs, ys)
+    return predict
+
+
+def smooth_grid_kernel(grid: TermGrid, bandwidth: float = 7.0):
+    """Count-weighted Gaussian kernel smoother over grid cells (O(cells * kernel))."""
+    if (grid.cnt > 0.5).sum() < 2:
+        return None
+    half = max(1, int(np.ceil(3 * bandwidth / grid.step)))
+    k = np.exp(-0.5 * (np.arange(-half, half + 1) * grid.step / bandwidth) ** 2)
+    num = np.convolve(grid.sum, k, mode='same')
+    den = np.convolve(grid.cnt, k, mode='same')
+    ok = den > 1e-9
+    xs = np.nonzero(ok)[0] * grid.step
+    return _interp_predict(xs, num[ok] / den[ok])
+
+
+def smooth_grid_lowess(grid: TermGrid, frac: float = 0.6):
+    """LOWESS on per-cell means (decimated LOWESS)."""
+    x, y, _ = grid.points()
+    return fit_term_curve_lowess(x, y, frac=frac)
+
+
+def fit_term_curve_grid(dte: np.ndarray, spread: np.ndarray, method: str = 'lowess', frac: float = 0.6,
+                        step: float = 1.0, bandwidth: float = 7.0):
+    ok = np.isfinite(dte) & np.isfinite(spread)
+    dte, spread = np.asarray(dte, dtype=float)[ok], np.asarray(spread, dtype=float)[ok]
+    if len(dte) == 0:
+        return None
+    grid = TermGrid(step, max(400.0, float(dte.max()) + step))
+    grid.add(dte, spread)
+    return smooth_grid_kernel(grid, bandwidth) if method == 'kernel' else smooth_grid_lowess(grid, frac)
+
+
+class TermCurveCache:
+    """Fitted term curve per key, refitted incrementally as the history window slides.
+
+    `fit(hist, key)` fingerprints the (timestamp_utc, days_to_expiry, spread) window; an
+    unchanged window returns the cached curve, otherwise only rows that entered or left
+    the window since the last call are applied to the grid before re-smoothing.
+    method: 'lowess' (decimated LOWESS on grid means), 'kernel' (O(n) kernel smoother),
+    'exact' (legacy full LOWESS on every row, no caching of partial updates).
+    """
+
+    def __init__(self, method: str = 'lowess', frac: float = 0.6, step: float = 1.0,
+                 bandwidth: float = 7.0, term_bins=None):
+        self.method, self.frac, self.step, self.bandwidth = method, frac, step, bandwidth
+        self.term_bins = term_bins
+        self._state = {}  # key -> dict(fp, grid, ts, dte, spread, predict)
+        self.stats = {'hits': 0, 'incremental': 0, 'full': 0}
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        tc_cfg = cfg.get('term_curve', {})
+        return cls(method=tc_cfg.get('method', 'lowess'), frac=tc_cfg.get('frac', 0.6),
+                   step=tc_cfg.get('grid_step_days', 1), bandwidth=tc_cfg.get('kernel_bandwidth_days', 7),
+                   term_bins=cfg['term_curve_bins'])
+
+    @staticmethod
+    def _arrays(hist: pd.DataFrame):
+        ts = pd.to_datetime(hist['timestamp_utc'], errors='coerce', utc=True)
+        ts = ((ts - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+        dte = pd.to_numeric(hist['days_to_expiry'], errors='coerce').to_numpy(dtype=float)
+        spread = pd.to_numeric(hist['spread'], errors='coerce').to_numpy(dtype=float)
+        ok = np.isfinite(dte) & np.isfinite(spread)
+        order = np.argsort(ts[ok], kind='stable')
+        return ts[ok][order], dte[ok][order], spread[ok][order]
+
+    def _smooth(self, st: dict):
+        if self.method == 'exact':
+            predict = fit_term_curve_lowess(st['dte'], st['spread'], frac=self.frac)
+        elif self.method == 'kernel':
+            predict = smooth_grid_kernel(st['grid'], self.bandwidth)
+        else:
+            predict = smooth_grid_lowess(st['grid'], self.frac)
+        if predict is None and self.term_bins is not None and len(st['dte']):
+            predict = fit_term_curve_bins(st['dte'], st['spread'], bins=self.term_bins)
+        return predict
+
+    @staticmethod
+    def _overlap_same(st: dict, ts, dte, spread) -> bool:
+        # Rows both windows share must be unchanged, or the grid would keep stale values
+        keep = st['ts'] >= ts[0]
+        head = ts <= st['ts'][-1]
+        return (keep.sum() == head.sum() and np.array_equal(st['ts'][keep], ts[head])
+                and np.array_equal(st['dte'][keep], dte[head]) and np.array_equal(st['spread'][keep], spread[head]))
+
+    def fit(self, hist: pd.DataFrame, key=''):
+        if hist.empty:
+            return None
+        return self.fit_arrays(*self._arrays(hist), key=key)
+
+    def fit_arrays(self, ts: np.ndarray, dte: np.ndarray, spread: np.ndarray, key=''):
+        """`fit` on a window already reduced to finite rows sorted by epoch seconds `ts`."""
+        if len(ts) == 0:
+            return None
+        fp = (len(ts), int(ts[0]), int(ts[-1]), float(spread.sum()))
+        st = self._state.get(key)
+        if st is not None and st['fp'] == fp:
+            self.stats['hits'] += 1
+            return st['predict']
+        if st is not None and ts[0] >= st['ts'][0] and ts[-1] >= st['ts'][-1] and self._overlap_same(st, ts, dte, spread):
+            # Slide the window: drop rows older than the new start, add rows after the old end
+            gone = st['ts'] < ts[0]
+            new = ts > st['ts'][-1]
+            st['grid'].add(st['dte'][gone], st['spread'][gone], sign=-1.0)
+            st['grid'].add(dte[new], spread[new])
+            self.stats['incremental'] += 1
+        else:
+            grid = TermGrid(self.step, max(400.0, float(dte.max()) + self.step))
+            grid.add(dte, spread)
+            st = {'grid': grid}
+            self.stats['full'] += 1
+        if dte.max() >= st['grid'].size * st['grid'].step:
+            st['grid'] = TermGrid(self.step, float(dte.max()) + self.step)
+            st['grid'].add(dte, spread)
+        st.update(fp=fp, ts=ts, dte=dte, spread=spread)
+        st['predict'] = self._smooth(st)
+        self._state[key] = st
+        return st['predict']
+
+
+def bench(sizes=(1_000, 5_000, 20_000, 100_000), frac: float = 0.6,
+          bins=(0, 7, 14, 30, 60, 90, 180, 365), log=None) -> pd.DataFrame:
+    """Fit time and deviation error (RMS vs full LOWESS) per method and history size."""
+    from .utils_synthetic import synthetic_history
+    rows = []
+    for n in sizes:
+        h = synthetic_history(n_rows=n, n_instruments=8)
+        x, y = h['days_to_expiry'].to_numpy(dtype=float), h['spread'].to_numpy(dtype=float)
+        fits = {
+            'lowess_full': lambda: fit_term_curve_lowess(x, y, frac=frac),
+            'bins': lambda: fit_term_curve_bins(x, y, bins=list(bins)),
+            'grid_lowess': lambda: fit_term_curve_grid(x, y, method='lowess', frac=frac),
+            'grid_kernel': lambda: fit_term_curve_grid(x, y, method='kernel'),
+        }
+        ref = None
+        for name, f in fits.items():
+            t0 = time.perf_counter()
+            p = f()
+            dt = time.perf_counter() - t0
+            dev = y - p(x)
+            if name == 'lowess_full':
+                ref = dev
+            rmse = float(np.sqrt(np.mean((dev - ref) ** 2))) if ref is not None else float('nan')
+            rows.append({'rows': n, 'method': name, 'fit_ms': dt * 1000, 'dev_rmse_vs_lowess': rmse})
+            if log:
+                log.info(f"term curve {name:<12} n={n:>7}: {dt*1000:8.1f} ms, dev RMSE vs LOWESS={rmse:.4f}")
+    return pd.DataFrame(rows)
+
+
+def main():
+    from .utils_logging import setup_logger
+    ap = argparse.ArgumentParser(description="Term-curve fit benchmarks")
+    ap.add_argument('--sizes', nargs='*', type=int, default=[1_000, 5_000, 20_000, 100_000])
+    ap.add_argument('--frac', type=float, default=0.6)
+    args = ap.parse_args()
+    bench(args.sizes, frac=args.frac, log=setup_logger())
+
+if __name__ == "__main__":
+    main()
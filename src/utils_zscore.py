@@ -4,26 +4,84 @@
 import numpy as np
 import pandas as pd
 
+
+def _epoch_s(ts) -> np.ndarray:
+    t = pd.to_datetime(pd.Series(ts), errors='coerce', utc=True)
+    return ((t - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+
+
+def window_stats(codes: np.ndarray, t: np.ndarray, x: np.ndarray,
+                 lookback_s: int = None, lookback_rows: int = None, closed: str = 'left'):
+    """Count/mean/std (ddof=0) of x over a trailing window within each group.
+
+    Inputs must be sorted by (codes, t). The window for row k covers rows of the
+    same group with time in [t_k - lookback_s, t_k) (closed='left', excludes every
+    row sharing t_k) or up to and including row k (closed='both'); lookback_rows
+    additionally caps it to the last N rows. Uses prefix sums and searchsorted on
+    a composite (group, time) key, so there is no Python loop over groups or rows.
+    """
+    n = len(x)
+    if n == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    codes = np.asarray(codes, dtype=np.int64)
+    t = np.asarray(t, dtype=np.int64)
+    x = np.asarray(x, dtype=float)
+    valid = np.isfinite(x)
+    # Center per group to keep the sum-of-squares numerically stable
+    ng = int(codes.max()) + 1
+    cnt_g = np.bincount(codes, weights=valid, minlength=ng)
+    mu_g = np.bincount(codes, weights=np.where(valid, x, 0.0), minlength=ng) / np.maximum(cnt_g, 1)
+    xc = np.where(valid, x - mu_g[codes], 0.0)
+    cn = np.r_[0, np.cumsum(valid)]
+    c1 = np.r_[0.0, np.cumsum(xc)]
+    c2 = np.r_[0.0, np.cumsum(xc * xc)]
+
+    t0 = t.min()
+    span = int(t.max() - t0) + int(lookback_s or 0) + 2
+    key = codes * span + (t - t0)
+    gstart = np.searchsorted(key, codes * span, side='left')
+    if closed == 'left':
+        hi = np.searchsorted(key, key, side='left')
+    else:
+        hi = np.arange(1, n + 1)
+    lo = gstart
+    if lookback_s is not None:
+        lo = np.maximum(lo, np.searchsorted(key, key - lookback_s, side='left'))
+    if lookback_rows is not None:
+        lo = np.maximum(lo, hi - lookback_rows)
+    lo = np.minimum(lo, hi)
+
+    cnt = (cn[hi] - cn[lo]).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m = (c1[hi] - c1[lo]) / cnt
+        var = np.maximum((c2[hi] - c2[lo]) / cnt - m * m, 0.0)
+    return cnt, m + mu_g[codes], np.sqrt(var)
+
+
 def rolling_z_by_group(df: pd.DataFrame, value_col: str, group_col: str, time_col: str,
-                       lookback_rows: int = 200, min_rows: int = 30) -> pd.Series:
-    # compute z within each group using last N rows (per group)
-    z = []
-    for key, g in df.sort_values(time_col).groupby(group_col, dropna=False):
-        vals = g[value_col].astype(float)
-        if len(vals) < min_rows:
-            z.extend([np.nan]*len(vals))
-            continue
-        roll = vals.rolling(window=min(len(vals), lookback_rows), min_periods=min_rows)
-        mean = roll.mean(); std = roll.std(ddof=0)
-        z.extend(((vals - mean) / std).tolist())
-    return pd.Series(z, index=df.sort_values(time_col).index)
-
-
-def cross_sectional_z(snapshot_df: pd.DataFrame, value_col: str, by_col: str) -> pd.Series:
+                       lookback_rows: int = 200, min_rows: int = 30,
+                       lookback: pd.Timedelta = None, closed: str = 'both') -> pd.Series:
+    # z within each group against its trailing window (last N rows and/or time span)
+    if df.empty:
+        return pd.Series(dtype=float)
+    t = _epoch_s(df[time_col])
+    codes = pd.factorize(df[group_col], use_na_sentinel=False)[0]
+    order = np.lexsort((t, codes))
+    lookback_s = int(pd.Timedelta(lookback).total_seconds()) if lookback is not None else None
+    x = df[value_col].to_numpy(dtype=float)[order]
+    cnt, mean, std = window_stats(codes[order], t[order], x,
+                                  lookback_s=lookback_s, lookback_rows=lookback_rows, closed=closed)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where((cnt >= min_rows) & (std > 0), (x - mean) / std, np.nan)
+    out = np.empty(len(df)); out[order] = z
+    return pd.Series(out, index=df.index)
+
+
+def cross_sectional_z(snapshot_df: pd.DataFrame, value_col: str, by_col, ddof: int = 1) -> pd.Series:
     # Z across instruments in the same timestamp
     if snapshot_df.empty:
         return pd.Series(dtype=float)
-    grp = snapshot_df.groupby(by_col)[value_col]
+    grp = snapshot_df.groupby(by_col, sort=False, observed=True)[value_col]
     mean = grp.transform('mean')
-    std = grp.transform('std').replace(0, np.nan)
+    std = grp.transform('std', ddof=ddof).replace(0, np.nan)
     return (snapshot_df[value_col] - mean) / std
@@ -3,18 +3,22 @@
 # ───────────────────────────────────────────────────────────────────────────────
 import pandas as pd
 from .utils_google import GoogleClients
+from .schema import COLUMNS, validate
+from .sheet_tabs import tab_name
 
-def append_metrics_to_sheet(gc: GoogleClients, spreadsheet_id: str, worksheet_name: str, df: pd.DataFrame):
-    # Ensure column order
-    cols = [
-        'timestamp_utc','exchange','base','quote','instrument_type','instrument',
-        'expiry_ts','days_to_expiry','spot_price','perp_price','fut_price',
-        'spread','apy_annual','z_hist','z_cross','z_term',
-        'funding_est_hourly','fee_bp_est','apy_net','liq_depth_bp',
-        'signal_flag','signal_reason','side_hint','run_id'
-    ]
-    for c in cols:
-        if c not in df.columns:
-            df[c] = None
-    out = df[cols].copy()
-    gc.append_rows(spreadsheet_id, worksheet_name, out)
+def append_metrics_to_sheet(gc: GoogleClients, spreadsheet_id: str, worksheet_name: str, df: pd.DataFrame,
+                            rotate: str = None) -> list:
+    # Column order comes from the shared schema
+    validate(df, typed=False)
+    out = df.reindex(columns=COLUMNS)
+    if not rotate:
+        # Incremental append: only this run's rows are sent to the Sheets API
+        gc.append_rows(spreadsheet_id, worksheet_name, out)
+        return [worksheet_name]
+    # Rotating sheet: each row goes to the tab of its timestamp's month/week
+    ts = pd.to_datetime(out['timestamp_utc'], utc=True, format='ISO8601')
+    tabs = ts.map(lambda t: tab_name(worksheet_name, t, rotate))
+    for tab, part in out.groupby(tabs.to_numpy(), sort=True):
+        gc.rotated_tab(spreadsheet_id, worksheet_name, ts[part.index[0]], rotate)
+        gc.append_rows(spreadsheet_id, tab, part)
+    return sorted(tabs.unique())
@@ -0,0 +1,334 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# streamlit_app/data_layer.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, re, sys, glob, time, threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for src.schema
+from src.schema import PARQUET_FORMAT, coerce, concat, from_arrow
+from src.rollups import Rollups
+from src.sheet_tabs import last_col, overlapping, read_index, rows_frame
+from gspread.exceptions import WorksheetNotFound
+
+# Dashboard reads: Parquet history with predicate pushdown, then downsampling to
+# screen resolution before anything is handed to Plotly.
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+COLUMNS = ['timestamp_utc', 'exchange', 'base', 'instrument', 'days_to_expiry', 'spot_price', 'fut_price',
+           'spread', 'apy_annual', 'z_hist', 'z_cross', 'z_term', 'apy_net', 'signal_flag']
+CACHE_BUCKET_S = 300  # window edges snap to this so reruns hit the same cache entry
+_ARCHIVE_RE = re.compile(r'arbitrage_(\d{4}-\d{2}-\d{2})\.parquet$')
+
+
+def _archive_cfg() -> dict:
+    try:
+        import yaml
+        with open('config.yaml') as f:
+            return yaml.safe_load(f)['archive']
+    except Exception:
+        return {}
+
+
+def default_history_dir() -> str:
+    arch = _archive_cfg()
+    return os.getenv('ARB_HISTORY_DIR') or arch.get('history_dir') or (
+        os.path.join(arch['out_dir'], 'history') if 'out_dir' in arch else '')
+
+
+def default_rollup_dir() -> str:
+    arch = _archive_cfg()
+    return os.getenv('ARB_ROLLUP_DIR') or arch.get('rollup_dir') or (
+        os.path.join(arch['out_dir'], 'rollups') if 'out_dir' in arch else '')
+
+
+def window(hours: float, now: datetime = None):
+    """(start, end) snapped to CACHE_BUCKET_S; `end` is exclusive and just past `now`."""
+    now = now or datetime.now(timezone.utc)
+    end_s = (int(now.timestamp()) // CACHE_BUCKET_S + 1) * CACHE_BUCKET_S
+    end = datetime.fromtimestamp(end_s, tz=timezone.utc)
+    return end - timedelta(hours=hours), end
+
+
+# ── Parquet ────────────────────────────────────────────────────────────────────
+def _is_hive(root: str) -> bool:
+    return any(d.startswith('date=') for d in os.listdir(root))
+
+
+def _day_files(root: str, day: str) -> list:
+    """Parquet files holding `day`: a history-store partition or one daily archive file."""
+    d = os.path.join(root, f"date={day}")
+    if os.path.isdir(d):
+        return sorted(os.path.join(d, f) for f in os.listdir(d) if f.endswith('.parquet'))
+    p = os.path.join(root, f"arbitrage_{day}.parquet")
+    return [p] if os.path.exists(p) else []
+
+
+@st.cache_resource(ttl=300)
+def _dataset(root: str, days: tuple):
+    """Hive `date=` partitions (history store) or daily `arbitrage_<date>.parquet` files (archive)."""
+    if _is_hive(root):
+        return ds.dataset(root, format=PARQUET_FORMAT, partitioning='hive', exclude_invalid_files=True)
+    files = [p for p in glob.glob(os.path.join(root, 'arbitrage_*.parquet'))
+             if (m := _ARCHIVE_RE.search(p)) and m.group(1) in days]
+    return ds.dataset(sorted(files), format=PARQUET_FORMAT) if files else None
+
+
+def has_parquet(root: str) -> bool:
+    return bool(root) and os.path.isdir(root) and (
+        _is_hive(root) or bool(glob.glob(os.path.join(root, 'arbitrage_*.parquet'))))
+
+
+def _read(dset, start: datetime, end: datetime = None, base: str = None, instruments: tuple = None,
+          columns: tuple = tuple(COLUMNS), after: bool = False) -> pd.DataFrame:
+    names = set(dset.schema.names)
+    ts = ds.field('timestamp_utc')
+    lo = pa.scalar(start, pa.timestamp('us', tz='UTC'))
+    flt = (ts > lo) if after else (ts >= lo)
+    if end is not None:
+        flt = flt & (ts < pa.scalar(end, pa.timestamp('us', tz='UTC')))
+    if 'date' in names:
+        flt = flt & (ds.field('date') >= start.strftime('%Y-%m-%d'))
+        if end is not None:
+            flt = flt & (ds.field('date') <= end.strftime('%Y-%m-%d'))
+    if base and 'base' in names:
+        flt = flt & (ds.field('base') == base)
+    if instruments:
+        flt = flt & ds.field('instrument').isin(list(instruments))
+    cols = [c for c in columns if c in names]
+    df = from_arrow(dset.to_table(columns=cols, filter=flt))
+    return df.sort_values('timestamp_utc', kind='stable', ignore_index=True)
+
+
+@st.cache_data(ttl=300, max_entries=32, show_spinner=False)
+def load_window(root: str, start: datetime, end: datetime, base: str = None,
+                instruments: tuple = None, columns: tuple = tuple(COLUMNS)) -> pd.DataFrame:
+    """Rows in [start, end) with partition pruning on date and row-group pruning on time/instrument."""
+    days = tuple(d.strftime('%Y-%m-%d') for d in pd.date_range(start.date(), end.date(), freq='D'))
+    dset = _dataset(root, days)
+    if dset is None:
+        return coerce(pd.DataFrame(), columns=list(columns))
+    return _read(dset, start, end, base, instruments, columns)
+
+
+# ── Rollups (written by src/rollups.py in the scheduler) ───────────────────────
+def rollup_version(root: str) -> float:
+    """mtime of daily.parquet: every scheduler flush bumps it, invalidating the caches below."""
+    p = os.path.join(root, 'daily.parquet') if root else ''
+    return os.path.getmtime(p) if p and os.path.exists(p) else 0.0
+
+
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+def load_rollup(root: str, start: datetime, end: datetime, freq: str = 'h', base: str = None,
+                version: float = 0.0) -> pd.DataFrame:
+    """Hourly ('h') or daily ('D') per-instrument rollup rows; cost is O(buckets x instruments)."""
+    df = Rollups(root).read(start, end, freq=freq, base=base)
+    return df.sort_values('bucket', kind='stable', ignore_index=True) if len(df) else df
+
+
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+def load_zcross(root: str, start: datetime, end: datetime, freq: str = 'h', version: float = 0.0) -> pd.DataFrame:
+    """Dense time x instrument z_cross matrix; `freq='D'` averages the hourly cells per day."""
+    m = Rollups(root).read_zcross(start, end)
+    return m.resample('D').mean() if freq == 'D' and len(m) else m
+
+
+# ── Google Sheet fallback ──────────────────────────────────────────────────────
+@st.cache_resource
+def _sheet_client(sa_info: tuple = None, sa_json_path: str = None):
+    from oauth2client.service_account import ServiceAccountCredentials
+    import gspread
+    if sa_info:
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(dict(sa_info), SCOPES)
+    else:
+        creds = ServiceAccountCredentials.from_json_keyfile_name(sa_json_path, SCOPES)
+    return gspread.authorize(creds)
+
+
+def sheet_client():
+    """gspread client from st.secrets (as a dict, no temp file) or the env key path."""
+    if "GOOGLE_SERVICE_ACCOUNT_JSON" in st.secrets:
+        return _sheet_client(sa_info=tuple(sorted(dict(st.secrets["GOOGLE_SERVICE_ACCOUNT_JSON"]).items())))
+    return _sheet_client(sa_json_path=os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON'))
+
+
+# ── Live frame ─────────────────────────────────────────────────────────────────
+class LiveFrame:
+    """Rolling in-process frame shared by all sessions: one window load, then deltas only.
+
+    Parquet: the first refresh loads just the requested lookback through `load_window`
+    (partition + row-group pruning) and a longer lookback later extends it backwards
+    the same way; after that, only part files not seen before, from the partitions at
+    or after the last timestamp, filtered to rows newer than it. Sheet: only the
+    rotated tabs overlapping the window, and per tab only rows below the last one read.
+    Rows older than `max_hours` are evicted on every refresh.
+    """
+    INDEX_TTL_S = 300  # new tabs only appear at month/week boundaries
+
+    def __init__(self, root: str = None, sheet_id: str = None, worksheet: str = None,
+                 max_hours: float = 336, min_interval_s: float = 5):
+        self.root, self.sheet_id, self.worksheet = root, sheet_id, worksheet
+        self.max_hours = max_hours
+        self.min_interval_s = min_interval_s
+        self.df = coerce(pd.DataFrame(), columns=COLUMNS)
+        self.last_ts = None
+        self.start = None   # earliest time the frame covers
+        self._seen = set()
+        self._sheet = None
+        self._tabs, self._tabs_checked = [], 0.0
+        self._ws, self._header, self._next_row = {}, {}, {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'refreshes': 0, 'rows_in': 0, 'last_new': 0, 'last_ms': 0.0}
+
+    def _fetch_parquet(self, cutoff: datetime) -> pd.DataFrame:
+        since = self.last_ts.to_pydatetime() if self.last_ts is not None else max(self.start or cutoff, cutoff)
+        days = [d.strftime('%Y-%m-%d') for d in pd.date_range(since.date(), datetime.now(timezone.utc).date(), freq='D')]
+        files = [f for d in days for f in _day_files(self.root, d) if f not in self._seen]
+        if not files:
+            return pd.DataFrame(columns=COLUMNS)
+        df = _read(ds.dataset(files, format=PARQUET_FORMAT), since, after=self.last_ts is not None)
+        self._seen.update(files)
+        # Forget files of evicted days so the set stays bounded
+        keep = cutoff.strftime('%Y-%m-%d')
+        self._seen = {f for f in self._seen if (m := re.search(r'(\d{4}-\d{2}-\d{2})', f)) is None or m.group(1) >= keep}
+        return df
+
+    def _sheet_tabs(self, cutoff: datetime) -> list:
+        if self._sheet is None:
+            self._sheet = sheet_client().open_by_key(self.sheet_id)
+        if time.monotonic() - self._tabs_checked > self.INDEX_TTL_S:
+            self._tabs = overlapping(read_index(self._sheet, self.worksheet), self.worksheet, start=cutoff)
+            self._tabs_checked = time.monotonic()
+        return self._tabs
+
+    def _fetch_sheet(self, cutoff: datetime) -> pd.DataFrame:
+        frames = []
+        for tab in self._sheet_tabs(cutoff):
+            if tab not in self._ws:
+                try:
+                    self._ws[tab] = self._sheet.worksheet(tab)
+                except WorksheetNotFound:
+                    continue  # indexed, first rows not written yet
+            ws = self._ws[tab]
+            if tab not in self._header:
+                values = ws.get_all_values()
+                if not values:
+                    continue
+                self._header[tab], rows = values[0], values[1:]
+                self._next_row[tab] = len(values) + 1
+            else:
+                rows = ws.get(f"A{self._next_row[tab]}:{last_col(len(self._header[tab]))}")
+                self._next_row[tab] += len(rows)
+            if rows:
+                frames.append(coerce(rows_frame(self._header[tab], rows), columns=COLUMNS))
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+        df = concat(frames)
+        if self.last_ts is not None:
+            df = df[df['timestamp_utc'] > self.last_ts]
+        return df
+
+    def _extend_back(self, hours: float) -> int:
+        """Parquet only: load [now - hours, self.start) so the frame covers the lookback."""
+        start, end = window(min(hours, self.max_hours))
+        if self.start is not None and start >= self.start:
+            return 0
+        older = load_window(self.root, start, self.start or end)
+        if self.start is None:
+            self.df = older
+            if len(older):
+                self.last_ts = older['timestamp_utc'].max()
+        elif len(older):
+            self.df = concat([older, self.df])
+        self.start = start
+        return len(older)
+
+    def refresh(self, hours: float = None, force: bool = False) -> int:
+        """Pull new rows (at most once per `min_interval_s` across sessions); returns rows added.
+
+        `hours` is the lookback about to be viewed; a Parquet frame is extended back to it.
+        """
+        with self._lock:
+            grew = self._extend_back(hours or self.max_hours) if self.root else 0
+            if not grew and not force and time.monotonic() - self._checked < self.min_interval_s:
+                return 0
+            t0 = time.perf_counter()
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=self.max_hours)
+            new = self._fetch_parquet(cutoff) if self.root else self._fetch_sheet(cutoff)
+            if self.start is None or self.start < cutoff:
+                self.start = cutoff
+            df = self.df
+            if len(new):
+                df = concat([df, new])
+                self.last_ts = df['timestamp_utc'].max()
+            if len(df) and df['timestamp_utc'].iloc[0] < cutoff:
+                df = df[df['timestamp_utc'] >= cutoff].reset_index(drop=True)
+            self.df = df
+            self._checked = time.monotonic()
+            self.stats['refreshes'] += 1
+            self.stats['rows_in'] += len(new) + grew
+            self.stats['last_new'] = len(new)
+            self.stats['last_ms'] = (time.perf_counter() - t0) * 1000
+            return len(new)
+
+    def view(self, hours: float, base: str = None) -> pd.DataFrame:
+        df = self.df  # replaced, never mutated, by refresh()
+        if df.empty:
+            return df
+        df = df[df['timestamp_utc'] >= datetime.now(timezone.utc) - timedelta(hours=hours)]
+        if base and 'base' in df.columns:
+            df = df[df['base'] == base]
+        return df
+
+
+@st.cache_resource
+def live_frame(root: str = None, sheet_id: str = None, worksheet: str = None, max_hours: float = 336) -> LiveFrame:
+    return LiveFrame(root, sheet_id, worksheet, max_hours)
+
+
+# ── Downsampling ───────────────────────────────────────────────────────────────
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `n_out` points that keep the visual shape."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out-2 inner buckets over [1, n-1)
+    # Centroid of the bucket after each inner bucket (the last one is the final point)
+    cnt = np.diff(np.r_[edges, n])
+    cx = np.add.reduceat(x, edges) / cnt
+    cy = np.add.reduceat(y, edges) / cnt
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - cx[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_lines(df: pd.DataFrame, x: str, y: str, by: str, max_points: int = 1500) -> pd.DataFrame:
+    """LTTB per `by` group so each line carries at most `max_points` points."""
+    parts = []
+    for _, g in df.dropna(subset=[y]).groupby(by, sort=True, observed=True):
+        xs = (g[x] - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1) if \
+            pd.api.types.is_datetime64_any_dtype(g[x]) else g[x]
+        parts.append(g.iloc[lttb(xs.to_numpy(dtype=float), g[y].to_numpy(dtype=float), max_points)])
+    return pd.concat(parts, ignore_index=True) if parts else df.iloc[:0]
+
+
+def bucket_pivot(df: pd.DataFrame, value: str, n_cols: int = 400, x: str = 'timestamp_utc',
+                 by: str = 'instrument') -> pd.DataFrame:
+    """time-bucket x `by` mean of `value` with at most `n_cols` time columns (heatmaps)."""
+    if df.empty:
+        return pd.DataFrame()
+    span = df[x].max() - df[x].min()
+    width = max(pd.Timedelta(minutes=1), span / max(1, n_cols)).ceil('min')
+    return df.pivot_table(index=df[x].dt.floor(width), columns=by, values=value, aggfunc='mean', observed=True)
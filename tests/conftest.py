@@ -0,0 +1,50 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/conftest.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, time
+import pytest
+from bench.fakes import FakeDeribit, FakeVenues, load_recording
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture_path(name: str) -> str:
+    return os.path.join(FIXTURES, name)
+
+
+def wait_for(pred, timeout: float = 5.0, interval: float = 0.01) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(interval)
+    return pred()
+
+
+@pytest.fixture
+def deribit():
+    fake = FakeDeribit()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture(scope='session')
+def ws_recording():
+    return load_recording(fixture_path('deribit_ws_btc.json'))
+
+
+@pytest.fixture(scope='session')
+def venues_recording():
+    return load_recording(fixture_path('venues_btc.json'))
+
+
+@pytest.fixture(scope='session')
+def books_recording():
+    return load_recording(fixture_path('books_btc.json'))
+
+
+@pytest.fixture
+def venues(venues_recording, books_recording):
+    fake = FakeVenues(venues_recording, books_recording)
+    yield fake
+    fake.close()
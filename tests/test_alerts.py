@@ -0,0 +1,108 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_alerts.py
+# ───────────────────────────────────────────────────────────────────────────────
+import time, logging
+from email.utils import formatdate
+import pandas as pd
+import pytest
+from src import alerts
+from src.alerts import AlertDispatcher, retry_after_s
+from bench.fakes import FakeWebhooks
+
+CHANNELS = ['line', 'discord', 'telegram']
+
+
+@pytest.fixture
+def hooks(monkeypatch):
+    fake = FakeWebhooks()
+    for var in ('LINE_NOTIFY_TOKEN', 'DISCORD_WEBHOOK_URL', 'TELEGRAM_BOT_TOKEN', 'TELEGRAM_CHAT_ID'):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setattr(alerts, 'LINE_NOTIFY_URL', fake.urls['line'])
+    monkeypatch.setattr(alerts, 'TELEGRAM_API_URL', fake.urls['telegram'])
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def dispatcher(hooks):
+    made = []
+
+    def make(**kw):
+        conf = {'line_notify_token': 'tok', 'discord_webhook_url': hooks.urls['discord'],
+                'telegram_bot_token': 'bot', 'telegram_chat_id': '42'}
+        d = AlertDispatcher(conf, CHANNELS, **{'backoff_s': 0.05, **kw})
+        made.append(d)
+        return d
+    yield make
+    for d in made:
+        d.close(timeout=10)
+
+
+def _signals(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        'timestamp_utc': ['2024-01-01T00:00:00+00:00'] * n, 'exchange': 'deribit',
+        'instrument': [f"BTC-S{i:04d}" for i in range(n)], 'days_to_expiry': 30,
+        'apy_annual': 0.12, 'z_hist': 2.5, 'z_cross': 2.0, 'z_term': 2.1, 'apy_net': 0.11,
+        'side_hint': 'short_future_long_perp', 'signal_reason': 'z_hist',
+    })
+
+
+def test_one_batched_message_per_channel(hooks, dispatcher):
+    res = dispatcher().dispatch(_signals(5)).result(10)
+    assert res == {'line': 1, 'discord': 1, 'telegram': 1}
+    for ch, key in (('line', 'message'), ('discord', 'content'), ('telegram', 'text')):
+        (_, body), = hooks.received(ch)
+        assert body[key].startswith('[ARBI] 5 signal(s)')
+        assert all(f"BTC-S{i:04d}" in body[key] for i in range(5))
+
+
+def test_429_retry_after_seconds(hooks, dispatcher):
+    hooks.script['discord'] = [(429, {'Retry-After': '1'})]
+    d = dispatcher()
+    assert d.dispatch(_signals(1)).result(10)['discord'] == 1
+    (t0, _), (t1, _) = hooks.received('discord')
+    assert t1 - t0 >= 0.9
+    assert d.stats['retries'] == 1 and d.stats['failed'] == 0
+
+
+@pytest.mark.parametrize('when', [3, -60])
+def test_429_retry_after_http_date(hooks, dispatcher, when):
+    # A future date is honoured; a past one falls back to backoff and channel spacing (1s)
+    hooks.script['telegram'] = [(429, {'Retry-After': formatdate(time.time() + when, usegmt=True)})]
+    d = dispatcher()
+    assert d.dispatch(_signals(1)).result(10)['telegram'] == 1
+    (t0, _), (t1, _) = hooks.received('telegram')
+    assert (t1 - t0 >= 1.9) if when > 0 else (t1 - t0 < 1.5)
+    assert d.stats['retries'] == 1
+
+
+def test_retry_after_forms():
+    assert retry_after_s('3') == 3.0
+    assert retry_after_s('') is None and retry_after_s('soon') is None
+    assert 8 < retry_after_s(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert retry_after_s(formatdate(time.time() - 10, usegmt=True)) == 0.0
+
+
+def test_slow_channel_does_not_block_others(hooks, dispatcher):
+    hooks.delay_s['discord'] = 1.5
+    fut = dispatcher().dispatch(_signals(3))
+    assert fut.result(10) == {'line': 1, 'discord': 1, 'telegram': 1}
+    slow = hooks.done['discord'][0]
+    assert hooks.done['line'][0] < slow - 1.0
+    assert hooks.done['telegram'][0] < slow - 1.0
+
+
+def test_dispatch_errors_are_logged(dispatcher, caplog):
+    log = logging.getLogger('test_alerts')
+    d = dispatcher()
+    d.log = log
+
+    async def boom(parts):
+        raise RuntimeError('boom')
+    d._dispatch = boom
+    with caplog.at_level(logging.ERROR, logger='test_alerts'):
+        fut = d.dispatch(_signals(1))
+        with pytest.raises(RuntimeError):
+            fut.result(5)
+        time.sleep(0.05)   # done-callbacks run right after the result is set
+    assert any('Alert dispatch failed' in r.getMessage() for r in caplog.records)
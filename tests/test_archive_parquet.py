@@ -0,0 +1,119 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_archive_parquet.py
+# ───────────────────────────────────────────────────────────────────────────────
+import io, time, logging, threading
+from datetime import datetime, timezone
+import pandas as pd
+import pytest
+from src import archive_parquet
+from src.archive_parquet import archive_day, archive_range, default_target_date, uploaded
+from bench.fakes import FakeGoogleClients
+from src.history_store import HistoryStore
+from src.scheduler import _archive_due, _archive_last_date
+from src.utils_synthetic import synthetic_history
+
+LOG = logging.getLogger('test_archive')
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    return {
+        'sheet': {'spreadsheet_id': 'sheet', 'worksheet_name': 'live_metrics'},
+        'archive': {'drive_folder_id': 'folder', 'out_dir': str(tmp_path / 'out'),
+                    'history_dir': str(tmp_path / 'history'), 'upload_chunk_mb': 1, 'run_at_utc': '00:05'},
+    }
+
+
+def _fill(cfg, day: str, n_snapshots: int = 48):
+    h = synthetic_history(n_snapshots=n_snapshots, n_instruments=4, freq='30min', start=day)
+    HistoryStore.from_config(cfg).append(h)
+    return h
+
+
+def test_archive_day_skips_days_in_manifest(cfg):
+    day = str(default_target_date())
+    _fill(cfg, day)
+    gc = FakeGoogleClients()
+    first = archive_day(cfg, gc, day, LOG)
+    assert first is not None and uploaded(cfg, day)
+    assert archive_day(cfg, gc, day, LOG) is None
+    assert gc.fake_drive.calls['insert'] == 1
+    assert archive_day(cfg, gc, day, LOG, force=True) is not None
+    assert gc.fake_drive.calls['insert'] == 2
+
+
+def test_daemon_restart_does_not_rearchive_yesterday(cfg):
+    now = datetime.now(timezone.utc).replace(hour=12, minute=0)
+    assert _archive_last_date(cfg, now) is None
+    assert _archive_due(cfg, None, now)
+    _fill(cfg, str(default_target_date()))
+    archive_day(cfg, FakeGoogleClients(), default_target_date(), LOG)
+    last = _archive_last_date(cfg, now)
+    assert last == now.date()
+    assert not _archive_due(cfg, last, now)
+
+
+# ── resumable upload ───────────────────────────────────────────────────────────
+def _blob(tmp_path, mb: float = 2.5):
+    path = tmp_path / 'blob.bin'
+    path.write_bytes(bytes(range(256)) * int(mb * 4096))
+    return str(path)
+
+
+def test_upload_resumes_after_interrupted_chunk(tmp_path):
+    path = _blob(tmp_path)
+    gc = FakeGoogleClients()
+    gc.fake_drive.fail_chunks = {1: 3}   # more failures than the client's own retries
+    file_id = gc.upload_to_drive('folder', path, 'blob.bin', chunk_mb=1, num_retries=1, resume_backoff_s=0)
+    up = gc.fake_drive.uploads[file_id]
+    with open(path, 'rb') as f:
+        assert up['data'] == f.read()
+    assert gc.fake_drive.calls['chunk_error'] == 3
+    assert gc.fake_drive.calls['resume'] == 1
+    assert gc.fake_drive.calls['insert'] == 1
+
+
+def test_upload_gives_up_after_max_resumes(tmp_path):
+    from googleapiclient.errors import HttpError
+    gc = FakeGoogleClients()
+    gc.fake_drive.fail_chunks = {0: 100}
+    with pytest.raises(HttpError):
+        gc.upload_to_drive('folder', _blob(tmp_path), 'blob.bin', chunk_mb=1, num_retries=0,
+                           max_resumes=2, resume_backoff_s=0)
+    assert gc.fake_drive.calls['resume'] == 2
+    assert not gc.fake_drive.uploads
+
+
+# ── archive_range ──────────────────────────────────────────────────────────────
+DAYS = ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04']
+
+
+def test_archive_range_skips_manifest_days(cfg):
+    _fill(cfg, DAYS[0], n_snapshots=48 * 3)
+    gc = FakeGoogleClients()
+    assert set(archive_range(cfg, gc, DAYS[0], DAYS[1], LOG)) == set(DAYS[:2])
+    # Day 3 is new; days 1-2 are in the manifest and are not rebuilt or uploaded
+    assert set(archive_range(cfg, gc, DAYS[0], DAYS[2], LOG)) == {DAYS[2]}
+    assert gc.fake_drive.calls['insert'] == 3
+    assert set(archive_range(cfg, gc, DAYS[0], DAYS[2], LOG, force=True)) == set(DAYS[:3])
+    assert gc.fake_drive.calls['insert'] == 6
+
+
+def test_archive_range_builds_days_in_parallel(cfg, monkeypatch):
+    h = _fill(cfg, DAYS[0], n_snapshots=48 * len(DAYS))
+    threads, write_day = set(), archive_parquet.write_day
+
+    def tracked(*a, **kw):
+        threads.add(threading.get_ident())
+        time.sleep(0.05)
+        return write_day(*a, **kw)
+    monkeypatch.setattr(archive_parquet, 'write_day', tracked)
+    gc = FakeGoogleClients()
+    res = archive_range(cfg, gc, DAYS[0], DAYS[-1], LOG, workers=4)
+    assert len(threads) > 1
+    assert res == {d: int((h['timestamp_utc'].dt.strftime('%Y-%m-%d') == d).sum()) for d in DAYS}
+    # Uploads stay sequential and in date order, one file per day
+    titles = [u['title'] for u in gc.fake_drive.uploads.values()]
+    assert titles == [f"arbitrage_{d}.parquet" for d in DAYS]
+    for u in gc.fake_drive.uploads.values():
+        assert pd.read_parquet(io.BytesIO(u['data'])).shape[0] == res[u['title'][10:20]]
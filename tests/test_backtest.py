@@ -0,0 +1,112 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_backtest.py
+# ───────────────────────────────────────────────────────────────────────────────
+import numpy as np
+import pandas as pd
+import pytest
+from src.backtest import LOAD_COLUMNS, base_params, grid, outcomes, score, sweep
+from src.schema import coerce
+from src.scheduler import load_config
+from src.utils_synthetic import synthetic_history
+
+T0 = pd.Timestamp('2024-01-01', tz='UTC')
+
+
+def _book(instrument: str, basis_bp: list, flag: list) -> tuple:
+    # Spot and perp at 100; the future carries the given basis in bp
+    n = len(basis_bp)
+    df = pd.DataFrame({'timestamp_utc': T0 + pd.to_timedelta(np.arange(n), unit='h'), 'exchange': 'deribit',
+                       'instrument': instrument, 'spot_price': 100.0, 'perp_price': 100.0,
+                       'fut_price': 100.0 * (1 + np.asarray(basis_bp, dtype=float) / 1e4)})
+    flag = np.asarray(flag, dtype=bool)
+    sig = pd.DataFrame({'signal_flag': flag, 'alert': flag & ~np.r_[False, flag[:-1]]})
+    return df, sig
+
+
+@pytest.fixture
+def episodes():
+    # BTC-A (rich): two episodes, rows 1-3 (exit at row 4) and 6-7 (exit at row 8)
+    a = _book('BTC-A', [50, 50, 40, 30, 20, 20, 60, 55, 50, 50], [0, 1, 1, 1, 0, 0, 1, 1, 0, 0])
+    # BTC-B (cheap): active from row 2 to its last row, so still open at the end of the data
+    b = _book('BTC-B', [-30, -30, -30, -28, -27], [0, 0, 1, 1, 1])
+    df = pd.concat([a[0], b[0]], ignore_index=True)
+    sig = pd.concat([a[1], b[1]], ignore_index=True)
+    # Row order does not matter, as long as the signals stay aligned with their rows
+    shuffled = np.random.default_rng(0).permutation(len(df))
+    return df.iloc[shuffled].reset_index(drop=True), sig.iloc[shuffled].reset_index(drop=True)
+
+
+def test_outcomes_episodes(episodes):
+    res = outcomes(*episodes, fee_bp=2.0)
+    assert res['entries'] == 3 and res['alerts'] == 3 and res['flag_rows'] == 8
+    # Convergence in the trade's favour: 50 -> 20, 60 -> 50, and -30 -> -27 for the cheap side
+    assert res['conv_bp_total'] == pytest.approx(30 + 10 + 3)
+    assert res['conv_bp_median'] == pytest.approx(10)
+    assert res['hold_h_mean'] == pytest.approx((3 + 2 + 2) / 3)
+    assert res['open_at_end'] == 1
+    # A hit has to clear the round trip (2 x fee_bp): 3 bp does not
+    assert res['hit_rate'] == pytest.approx(2 / 3)
+
+
+def test_outcomes_max_hold_caps_episodes(episodes):
+    res = outcomes(*episodes, max_hold_hours=1, fee_bp=2.5)
+    # Every trade closes an hour in: 50 -> 40, 60 -> 55, -30 -> -28; the open one is closed by the cap
+    assert res['conv_bp_total'] == pytest.approx(10 + 5 + 2)
+    assert res['hold_h_mean'] == pytest.approx(1)
+    assert res['open_at_end'] == 0
+    # Strictly above 2 x 2.5 bp: the 5 bp trade is not a hit
+    assert res['hit_rate'] == pytest.approx(1 / 3)
+    # A cap longer than every episode changes nothing
+    assert outcomes(*episodes, max_hold_hours=24) == outcomes(*episodes)
+
+
+def test_outcomes_since_counts_only_later_entries(episodes):
+    res = outcomes(*episodes, since=T0 + pd.Timedelta(hours=5))
+    assert res['entries'] == 1 and res['alerts'] == 1 and res['flag_rows'] == 2
+    assert res['conv_bp_total'] == pytest.approx(10) and res['open_at_end'] == 0
+    none = outcomes(*episodes, since=T0 + pd.Timedelta(hours=9))
+    assert none['entries'] == 0 and np.isnan(none['hit_rate']) and none['open_at_end'] == 0
+
+
+def test_grid_rejects_unknown_parameters():
+    base = base_params(load_config())
+    assert len(grid(base, {'z_hist_enter': [1.5, 2.0], 'debounce_minutes': 30})) == 2
+    assert grid(base) == [base]
+    with pytest.raises(ValueError, match='Unknown sweep parameter.*z_hist_entr'):
+        grid(base, {'z_hist_entr': [1.5]})
+
+
+@pytest.fixture(scope='module')
+def replay():
+    cfg = load_config()
+    data = coerce(synthetic_history(n_snapshots=24 * 5, n_instruments=4), columns=LOAD_COLUMNS)
+    base = {**base_params(cfg), 'apy_net_min': 0.0, 'apy_net_exit': 0.0, 'liq_depth_min_bp': None,
+            'term_method': 'kernel', 'lookback_days_for_hist_z': 2, 'min_history_rows_per_expiry': 24,
+            **{f"{r}_{k}": 1.0 for r in ('z_hist', 'z_cross', 'z_term') for k in ('enter', 'exit')}}
+    return cfg, data, base
+
+
+def test_sweep_serial_matches_process_pool(replay):
+    cfg, data, base = replay
+    configs = grid(base, {'lookback_days_for_hist_z': [1, 2], 'z_hist_enter': [1.0, 1.5], 'max_hold_hours': [6, 48]})
+    since = data['timestamp_utc'].min() + pd.Timedelta(days=2)
+    serial = sweep(data, configs, cfg['term_curve_bins'], since=since, workers=1)
+    pooled = sweep(data, configs, cfg['term_curve_bins'], since=since, workers=2)
+    pd.testing.assert_frame_equal(pooled, serial)
+    assert len(serial) == len(configs) and (serial['entries'] > 0).all()
+    assert serial[['lookback_days_for_hist_z', 'z_hist_enter', 'max_hold_hours']].to_dict('records') == \
+        [{k: c[k] for k in ('lookback_days_for_hist_z', 'z_hist_enter', 'max_hold_hours')} for c in configs]
+
+
+def test_score_uses_only_trailing_data(replay):
+    cfg, data, base = replay
+    cut = data['timestamp_utc'].unique()[72]
+    late = (data['timestamp_utc'] >= cut).to_numpy()
+    shocked = data.copy()
+    # Reshape the later term structure: a curve fitted over the whole replay would move earlier z_term
+    shocked.loc[late, 'fut_price'] *= 1 + 0.002 * shocked.loc[late, 'days_to_expiry'].to_numpy()
+    a = score(data, base, cfg['term_curve_bins'])
+    b = score(shocked, base, cfg['term_curve_bins'])
+    cols = ['z_hist', 'z_cross', 'z_term', 'apy_net']
+    pd.testing.assert_frame_equal(a.loc[~late, cols], b.loc[~late, cols])
+    assert a.loc[~late, 'z_term'].notna().any()
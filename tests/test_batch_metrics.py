@@ -0,0 +1,63 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_batch_metrics.py
+# ───────────────────────────────────────────────────────────────────────────────
+import numpy as np
+import pandas as pd
+import pytest
+from src.batch_metrics import compute_metrics_batch
+from src.compute_metrics import compute_all_metrics
+from src.schema import coerce
+from src.stats_state import StatsState
+from src.utils_synthetic import synthetic_history
+from src.utils_termcurve import TermCurveCache
+
+TERM_BINS = [0, 7, 14, 30, 60, 90, 180, 365]
+LOOKBACK_DAYS, MIN_ROWS = 2, 24
+COLS = ['spread', 'apy_annual', 'z_cross', 'z_hist', 'z_term', 'apy_net']
+
+
+def _history(n: int = 120) -> pd.DataFrame:
+    h = synthetic_history(n_snapshots=n, n_instruments=4, start='2024-01-01')
+    h['exchange'] = 'deribit'
+    return coerce(h, columns=list(h.columns))   # typed as the history store returns it
+
+
+def _replay(h: pd.DataFrame, method: str) -> pd.DataFrame:
+    # What the scheduler does each hour: score the snapshot against the rows stored before it
+    state = StatsState(LOOKBACK_DAYS, MIN_ROWS, bucket_s=3600)
+    curves = TermCurveCache(method=method, term_bins=TERM_BINS)
+    out = []
+    for t in sorted(h['timestamp_utc'].unique()):
+        snap, before = h[h['timestamp_utc'] == t], h[h['timestamp_utc'] < t]
+        out.append(compute_all_metrics(snap, before, TERM_BINS, lookback_days_for_hist_z=LOOKBACK_DAYS,
+                                       min_history_rows_per_expiry=MIN_ROWS, stats_state=state,
+                                       term_curve=curves))
+    return pd.concat(out)
+
+
+@pytest.mark.parametrize('method', ['lowess', 'kernel'])
+def test_batch_matches_live_replay_row_by_row(method):
+    h = _history()
+    live = _replay(h, method)
+    batch = compute_metrics_batch(h, TERM_BINS, lookback_days_for_hist_z=LOOKBACK_DAYS,
+                                  min_history_rows_per_expiry=MIN_ROWS, term_method=method)
+    assert batch.index.equals(live.index)
+    for col in COLS:
+        np.testing.assert_allclose(batch[col].to_numpy(dtype=float), live[col].to_numpy(dtype=float),
+                                   rtol=1e-6, atol=1e-6, equal_nan=True, err_msg=col)
+    assert live['z_term'].notna().mean() > 0.9
+    assert live['z_hist'].notna().any()
+
+
+def test_no_lookahead():
+    # Rewriting the future leaves every earlier row's metrics unchanged
+    h = _history()
+    cut = h['timestamp_utc'].unique()[80]
+    shocked = h.copy()
+    late = shocked['timestamp_utc'] >= cut
+    shocked.loc[late, 'fut_price'] *= 1.05
+    a = compute_metrics_batch(h, TERM_BINS, lookback_days_for_hist_z=LOOKBACK_DAYS, min_history_rows_per_expiry=MIN_ROWS)
+    b = compute_metrics_batch(shocked, TERM_BINS, lookback_days_for_hist_z=LOOKBACK_DAYS,
+                              min_history_rows_per_expiry=MIN_ROWS)
+    pd.testing.assert_frame_equal(a.loc[~late, COLS], b.loc[~late, COLS])
+    assert not np.allclose(a.loc[late, 'z_term'], b.loc[late, 'z_term'], equal_nan=True)
@@ -0,0 +1,186 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_connectors.py
+# ───────────────────────────────────────────────────────────────────────────────
+import asyncio
+from itertools import combinations
+import aiohttp
+import numpy as np
+import pandas as pd
+import pytest
+from src.connectors import LEG_COLUMNS, Connector, DeribitConnector, make_connector
+from src.basis_engine import BasisEngine, align, basis_matrix, basis_pairs, PAIR_EXCHANGE
+
+VENUES = ('deribit', 'okx', 'binance_cm')
+
+
+def _run(conn, method: str, *args):
+    async def go():
+        async with aiohttp.ClientSession() as http:
+            return await getattr(conn, method)(http, *args)
+    return asyncio.run(go())
+
+
+def _legs(venues, name: str, base: str = 'BTC') -> pd.DataFrame:
+    return _run(make_connector(name, api=venues.urls[name]), 'fetch_legs', base, 'USD')
+
+
+@pytest.fixture
+def all_legs(venues):
+    return pd.concat([_legs(venues, v) for v in VENUES], ignore_index=True)
+
+
+def test_deribit_legs(venues, venues_recording):
+    df = _legs(venues, 'deribit')
+    assert list(df.columns) == LEG_COLUMNS
+    assert set(df['instrument']) == {'BTC-23OCT26', 'BTC-30OCT26', 'BTC-25DEC26', 'BTC-PERPETUAL'}
+    # BTC-6NOV26 isn't in the cached instruments: one refresh, then the leg is skipped
+    assert venues.calls['/api/v2/public/get_instruments'] == 2
+    r = df.set_index('instrument')
+    assert r.at['BTC-PERPETUAL', 'kind'] == 'perpetual' and pd.isna(r.at['BTC-PERPETUAL', 'expiry_ts'])
+    assert r.at['BTC-25DEC26', 'expiry_ts'] == 1798185600000
+    assert r.at['BTC-30OCT26', 'price'] == 67142.5   # no trade yet: mark price
+    assert (df['index_price'] == 67012.35).all()
+    assert r.at['BTC-23OCT26', 'quote_ts'] == venues_recording['recorded_at_ms'] - 180
+
+
+def test_okx_legs(venues):
+    df = _legs(venues, 'okx')
+    assert list(df.columns) == LEG_COLUMNS
+    # preopen and untraded contracts are dropped; the swap is the perp
+    r = df.set_index('instrument')
+    assert list(r.index) == ['BTC-USD-261023', 'BTC-USD-261225', 'BTC-USD-SWAP']
+    assert r.at['BTC-USD-SWAP', 'kind'] == 'perpetual' and pd.isna(r.at['BTC-USD-SWAP', 'expiry_ts'])
+    assert r.at['BTC-USD-261225', 'expiry_ts'] == 1798185600000
+    assert r.at['BTC-USD-261023', 'price'] == 67076.4
+    assert (df['index_price'] == 67010.8).all() and (df['exchange'] == 'okx').all()
+
+
+def test_okx_error_code_raises(venues):
+    with pytest.raises(RuntimeError, match='51001'):
+        _legs(venues, 'okx', base='ETH')
+
+
+def test_binance_legs(venues):
+    df = _legs(venues, 'binance_cm')
+    r = df.set_index('instrument')
+    # other pairs and settling contracts are filtered out of the metadata
+    assert set(r.index) == {'BTCUSD_PERP', 'BTCUSD_261225', 'BTCUSD_270326'}
+    assert r.at['BTCUSD_PERP', 'kind'] == 'perpetual' and pd.isna(r.at['BTCUSD_PERP', 'expiry_ts'])
+    assert r.at['BTCUSD_270326', 'expiry_ts'] == 1806048000000
+    assert r.at['BTCUSD_261225', 'price'] == 67795.2
+    assert (df['index_price'] == 67011.9).all()
+
+
+def test_instruments_cached_within_ttl(venues):
+    conn = make_connector('okx', api=venues.urls['okx'])
+    _run(conn, 'fetch_legs', 'BTC', 'USD')
+    _run(conn, 'fetch_legs', 'BTC', 'USD')
+    assert venues.calls['/api/v5/public/instruments'] == 1
+    assert venues.calls['/api/v5/market/tickers'] == 4
+
+
+def test_unknown_venue():
+    with pytest.raises(ValueError, match='Unknown venue'):
+        make_connector('ftx')
+
+
+def test_incomplete_venue_fails_at_construction():
+    class NoBooks(Connector):
+        name = 'nobooks'
+        default_api = 'http://127.0.0.1:1'
+
+        async def _instruments(self, http, base, quote):
+            return {}
+
+        async def fetch_legs(self, http, base, quote):
+            return self._frame(base, quote, [])
+
+        def perp_instrument(self, base, quote):
+            return f"{base}-PERP"
+
+    with pytest.raises(TypeError, match='fetch_book'):
+        NoBooks()
+    with pytest.raises(TypeError):
+        Connector()
+    assert DeribitConnector().name == 'deribit'
+
+
+def test_align_drops_stale_legs(all_legs, venues_recording):
+    now = venues_recording['recorded_at_ms']
+    kept, skew = align(all_legs, now, max_skew_ms=5000)
+    # BTCUSD_270326 last traded 12 s before the others
+    assert set(all_legs['instrument']) - set(kept['instrument']) == {'BTCUSD_270326'}
+    assert set(skew) == set(VENUES)
+    ref = np.median(all_legs['quote_ts'].astype(float))
+    bn = all_legs.loc[all_legs['exchange'] == 'binance_cm', 'quote_ts'].astype(float)
+    assert skew['binance_cm'] == pytest.approx(np.median(bn - ref))
+    assert len(align(all_legs, now, max_skew_ms=60_000)[0]) == len(all_legs)
+
+
+def test_align_missing_quote_time_counts_as_now(all_legs, venues_recording):
+    now = venues_recording['recorded_at_ms']
+    legs = all_legs.copy()
+    legs.loc[legs['instrument'] == 'BTC-25DEC26', 'quote_ts'] = None
+    kept, _ = align(legs, now + 60_000, max_skew_ms=5000)
+    assert 'BTC-25DEC26' not in set(kept['instrument'])
+    kept, _ = align(legs, now, max_skew_ms=5000)
+    assert 'BTC-25DEC26' in set(kept['instrument'])
+
+
+def _expected_pairs(legs: pd.DataFrame, scope: str) -> int:
+    perp = (legs['kind'] == 'perpetual').to_numpy()
+    ex = legs['exchange'].to_numpy()
+    return sum(1 for a, b in combinations(range(len(legs)), 2)
+               if not (perp[a] and perp[b]) and (scope == 'all' or ex[a] != ex[b]))
+
+
+@pytest.mark.parametrize('scope', ['cross', 'all'])
+def test_basis_pairs(all_legs, venues_recording, scope):
+    now = venues_recording['recorded_at_ms']
+    legs, _ = align(all_legs, now, max_skew_ms=5000)
+    pairs = basis_pairs(legs, 'ts', now, scope=scope)
+    assert len(pairs) == _expected_pairs(legs, scope)
+    assert (pairs['exchange'] == PAIR_EXCHANGE).all()
+    near, far = (pairs['instrument'].str.split('/', expand=True)[k] for k in (1, 0))
+    perps = {f"{v}:{i}" for v, i in zip(legs['exchange'], legs['instrument'])
+             if i.endswith(('PERPETUAL', 'SWAP', 'PERP'))}
+    # A perp is always the near leg, and then it is both spot and perp price
+    assert not far.isin(perps).any()
+    fp = pairs[near.isin(perps)]
+    assert (fp['instrument_type'] == 'fut_perp').all() and (fp['perp_price'] == fp['spot_price']).all()
+    if scope == 'cross':
+        assert (near.str.split(':').str[0] != far.str.split(':').str[0]).all()
+    else:
+        assert 'deribit:BTC-25DEC26/deribit:BTC-23OCT26' in set(pairs['instrument'])
+
+    r = pairs.set_index('instrument')
+    # Same expiry on two venues converges at expiry; a calendar pair carries over the gap
+    same = r.loc['okx:BTC-USD-261225/deribit:BTC-25DEC26']
+    assert same['days_to_expiry'] == pytest.approx((1798185600000 - now) / 86_400_000)
+    assert (same['fut_price'], same['spot_price']) == (67798.9, 67810.0)
+    cal = r.loc['binance_cm:BTCUSD_261225/okx:BTC-USD-261023']
+    assert cal['days_to_expiry'] == pytest.approx((1798185600000 - 1792742400000) / 86_400_000)
+    assert cal['instrument_type'] == 'fut_fut'
+
+    # Annualized pair basis matches the dense matrix cell (long near / short far)
+    m = basis_matrix(legs, now)
+    apy = (r['fut_price'] / r['spot_price'] - 1) * 365 / r['days_to_expiry']
+    cells = [m.at[n, f] for n, f in zip(near, far)]
+    np.testing.assert_allclose(apy.to_numpy(), cells, rtol=1e-12)
+
+
+def test_engine_snapshot(venues):
+    eng = BasisEngine(VENUES, pairs='cross', apis=venues.urls)
+    try:
+        snap = eng.snapshot('BTC', 'USD')
+    finally:
+        eng.close()
+    info = eng.last['BTC']
+    assert info['binance_cm']['dropped'] == 1 and info['deribit']['dropped'] == 0
+    assert {k: v['legs'] for k, v in info.items()} == {'deribit': 4, 'okx': 3, 'binance_cm': 2}
+    venue_rows = snap[snap['exchange'] != PAIR_EXCHANGE]
+    assert len(venue_rows) == 3 + 2 + 1   # futures only, each against its venue's perp
+    assert venue_rows.groupby('exchange')['perp_price'].first().to_dict() == \
+        {'binance_cm': 67028.4, 'deribit': 67025.5, 'okx': 67030.1}
+    assert (snap['exchange'] == PAIR_EXCHANGE).sum() > 0
+    assert snap['timestamp_utc'].nunique() == 1
@@ -0,0 +1,74 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_data_layer.py
+# ───────────────────────────────────────────────────────────────────────────────
+import pandas as pd
+import pytest
+from src.history_store import HistoryStore
+from src.utils_synthetic import synthetic_history
+from streamlit_app import data_layer
+from streamlit_app.data_layer import LiveFrame
+
+
+@pytest.fixture
+def store(tmp_path):
+    data_layer.load_window.clear()
+    data_layer._dataset.clear()
+    st = HistoryStore(str(tmp_path / 'history'))
+    start = (pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=5, hours=3)).floor('h')   # leaves room for deltas
+    h = synthetic_history(n_snapshots=5 * 24, n_instruments=3, freq='h', start=str(start.tz_localize(None)))
+    st.append(h)
+    return st, h
+
+
+def test_first_refresh_loads_only_the_lookback(store):
+    st, h = store
+    live = LiveFrame(st.root, max_hours=336, min_interval_s=0)
+    live.refresh(24)
+    now = pd.Timestamp.now(tz='UTC')
+    assert live.df['timestamp_utc'].min() >= now - pd.Timedelta(hours=25)
+    assert len(live.df) == int((h['timestamp_utc'] >= live.start).sum())
+
+
+def test_longer_lookback_extends_back_without_duplicates(store):
+    st, h = store
+    live = LiveFrame(st.root, max_hours=336, min_interval_s=0)
+    live.refresh(24)
+    n24 = len(live.df)
+    live.refresh(72)
+    assert len(live.df) > n24
+    assert not live.df.duplicated(['timestamp_utc', 'instrument']).any()
+    assert live.df['timestamp_utc'].is_monotonic_increasing
+    assert len(live.df) == int((h['timestamp_utc'] >= live.start).sum())
+
+
+def test_new_part_files_arrive_as_deltas(store):
+    st, h = store
+    live = LiveFrame(st.root, max_hours=336, min_interval_s=0)
+    live.refresh(48)
+    n = len(live.df)
+    nxt = synthetic_history(n_snapshots=2, n_instruments=3, freq='h',
+                            start=str((h['timestamp_utc'].max() + pd.Timedelta(hours=1)).tz_localize(None)))
+    st.append(nxt)
+    assert live.refresh(48) == len(nxt)
+    assert len(live.df) == n + len(nxt)
+
+
+def test_rollup_loaders_use_rollups_readers(tmp_path):
+    from src.rollups import Rollups
+    data_layer.load_rollup.clear()
+    data_layer.load_zcross.clear()
+    h = synthetic_history(n_snapshots=72, n_instruments=3, freq='h', start='2024-01-01')
+    for c in ('z_hist', 'z_cross', 'z_term', 'apy_net'):
+        h[c] = h['apy_annual']
+    h['exchange'] = 'deribit'
+    r = Rollups(str(tmp_path / 'rollups'))
+    r.update(h)
+    r.flush()
+    start, end = pd.Timestamp('2024-01-01 06:00', tz='UTC'), pd.Timestamp('2024-01-02 12:00', tz='UTC')
+    got = data_layer.load_rollup(r.root, start.to_pydatetime(), end.to_pydatetime(), 'h', 'BTC')
+    want = r.read(start, end, freq='h', base='BTC').sort_values('bucket', kind='stable', ignore_index=True)
+    pd.testing.assert_frame_equal(got, want)
+    assert got['bucket'].min() == start and got['bucket'].max() == end
+    z = data_layer.load_zcross(r.root, start.to_pydatetime(), end.to_pydatetime(), 'h')
+    pd.testing.assert_frame_equal(z, r.read_zcross(start, end))
+    assert len(data_layer.load_zcross(r.root, start.to_pydatetime(), end.to_pydatetime(), 'D')) == 2
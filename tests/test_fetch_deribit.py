@@ -0,0 +1,76 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_fetch_deribit.py
+# ───────────────────────────────────────────────────────────────────────────────
+import pytest
+from src import fetch_deribit
+from src.fetch_deribit import fetch_spot_perp_future_prices, get_future_instruments
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    fetch_deribit._instruments_cache.clear()
+    yield
+    fetch_deribit._instruments_cache.clear()
+
+
+def _fetch(deribit, **kw):
+    return fetch_spot_perp_future_prices('BTC', 'USD', api=deribit.url, **kw)
+
+
+def _perp(deribit):
+    return next(it for it in deribit.curves['BTC'] if it['instrument_name'] == 'BTC-PERPETUAL')
+
+
+def test_bulk_mode(deribit):
+    df = _fetch(deribit, mode='bulk')
+    futs = [it for it in deribit.curves['BTC'] if it['settlement_period'] != 'perpetual']
+    assert list(df['instrument']) == [it['instrument_name'] for it in futs]
+    assert list(df['fut_price']) == [it['price'] for it in futs]
+    assert (df['perp_price'] == _perp(deribit)['price']).all()
+    assert (df['spot_price'] == deribit.SPOT['BTC']).all()
+    assert (df['days_to_expiry'] >= 1).all() and df['quote_ts'].notna().all()
+    assert deribit.calls['get_book_summary_by_currency'] == 1 and deribit.calls['ticker'] == 0
+
+
+def test_ticker_mode_matches_bulk(deribit):
+    bulk = _fetch(deribit, mode='bulk')
+    tick = _fetch(deribit, mode='ticker')
+    assert deribit.calls['ticker'] == len(deribit.curves['BTC'])   # futures + perp, one request each
+    cols = ['instrument', 'expiry_ts', 'spot_price', 'perp_price', 'fut_price']
+    assert tick[cols].equals(bulk[cols])
+
+
+def test_unknown_mode(deribit):
+    with pytest.raises(ValueError, match='Unknown Deribit fetch mode'):
+        _fetch(deribit, mode='websocket')
+
+
+def test_instruments_cached_within_ttl(deribit):
+    _fetch(deribit)
+    _fetch(deribit)
+    assert deribit.calls['get_instruments'] == 1
+    _fetch(deribit, instruments_ttl_s=0)
+    assert deribit.calls['get_instruments'] == 2
+
+
+def test_new_listing_refreshes_metadata(deribit):
+    _fetch(deribit)
+    deribit.set_curve(10)
+    df = _fetch(deribit)
+    assert deribit.calls['get_instruments'] == 2 and len(df) == 10
+
+
+def test_expired_instrument_skipped_in_ticker_mode(deribit):
+    _fetch(deribit, mode='ticker')
+    gone = deribit.curves['BTC'].pop(0)['instrument_name']   # expired since the metadata was cached
+    df = _fetch(deribit, mode='ticker')
+    assert gone not in set(df['instrument']) and len(df) == len(deribit.curves['BTC']) - 1
+    assert gone not in get_future_instruments('BTC', api=deribit.url)   # metadata refreshed
+    assert deribit.calls['get_instruments'] == 2
+
+
+@pytest.mark.parametrize('mode', ['bulk', 'ticker'])
+def test_missing_perp_is_a_clear_error(deribit, mode):
+    deribit.curves['BTC'] = [it for it in deribit.curves['BTC'] if it['instrument_name'] != 'BTC-PERPETUAL']
+    with pytest.raises(RuntimeError, match='no BTC-PERPETUAL quote'):
+        _fetch(deribit, mode=mode)
@@ -0,0 +1,130 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_funding.py
+# ───────────────────────────────────────────────────────────────────────────────
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from src import funding
+from src.backtest import LOAD_COLUMNS, base_params, evaluate, score, with_funding
+from bench.fakes import FakeDeribit
+from src.funding import HOUR_MS, FundingCache, perp_instrument
+from src.schema import coerce
+from src.scheduler import load_config
+from src.utils_synthetic import synthetic_history
+
+
+@pytest.fixture
+def requests_seen(monkeypatch):
+    """Query params of every get_funding_rate_history request."""
+    seen = []
+
+    def spy(url, params=None, **kw):
+        seen.append(dict(params))
+        return get(url, params, **kw)
+    get = funding._get
+    monkeypatch.setattr(funding, '_get', spy)
+    return seen
+
+
+def _cache(deribit, tmp_path, **kw):
+    kw = {'backfill_days': 2, 'window_hours': 3, **kw}
+    return FundingCache(str(tmp_path / 'funding'), api=deribit.url, **kw)
+
+
+def test_update_fetches_only_after_cached_tail(deribit, tmp_path, requests_seen):
+    now = int(time.time() * 1000)
+    fc = _cache(deribit, tmp_path)
+    earlier = now - 5 * HOUR_MS
+    n0 = fc.update('BTC', now_ms=earlier)
+    h = fc.history(perp_instrument('BTC'))
+    last = int(h['timestamp'].iat[-1])
+    assert n0 == len(h) and last == earlier // HOUR_MS * HOUR_MS
+    assert requests_seen[0]['start_timestamp'] == earlier - fc.backfill_ms
+
+    n1 = fc.update('BTC', now_ms=now)
+    assert len(requests_seen) == 2
+    assert requests_seen[1]['start_timestamp'] == last + 1 and requests_seen[1]['instrument_name'] == 'BTC-PERPETUAL'
+    assert n1 == now // HOUR_MS - last // HOUR_MS
+    h = fc.history(perp_instrument('BTC'))
+    assert h['timestamp'].is_unique and h['timestamp'].is_monotonic_increasing
+    np.testing.assert_allclose(h['interest_1h'], [FakeDeribit.funding_1h(t // HOUR_MS) for t in h['timestamp']])
+
+
+def test_no_request_until_next_record_is_due(deribit, tmp_path, requests_seen):
+    now = int(time.time() * 1000)
+    fc = _cache(deribit, tmp_path)
+    fc.update('BTC', now_ms=now)
+    calls = deribit.calls['get_funding_rate_history']
+    assert fc.update('BTC', now_ms=now) == 0
+    assert fc.estimate('BTC') > 0
+    # A restart reads the cache from disk and is just as quiet
+    fc2 = _cache(deribit, tmp_path)
+    assert fc2.update('BTC', now_ms=now) == 0
+    assert deribit.calls['get_funding_rate_history'] == calls and len(requests_seen) == 1
+
+
+def test_estimate_rows_as_of_each_row(deribit, tmp_path):
+    now = int(time.time() * 1000)
+    fc = _cache(deribit, tmp_path)
+    fc.update('BTC', now_ms=now)
+    h = fc.history(perp_instrument('BTC'))
+    first, last = int(h['timestamp'].iat[0]), int(h['timestamp'].iat[-1])
+    hour = last // HOUR_MS - 10
+    ts = [hour * HOUR_MS + 30 * 60_000,          # between records: the one before
+          (hour + 1) * HOUR_MS,                  # exactly on a record
+          first - 60_000,                        # before the cache
+          hour * HOUR_MS]
+    df = pd.DataFrame({'timestamp_utc': pd.to_datetime(ts, unit='ms', utc=True),
+                       'exchange': ['deribit', 'deribit', 'deribit', 'okx'],
+                       'base': ['BTC', 'BTC', 'BTC', 'BTC']})
+    # Trailing 3h mean of the hourly records at or before each row
+    mean3 = lambda hr: np.mean([FakeDeribit.funding_1h(k) for k in range(hr - 2, hr + 1)])
+    np.testing.assert_allclose(fc.estimate_rows(df), [mean3(hour), mean3(hour + 1), 0.0, 0.0])
+    eth = df.assign(base='ETH')
+    assert (fc.estimate_rows(eth) == 0).all()   # nothing cached for ETH
+
+
+@pytest.fixture
+def replay(tmp_path):
+    cfg = load_config()
+    cfg['state'] = {**cfg['state'], 'dir': str(tmp_path / 'state')}
+    data = coerce(synthetic_history(n_snapshots=24 * 10, n_instruments=4), columns=LOAD_COLUMNS)
+    params = {**base_params(cfg), 'apy_net_min': 0.0, 'apy_net_exit': 0.0, 'liq_depth_min_bp': None, 'fee_bp_est': 0.5,
+              **{f"{r}_{k}": 1.0 for r in ('z_hist', 'z_cross', 'z_term') for k in ('enter', 'exit')}}
+    return cfg, data, params
+
+
+def test_backtest_costs_funding_like_live(replay):
+    cfg, data, params = replay
+    # ~8%/yr of carry against ~17.5%/yr of funding on half the rows
+    rate = np.where(np.arange(len(data)) % 2, 2e-5, 0.0)
+    data = data.assign(funding_est_hourly=rate)
+    scored = score(data, params, cfg['term_curve_bins'])
+    want = scored['apy_annual'] - params['fee_bp_est'] / 1e4 * 365 - rate * 24 * 365
+    np.testing.assert_allclose(scored['apy_net'], want, rtol=1e-5, atol=1e-6)
+
+    # Re-costing fees keeps the funding term: same outcome as scoring with that fee directly
+    p1 = {**params, 'fee_bp_est': 1.0}
+    res = evaluate(scored, p1)
+    assert res == evaluate(score(data, p1, cfg['term_curve_bins']), p1)
+    no_funding = evaluate(score(data.drop(columns='funding_est_hourly'), p1, cfg['term_curve_bins']), p1)
+    assert 0 < res['flag_rows'] < no_funding['flag_rows']
+
+
+def test_with_funding_reads_the_cache(replay, deribit):
+    cfg, data, _ = replay
+    cfg['funding'] = {**cfg.get('funding', {}), 'enabled': True, 'window_hours': 3, 'backfill_days': 14,
+                      'retain_days': 30}
+    cfg.setdefault('venues', {})['api_urls'] = {'deribit': deribit.url}
+    t0 = data['timestamp_utc'].min()
+    now = int((t0 + pd.Timedelta(days=12)).timestamp() * 1000)
+    fc = FundingCache.from_config(cfg)
+    fc.update('BTC', now_ms=now)
+    calls = deribit.calls['get_funding_rate_history']
+    out = with_funding(data, cfg)
+    assert deribit.calls['get_funding_rate_history'] == calls   # cached history only
+    np.testing.assert_allclose(out['funding_est_hourly'], fc.estimate_rows(data))
+    assert (out['funding_est_hourly'] > 0).all()
+    cfg['funding']['enabled'] = False
+    assert 'funding_est_hourly' not in with_funding(data, cfg).columns
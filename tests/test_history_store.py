@@ -0,0 +1,45 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_history_store.py
+# ───────────────────────────────────────────────────────────────────────────────
+import pandas as pd
+import pytest
+from src.history_store import HistoryStore
+from src.utils_synthetic import synthetic_history
+
+
+def _store(tmp_path, n_snapshots: int = 24):
+    store = HistoryStore(str(tmp_path / 'history'))
+    h = synthetic_history(n_snapshots=n_snapshots, n_instruments=4, start='2024-01-01')
+    store.append(h.iloc[:len(h) // 2])
+    store.append(h.iloc[len(h) // 2:])
+    return store, h
+
+
+def test_replace_day_with_empty_frame_keeps_partition(tmp_path):
+    store, h = _store(tmp_path)
+    before = store.files('2024-01-01')
+    assert store.replace_day('2024-01-01', pd.DataFrame()) == 0
+    assert store.replace_day('2024-01-01', h.iloc[0:0]) == 0
+    assert store.files('2024-01-01') == before
+    assert len(store.read_day('2024-01-01')) == len(h)
+
+
+def test_compact_day_merges_parts(tmp_path):
+    store, h = _store(tmp_path)
+    assert len(store.files('2024-01-01')) == 2
+    assert store.compact_day('2024-01-01') == len(h)
+    assert len(store.files('2024-01-01')) == 1
+    assert len(store.read_day('2024-01-01')) == len(h)
+
+
+def test_replace_day_rejects_other_dates(tmp_path):
+    store, h = _store(tmp_path, n_snapshots=48)   # hourly snapshots over two days
+    assert store.dates() == ['2024-01-01', '2024-01-02']
+    n = len(store.read())
+    with pytest.raises(ValueError, match='2024-01-02'):
+        store.replace_day('2024-01-01', h)
+    assert len(store.read()) == n
+    day = h[h['timestamp_utc'].dt.strftime('%Y-%m-%d') == '2024-01-01']
+    assert store.replace_day('2024-01-01', day) == len(day)
+    assert len(store.files('2024-01-01')) == 1
+    assert len(store.read()) == n
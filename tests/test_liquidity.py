@@ -0,0 +1,160 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_liquidity.py
+# ───────────────────────────────────────────────────────────────────────────────
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+from src.basis_engine import PAIR_EXCHANGE
+from src.history_store import HistoryStore
+from src.liquidity import (LIQ_COLUMNS, LiquidityEngine, book_metrics, depth_within, executable_basis_bp,
+                           pad_books, walk)
+from src.signals import SignalEngine
+from src.utils_synthetic import synthetic_history
+
+LOG = logging.getLogger('test_liquidity')
+VENUES = ('deribit', 'okx', 'binance_cm')
+THRESHOLDS = {'z_hist_enter': 2.0, 'z_cross_enter': 1.8, 'z_term_enter': 2.0, 'apy_net_min': 0.0,
+              'liq_depth_min_bp': 5}
+
+
+@pytest.fixture
+def engine(venues, books_recording):
+    exp = books_recording['expected']
+    eng = LiquidityEngine(VENUES, notional_usd=exp['notional_usd'], band_bp=exp['band_bp'], depth=20,
+                          apis=venues.urls, log=LOG)
+    yield eng
+    eng.close()
+
+
+def _leg(label: str) -> tuple:
+    venue, inst = label.split(':', 1)
+    return venue, 'BTC', 'USD', inst
+
+
+def _candidates(rows: list) -> pd.DataFrame:
+    """Metrics rows for (far, near, rich) legs: a venue future vs its perp, or a cross-venue pair."""
+    out = []
+    for r in rows:
+        (fv, _, _, fi), (nv, _, _, ni) = _leg(r['far']), _leg(r['near'])
+        pair = fv != nv
+        out.append({'exchange': PAIR_EXCHANGE if pair else fv, 'base': 'BTC', 'quote': 'USD',
+                    'instrument': f"{r['far']}/{r['near']}" if pair else fi,
+                    'spread': 50.0 if r['rich'] else -50.0, 'z_hist': 3.0, 'z_cross': 0.5, 'z_term': 0.5,
+                    'apy_net': 0.08, 'timestamp_utc': '2026-10-16T12:00:00+00:00'})
+    return pd.DataFrame(out)
+
+
+def test_walk_and_depth_by_hand():
+    px = np.array([[100.0, 101.0, np.nan]])
+    usd = np.array([[50.0, 100.0, 0.0]])
+    # 50 at 100 and 50 at 101: USD paid over coins received
+    assert walk(px, usd, 100.0)[0] == pytest.approx(100.0 / (0.5 + 50.0 / 101.0))
+    assert walk(px, usd, 50.0)[0] == 100.0
+    assert np.isnan(walk(px, usd, 151.0)[0])   # deeper than the fetched levels
+    mid = np.array([100.5])
+    assert depth_within(px, usd, mid, 50)[0] == 150.0
+    assert depth_within(px, usd, mid, 49)[0] == 0.0
+
+
+def test_pad_books():
+    books = [np.array([[1.0, 10.0], [2.0, 20.0], [3.0, 30.0]]), np.array([[5.0, 1.0]])]
+    px, usd = pad_books(books, 2)
+    assert px.shape == usd.shape == (2, 2)
+    np.testing.assert_array_equal(px[0], [1.0, 2.0])
+    assert px[1, 0] == 5.0 and np.isnan(px[1, 1]) and usd[1, 1] == 0.0
+
+
+def test_executable_basis_sides():
+    far = pd.DataFrame({'sell_px': [102.0, 102.0], 'buy_px': [103.0, 103.0]})
+    near = pd.DataFrame({'sell_px': [99.0, 104.0], 'buy_px': [100.0, 105.0]})
+    bp = executable_basis_bp(far, near, np.array([True, False]))
+    # rich: sell far into bids, buy near from asks; cheap: buy far, sell near
+    np.testing.assert_allclose(bp, [(102 / 100 - 1) * 1e4, (104 / 103 - 1) * 1e4])
+
+
+def test_fetch_book_normalizes_to_usd(engine, books_recording):
+    legs = [_leg(k) for k in books_recording['expected']['books']]
+    books, errors = engine.books(legs)
+    assert not errors and len(books) == len(legs)
+    bids, asks, ts = books[_leg('okx:BTC-USD-261225')]
+    np.testing.assert_allclose(bids[0], [67798.5, 150 * 100])   # contracts of ctVal USD
+    bids, asks, ts = books[_leg('okx:BTC-USD-SWAP')]
+    assert bids[0, 1] == 2200 * 100                               # swap: default BTC contract size
+    bids, asks, ts = books[_leg('binance_cm:BTCUSD_PERP')]
+    np.testing.assert_allclose(asks[0], [67028.4, 2700 * 100])
+    assert ts == books_recording['recorded_at_ms'] - 75
+    bids, asks, ts = books[_leg('deribit:BTC-25DEC26')]
+    np.testing.assert_allclose(bids[:2], [[67805.0, 20000], [67802.5, 35000]])   # inverse: already USD
+    assert (np.diff(bids[:, 0]) < 0).all() and (np.diff(asks[:, 0]) > 0).all()
+
+
+def test_book_metrics_match_recorded(engine, books_recording):
+    exp = books_recording['expected']
+    keys = list(exp['books'])
+    books, _ = engine.books([_leg(k) for k in keys])
+    m = book_metrics([books[_leg(k)][0] for k in keys], [books[_leg(k)][1] for k in keys],
+                     exp['notional_usd'], exp['band_bp'], 20)
+    m.index = keys
+    for k, want in exp['books'].items():
+        for col, v in want.items():
+            assert m.at[k, col] == pytest.approx(v, rel=1e-9, abs=1e-5), (k, col)
+
+
+def test_assess_matches_recorded(engine, books_recording):
+    rows = books_recording['expected']['rows']
+    out = engine.assess(_candidates(rows))
+    assert list(out.columns) == LIQ_COLUMNS
+    assert engine.last['books'] == len({leg for r in rows for leg in (r['far'], r['near'])})
+    for i, want in enumerate(rows):
+        for col in LIQ_COLUMNS:
+            assert out.at[i, col] == pytest.approx(want[col], abs=1e-5), (want['far'], col)
+
+
+def test_unrecorded_book_is_unmeasured_and_blocks(engine):
+    df = _candidates([{'far': 'deribit:BTC-30OCT26', 'near': 'deribit:BTC-PERPETUAL', 'rich': True}])
+    out = engine.assess(df)
+    assert out[LIQ_COLUMNS].isna().all(axis=None)
+    assert 'deribit:BTC-30OCT26' in engine.last['errors']
+    # A candidate whose book could not be fetched fails closed under a floor
+    assert not SignalEngine(THRESHOLDS).apply(pd.concat([df, out], axis=1))['signal_flag'].any()
+
+
+def test_unfillable_book_fails_the_floor(venues, books_recording):
+    # Every recorded book is far thinner than 1e12 USD: measured, but unfillable
+    eng = LiquidityEngine(VENUES, notional_usd=1e12, depth=20, apis=venues.urls, log=LOG)
+    try:
+        df = _candidates(books_recording['expected']['rows'])
+        out = eng.assess(df)
+    finally:
+        eng.close()
+    assert not eng.last['errors']
+    assert np.isneginf(out['liq_depth_bp']).all()
+    assert out['liq_slippage_bp'].isna().all() and (out['liq_depth_usd'] > 0).all()
+    assert not SignalEngine(THRESHOLDS).apply(pd.concat([df, out], axis=1))['signal_flag'].any()
+
+
+def test_thin_book_blocks_entry(engine, books_recording):
+    rows = books_recording['expected']['rows'][:4] + \
+        [{'far': 'deribit:BTC-30OCT26', 'near': 'deribit:BTC-PERPETUAL', 'rich': True}]
+    df = _candidates(rows)
+    sig = SignalEngine(THRESHOLDS).apply(pd.concat([df, engine.assess(df)], axis=1))
+    flags = dict(zip(sig['instrument'], sig['signal_flag']))
+    # BTC-23OCT26 quotes ~8 bp over the perp, but walking its thin book leaves < 5 bp
+    assert sig.loc[sig['instrument'] == 'BTC-23OCT26', 'liq_depth_bp'].iat[0] < THRESHOLDS['liq_depth_min_bp']
+    assert flags == {'BTC-25DEC26': True, 'BTC-23OCT26': False, 'BTC-USD-261225': True,
+                     'BTCUSD_261225': True, 'BTC-30OCT26': False}   # unmeasured: fails closed
+    # Without the floor the same row enters
+    no_floor = SignalEngine({**THRESHOLDS, 'liq_depth_min_bp': None}).apply(sig)
+    assert no_floor['signal_flag'].all()
+
+
+def test_liquidity_columns_persist(tmp_path):
+    df = synthetic_history(n_snapshots=1, n_instruments=3)
+    df['liq_depth_bp'], df['liq_depth_usd'], df['liq_slippage_bp'] = [12.5, np.nan, -3.0], [605000.0, np.nan, 18000.0], \
+        [0.6, np.nan, 13.7]
+    store = HistoryStore(str(tmp_path))
+    store.append(df, tag='r0')
+    back = store.read_day('2024-01-01')
+    np.testing.assert_allclose(back['liq_depth_usd'].to_numpy(dtype=float), [605000.0, np.nan, 18000.0])
+    np.testing.assert_allclose(back['liq_slippage_bp'].to_numpy(dtype=float), [0.6, np.nan, 13.7], rtol=1e-6)
@@ -0,0 +1,188 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_scheduler.py
+# ───────────────────────────────────────────────────────────────────────────────
+import os, json, logging, functools
+import pytest
+import yaml
+from src import scheduler, fetch_deribit
+from bench.fakes import FakeGoogleClients
+from src.scheduler import Pipeline, _RunLock, run_daemon, load_config
+from conftest import wait_for
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG = logging.getLogger('test_scheduler')
+
+
+def _config(tmp_path, **overrides) -> dict:
+    cfg = load_config(os.path.join(ROOT, 'config.yaml'))
+    cfg['app']['assets'] = [{'base': 'BTC'}, {'base': 'ETH'}]
+    cfg['state'] = {'dir': str(tmp_path / 'state'), 'bucket_s': 3600, 'save_interval_s': 300}
+    cfg['archive'].update(out_dir=str(tmp_path / 'archive'), history_dir=str(tmp_path / 'archive' / 'history'),
+                          rollup_dir=str(tmp_path / 'archive' / 'rollups'))
+    cfg['sheet'].update(spreadsheet_id='sheet', rotate=None, flush_interval_s=0.05)
+    cfg['metrics'] = {'enabled': False}
+    cfg['notifications']['enabled_channels'] = []
+    cfg['liquidity']['enabled'] = False
+    cfg['funding']['enabled'] = False
+    for section, values in overrides.items():
+        cfg[section].update(values)
+    return cfg
+
+
+def _write(path, cfg: dict):
+    with open(path, 'w') as f:
+        yaml.safe_dump(cfg, f)
+
+
+@pytest.fixture
+def pipeline(tmp_path, deribit, monkeypatch):
+    gc = FakeGoogleClients()
+    monkeypatch.setattr(scheduler, 'GoogleClients', lambda sa_json_path: gc)
+    monkeypatch.setattr(scheduler, 'fetch_spot_perp_future_prices',
+                        functools.partial(fetch_deribit.fetch_spot_perp_future_prices, api=deribit.url))
+    fetch_deribit._instruments_cache.clear()
+    pipes = []
+
+    def make(**overrides):
+        path = str(tmp_path / 'config.yaml')
+        _write(path, _config(tmp_path, **overrides))
+        pipes.append(Pipeline(path, log=LOG))
+        return pipes[-1]
+
+    make.gc = gc
+    yield make
+    for p in pipes:
+        p.close()
+    fetch_deribit._instruments_cache.clear()
+
+
+def _sheet_rows(gc) -> list:
+    ws = gc.gc.open_by_key('sheet').tabs.get('live_metrics')
+    return ws.get_all_values()[1:] if ws is not None else []
+
+
+def test_assets_run_in_parallel_and_one_failure_does_not_block(pipeline, deribit):
+    pipe = pipeline(app={'assets': [{'base': 'BTC'}, {'base': 'SOL'}, {'base': 'ETH'}]})
+    assert pipe.pool._max_workers == 3
+    info = pipe.run_once()
+    assert 'error' in info['assets']['SOL']
+    n_fut = {b: sum(it['settlement_period'] != 'perpetual' for it in deribit.curves[b]) for b in ('BTC', 'ETH')}
+    assert info['assets']['BTC']['rows'] == n_fut['BTC'] and info['assets']['ETH']['rows'] == n_fut['ETH']
+    assert info['rows'] == sum(n_fut.values())
+    # Both healthy assets land in the store and, via the queue, the sheet under one run_id
+    stored = pipe.store.read()
+    assert sorted(stored['base'].unique()) == ['BTC', 'ETH'] and len(stored) == info['rows']
+    assert wait_for(lambda: len(_sheet_rows(pipeline.gc)) == info['rows'])
+    assert pipe.sheet_queue.pending()[1] == 0
+    # Per-asset, per-venue stats state only for the assets that scored
+    assert set(pipe.stats) == {'BTC', 'ETH'}
+
+
+def test_every_asset_failing_raises(pipeline):
+    pipe = pipeline(app={'assets': [{'base': 'SOL'}]})
+    with pytest.raises(RuntimeError, match='No asset returned a snapshot'):
+        pipe.run_once()
+    assert not pipe.store.exists()
+
+
+def test_run_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / 'state' / 'scheduler.lock')
+    a, b = _RunLock(path), _RunLock(path)
+    assert a.acquire()
+    assert not b.acquire()
+    a.release()
+    assert b.acquire()
+    b.release()
+
+
+class _Clock:
+    def __init__(self):
+        self.t = 1000.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.t
+
+    def sleep(self, dt: float):
+        self.sleeps.append(dt)
+        self.t += dt
+
+
+class _StubPipe:
+    """Just what run_daemon touches; each run advances the injected clock by its duration."""
+
+    def __init__(self, cfg: dict, clock: _Clock, durations: list):
+        self.cfg, self.clock, self.durations = cfg, clock, list(durations)
+        self.log = LOG
+        self.sheet_queue = None
+        self.gc = None
+        self.starts = []
+        self.closed = False
+
+    def reload_if_changed(self):
+        return False
+
+    def start_stream(self):
+        pass
+
+    def run_once(self):
+        self.starts.append(self.clock.t)
+        self.clock.t += self.durations.pop(0)
+        return {'run_id': str(len(self.starts)), 'timings': {}}
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def no_archive(monkeypatch):
+    monkeypatch.setattr(scheduler, '_archive_due', lambda cfg, last, now: False)
+    monkeypatch.setattr(scheduler, '_archive_last_date', lambda cfg, now: None)
+
+
+def test_daemon_slots_are_drift_free(tmp_path, no_archive):
+    cfg = _config(tmp_path, app={'run_interval_seconds': 100})
+    clock = _Clock()
+    pipe = _StubPipe(cfg, clock, [10, 30, 250, 5, 99.5])
+    run_daemon(pipe, max_cycles=5, clock=clock, sleep=clock.sleep)
+    # Starts stay on the t0 + k*interval grid however long cycles take; the 250 s
+    # cycle overran two slots (300, 400), which are skipped rather than run late
+    assert [t - 1000 for t in pipe.starts] == [0, 100, 200, 500, 600]
+    with open(os.path.join(cfg['state']['dir'], 'daemon_status.json')) as f:
+        status = json.load(f)
+    assert status['skipped_slots'] == 2 and status['cycles'] == 5 and status['errors'] == 0
+    assert status['interval_s'] == 100
+    assert pipe.closed
+
+
+def test_daemon_exits_when_lock_is_held(tmp_path, no_archive):
+    cfg = _config(tmp_path)
+    held = _RunLock(os.path.join(cfg['state']['dir'], 'scheduler.lock'))
+    assert held.acquire()
+    clock = _Clock()
+    pipe = _StubPipe(cfg, clock, [1])
+    run_daemon(pipe, max_cycles=1, clock=clock, sleep=clock.sleep)
+    assert pipe.starts == [] and not pipe.closed
+    held.release()
+
+
+def test_reload_rebuilds_queue_and_liquidity(pipeline, tmp_path):
+    pipe = pipeline(liquidity={'enabled': True}, sheet={'flush_interval_s': 3600})
+    queue, liq = pipe.sheet_queue, pipe.liquidity
+    info = pipe.run_once()
+    assert queue.pending()[1] == info['rows']   # not flushed yet: the interval is an hour
+
+    cfg = _config(tmp_path, liquidity={'enabled': True, 'notional_usd': 1000}, sheet={'flush_interval_s': 0.05})
+    _write(pipe.cfg_path, cfg)
+    os.utime(pipe.cfg_path, (pipe.cfg_mtime + 5, pipe.cfg_mtime + 5))
+    assert pipe.reload_if_changed()
+    assert not pipe.reload_if_changed()
+
+    # Old engines are shut down, new ones built from the new config
+    assert queue._thread is None and queue._stop.is_set()
+    assert liq._loop.is_closed()
+    assert pipe.sheet_queue is not queue and pipe.liquidity is not liq
+    assert pipe.liquidity.notional_usd == 1000
+    # Rows left on disk by the old queue are sent by the new one
+    assert wait_for(lambda: len(_sheet_rows(pipeline.gc)) == info['rows'])
+    assert pipe.run_once()['rows'] == info['rows']
@@ -0,0 +1,180 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_sheet_queue.py
+# ───────────────────────────────────────────────────────────────────────────────
+import time, logging, threading
+import pytest
+from src import sheet_queue
+from bench.fakes import FakeGoogleClients
+from src.sheet_queue import SheetQueue
+from src.utils_synthetic import synthetic_history
+from conftest import wait_for
+
+LOG = logging.getLogger('test_sheet_queue')
+
+
+class FlakyClients(FakeGoogleClients):
+    """Fake Sheets whose appends can fail before or after they land, or block until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.fail_before = 0       # appends rejected outright
+        self.fail_after = 0        # appends that land, then the response is lost
+        self.gate = None           # threading.Event an append waits on
+        self.entered = threading.Event()
+        self.attempts = []
+
+    def append_rows(self, spreadsheet_id, worksheet_name, df, chunk_rows=5000):
+        self.attempts.append(time.monotonic())
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(20)
+        if self.fail_before:
+            self.fail_before -= 1
+            raise ConnectionError('503 backend error')
+        super().append_rows(spreadsheet_id, worksheet_name, df, chunk_rows)
+        if self.fail_after:
+            self.fail_after -= 1
+            raise TimeoutError('read timed out')
+
+    def sheet_rows(self) -> list:
+        return self.gc.books['sheet'].tabs['live_metrics'].cells[1:]
+
+
+def _run(run_id: str, n_instruments: int = 4, snapshot: int = 0):
+    df = synthetic_history(n_snapshots=1, n_instruments=n_instruments, start=f"2024-01-01 {snapshot:02d}:00")
+    df['run_id'] = run_id
+    return df
+
+
+@pytest.fixture
+def queue(tmp_path):
+    made = []
+
+    def make(gc, **kw):
+        kw.setdefault('log', LOG)
+        q = SheetQueue(str(tmp_path / 'queue.sqlite3'), gc, 'sheet', 'live_metrics', **kw)
+        made.append(q)
+        return q
+    yield make
+    for q in made:
+        if q._db is not None:
+            try:
+                q.close(drain_s=0)
+            except Exception:
+                pass
+
+
+def _run_ids(gc) -> list:
+    return gc.column_values('sheet', 'live_metrics', 'run_id')
+
+
+def test_pending_runs_coalesce_into_one_append(queue):
+    gc = FlakyClients()
+    q = queue(gc)
+    for k in range(3):
+        assert q.put(f"run{k}", _run(f"run{k}", snapshot=k))
+    assert not q.put('run1', _run('run1'))   # a run is queued once
+    assert q.pending()[:2] == (3, 12)
+    assert q.flush_once() == 12
+    assert gc.calls['append_rows'] == 1
+    assert q.pending()[0] == 0 and q.flush_once() == 0
+    assert sorted(set(_run_ids(gc))) == ['run0', 'run1', 'run2']
+
+
+def test_batches_split_at_max_batch_rows(queue):
+    gc = FlakyClients()
+    q = queue(gc, max_batch_rows=8)
+    for k in range(3):
+        q.put(f"run{k}", _run(f"run{k}", snapshot=k))
+    assert q.drain() == 12
+    assert gc.calls['append_rows'] == 2 and q.stats_['batches'] == 2
+
+
+def test_crash_between_append_and_mark_is_deduped(queue, monkeypatch):
+    gc = FlakyClients()
+    q = queue(gc)
+    for k in range(2):
+        q.put(f"run{k}", _run(f"run{k}", snapshot=k))
+
+    def crash(run_ids):
+        raise KeyboardInterrupt('killed before the batch was marked sent')
+    monkeypatch.setattr(q, '_mark_sent', crash)
+    with pytest.raises(KeyboardInterrupt):
+        q.flush_once()
+    landed = len(gc.sheet_rows())
+    assert landed == 8
+    q._db.close()
+    q._db = None
+
+    # Restart on the same file: the batch_id marks the runs as possibly sent, the sheet says they were
+    q2 = queue(gc)
+    assert q2.pending()[0] == 2
+    assert q2.flush_once() == 0
+    assert q2.stats_['deduped_runs'] == 2 and q2.pending()[0] == 0
+    assert len(gc.sheet_rows()) == landed and gc.calls['append_rows'] == 1
+
+
+def test_lost_response_not_resent(queue):
+    gc = FlakyClients()
+    gc.fail_after = 1
+    q = queue(gc)
+    q.put('run0', _run('run0'))
+    with pytest.raises(TimeoutError):
+        q.flush_once()
+    q.put('run1', _run('run1', snapshot=1))
+    # run0 landed: only run1 goes out on the next flush
+    assert q.flush_once() == 4
+    assert q.stats_['deduped_runs'] == 1
+    assert sorted(_run_ids(gc)) == ['run0'] * 4 + ['run1'] * 4
+
+
+def test_rejected_batch_is_sent_again(queue):
+    gc = FlakyClients()
+    gc.fail_before = 1
+    q = queue(gc)
+    q.put('run0', _run('run0'))
+    with pytest.raises(ConnectionError):
+        q.flush_once()
+    assert q.flush_once() == 4
+    assert q.stats_['deduped_runs'] == 0 and _run_ids(gc) == ['run0'] * 4
+
+
+def test_flusher_backs_off_then_recovers(queue, monkeypatch):
+    monkeypatch.setattr(sheet_queue.random, 'uniform', lambda a, b: 1.0)
+    gc = FlakyClients()
+    gc.fail_before = 3
+    q = queue(gc, flush_interval_s=0.05, max_backoff_s=0.3)
+    q.put('run0', _run('run0'))
+    q.start()
+    assert wait_for(lambda: q.pending()[0] == 0, timeout=5)
+    assert len(gc.attempts) == 4 and q.stats_['failures'] == 3
+    gaps = [b - a for a, b in zip(gc.attempts, gc.attempts[1:])]
+    # interval * 2^failures, capped at max_backoff_s
+    for gap, want in zip(gaps, (0.1, 0.2, 0.3)):
+        assert want * 0.9 <= gap < want + 0.25
+    assert q.stats()['backoff_s'] == 0.0 and _run_ids(gc) == ['run0'] * 4
+
+
+def test_close_waits_for_in_flight_batch(queue, caplog):
+    gc = FlakyClients()
+    gc.gate = threading.Event()
+    q = queue(gc, flush_interval_s=0.05)
+    q.put('run0', _run('run0'))
+    q.start()
+    assert gc.entered.wait(5)
+    closed = threading.Event()
+    closer = threading.Thread(target=lambda: (q.close(drain_s=0), closed.set()))
+    closer.start()
+    with caplog.at_level(logging.WARNING, logger='test_sheet_queue'):
+        time.sleep(5.5)   # past the flusher's join slice
+        assert not closed.is_set()   # still sending: the DB must stay open
+        gc.gate.set()
+        closer.join(10)
+    assert closed.is_set()
+    assert any('in-flight batch' in r.message for r in caplog.records)
+
+    # A queue reopened on the same file (hot reload) finds the batch marked sent
+    gc.gate = None
+    q2 = queue(gc)
+    assert q2.pending()[0] == 0 and q2.drain() == 0
+    assert gc.calls['append_rows'] == 1 and _run_ids(gc) == ['run0'] * 4
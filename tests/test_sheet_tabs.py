@@ -0,0 +1,75 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_sheet_tabs.py
+# ───────────────────────────────────────────────────────────────────────────────
+import pandas as pd
+import pytest
+from bench.fakes import FakeGoogleClients
+from src.schema import COLUMNS
+from src.sheet_tabs import index_name, read_index, tab_name
+from src.utils_synthetic import synthetic_history
+from src.write_google_sheet import append_metrics_to_sheet
+from streamlit_app import data_layer
+from streamlit_app.data_layer import LiveFrame
+
+
+def _rows(start, n_snapshots: int, freq: str = '6h') -> pd.DataFrame:
+    start = pd.Timestamp(start)
+    start = start.tz_convert(None) if start.tzinfo else start
+    return synthetic_history(n_snapshots=n_snapshots, n_instruments=3, freq=freq, start=str(start)) \
+        .reindex(columns=COLUMNS)
+
+
+def test_rotated_writes_are_indexed_and_windowed():
+    gc = FakeGoogleClients()
+    rows = _rows('2024-01-20', 4 * 30)   # 20 Jan - 19 Feb
+    tabs = append_metrics_to_sheet(gc, 'sheet', 'live_metrics', rows, rotate='month')
+    assert tabs == ['live_metrics_2024_01', 'live_metrics_2024_02']
+    sh = gc.gc.open_by_key('sheet')
+    idx = read_index(sh, 'live_metrics')
+    assert list(idx['tab']) == tabs
+    assert idx['start_utc'].iloc[1] == pd.Timestamp('2024-02-01', tz='UTC')
+    assert sh.tabs[index_name('live_metrics')].get_all_values()[0] == ['tab', 'start_utc', 'end_utc']
+
+    # A window inside February opens only February's tab
+    gc._index.clear()
+    before = gc.calls['values_get']
+    df = gc.read_sheet_window('sheet', 'live_metrics', start=pd.Timestamp('2024-02-05', tz='UTC'),
+                              end=pd.Timestamp('2024-02-06', tz='UTC'))
+    assert gc.calls['values_get'] - before == 1
+    assert len(df) == int((rows['timestamp_utc'] >= pd.Timestamp('2024-02-01', tz='UTC')).sum())
+
+
+def test_get_all_values_pads_rows():
+    gc = FakeGoogleClients()
+    ws = gc.open_sheet('sheet', 'tab')
+    ws.update(values=[['a', 'b', 'c'], ['1']], range_name='A1')
+    assert ws.get_all_values() == [['a', 'b', 'c'], ['1', '', '']]
+
+
+@pytest.fixture
+def sheet(monkeypatch):
+    gc = FakeGoogleClients()
+    monkeypatch.setattr(data_layer, 'sheet_client', lambda: gc.gc)
+    return gc
+
+
+def test_live_frame_reads_rotated_tabs_then_deltas(sheet):
+    now = pd.Timestamp.now(tz='UTC').floor('h')
+    rows = _rows(now - pd.Timedelta(days=20), 4 * 20)   # three weekly tabs fall inside 14 days
+    append_metrics_to_sheet(sheet, 'sheet', 'live_metrics', rows, rotate='week')
+    live = LiveFrame(sheet_id='sheet', worksheet='live_metrics', max_hours=14 * 24, min_interval_s=0)
+    live.refresh()
+    cutoff = pd.Timestamp.now(tz='UTC') - pd.Timedelta(hours=14 * 24)
+    want = rows[rows['timestamp_utc'] >= cutoff]
+    assert len(live.df) == len(want)
+    opened = set(live._ws)
+    assert opened == {tab_name('live_metrics', t, 'week') for t in want['timestamp_utc']}
+    assert sheet.calls['get_all_values'] == 1 + len(opened)   # index + one full read per tab
+
+    more = _rows(rows['timestamp_utc'].max() + pd.Timedelta(minutes=1), 1)   # same (already indexed) tab
+    append_metrics_to_sheet(sheet, 'sheet', 'live_metrics', more, rotate='week')
+    get_before = sheet.calls['get']
+    assert live.refresh() == len(more)
+    assert sheet.calls['get_all_values'] == 1 + len(opened)   # deltas only: ranged reads below the last row
+    assert sheet.calls['get'] - get_before == len(opened)
+    assert not live.df.duplicated(['timestamp_utc', 'instrument']).any()
@@ -0,0 +1,131 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_signals.py
+# ───────────────────────────────────────────────────────────────────────────────
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from src.signals import SIDE_CHEAP, SIDE_RICH, SignalEngine
+
+THRESHOLDS = {'z_hist_enter': 2.0, 'z_cross_enter': 1.8, 'z_term_enter': 2.0,
+              'z_hist_exit': 1.5, 'z_cross_exit': 1.4, 'z_term_exit': 1.5, 'apy_net_min': 0.10}
+T0 = pd.Timestamp('2024-01-01', tz='UTC')
+
+
+def _snap(minute: float, z_hist, apy_net=0.2, instruments=('BTC-A',), spread=50.0, **cols) -> pd.DataFrame:
+    n = len(instruments)
+    z = np.broadcast_to(np.asarray(z_hist, dtype=float), n)
+    return pd.DataFrame({'timestamp_utc': T0 + pd.Timedelta(minutes=minute), 'exchange': 'deribit',
+                         'instrument': list(instruments), 'z_hist': z, 'z_cross': 0.0, 'z_term': 0.0,
+                         'apy_net': apy_net, 'spread': spread, **cols})
+
+
+def _run(eng: SignalEngine, snaps: list) -> list:
+    return [eng.evaluate(s).iloc[0][['signal_flag', 'alert']].tolist() for s in snaps]
+
+
+def test_hysteresis_enters_holds_and_exits():
+    eng = SignalEngine(THRESHOLDS)
+    # 1.7 does not enter, 2.1 enters, 1.6 holds (>= exit 1.5), 1.4 exits, 1.7 does not re-enter
+    got = _run(eng, [_snap(i * 60, z) for i, z in enumerate([1.7, 2.1, 1.6, 1.4, 1.7])])
+    assert [f for f, _ in got] == [False, True, True, False, False]
+    assert [a for _, a in got] == [False, True, False, False, False]
+
+
+def test_exit_levels_default_to_enter():
+    eng = SignalEngine({k: v for k, v in THRESHOLDS.items() if not k.endswith('_exit')})
+    assert eng.exit == eng.enter and eng.apy_exit == eng.apy_min
+    assert [f for f, _ in _run(eng, [_snap(0, 2.1), _snap(60, 1.9)])] == [True, False]
+
+
+def test_apy_net_exit_default_and_override():
+    snaps = [_snap(0, 2.5, apy_net=0.12), _snap(60, 2.5, apy_net=0.08)]
+    # apy_net_exit defaults to apy_net_min: a held signal drops once apy_net falls below it
+    assert [f for f, _ in _run(SignalEngine(THRESHOLDS), snaps)] == [True, False]
+    assert [f for f, _ in _run(SignalEngine({**THRESHOLDS, 'apy_net_exit': 0.05}), snaps)] == [True, True]
+    # ...but entering still needs apy_net_min
+    assert not SignalEngine({**THRESHOLDS, 'apy_net_exit': 0.05}).evaluate(snaps[1])['signal_flag'].iat[0]
+
+
+def test_debounce_suppresses_quick_reentry():
+    z = [2.5, 1.0, 2.5, 1.0, 2.5]
+    minutes = [0, 5, 10, 15, 30]
+    got = _run(SignalEngine(THRESHOLDS, debounce_minutes=15), [_snap(m, v) for m, v in zip(minutes, z)])
+    # Re-entry at 10 min is within 15 min of the alert at 0; the one at 30 is not
+    assert [a for _, a in got] == [True, False, False, False, True]
+    assert [f for f, _ in got] == [True, False, True, False, True]
+
+
+def test_realert_while_active():
+    got = _run(SignalEngine(THRESHOLDS, realert_minutes=60), [_snap(m, 2.5) for m in (0, 30, 60, 90, 120)])
+    assert [a for _, a in got] == [True, False, True, False, True]
+    # Without realert an active signal alerts once
+    got = _run(SignalEngine(THRESHOLDS), [_snap(m, 2.5) for m in (0, 30, 60, 90, 120)])
+    assert [a for _, a in got] == [True, False, False, False, False]
+
+
+def test_state_round_trips_and_expires(tmp_path):
+    path = str(tmp_path / 'signal_state.json')
+    eng = SignalEngine(THRESHOLDS, debounce_minutes=15, state_path=path, state_ttl_days=1)
+    eng.evaluate(_snap(0, 2.5, instruments=('BTC-A', 'BTC-B')))
+    eng.save()
+    with open(path) as f:
+        raw = json.load(f)
+    assert set(raw) == {'deribit:BTC-A', 'deribit:BTC-B'} and raw['deribit:BTC-A']['active'] is True
+
+    # A restarted engine holds the active signal in the exit band and stays debounced
+    back = SignalEngine(THRESHOLDS, debounce_minutes=15, state_path=path, state_ttl_days=1)
+    pd.testing.assert_frame_equal(back.state, eng.state)
+    out = back.evaluate(_snap(10, 1.6, instruments=('BTC-A',)))
+    assert out['signal_flag'].iat[0] and not out['alert'].iat[0]
+    assert SignalEngine(THRESHOLDS, state_path=path).evaluate(_snap(10, 1.6))['signal_flag'].iat[0]
+
+    # BTC-B was last seen more than a day before: dropped, so it has to enter again
+    later = back.evaluate(_snap(26 * 60, 1.6, instruments=('BTC-A',)))
+    assert list(back.state.index) == ['deribit:BTC-A'] and later['signal_flag'].iat[0]
+    assert not back.evaluate(_snap(26 * 60 + 1, 1.6, instruments=('BTC-B',)))['signal_flag'].iat[0]
+
+
+def test_no_state_path_is_in_memory_only(tmp_path):
+    eng = SignalEngine(THRESHOLDS)
+    eng.evaluate(_snap(0, 2.5))
+    eng.save()
+    assert len(eng.state) == 1 and not list(tmp_path.iterdir())
+
+
+def test_evaluate_history_matches_snapshot_replay():
+    rng = np.random.default_rng(3)
+    inst = ('BTC-A', 'BTC-B', 'BTC-C')
+    snaps = [_snap(m, rng.normal(1.5, 0.8, len(inst)), apy_net=rng.uniform(0.05, 0.2), instruments=inst)
+             for m in range(0, 48 * 20, 20)]
+    hist = pd.concat(snaps, ignore_index=True)
+    for kw in ({}, {'debounce_minutes': 60}, {'realert_minutes': 45}, {'debounce_minutes': 30, 'realert_minutes': 90}):
+        live = SignalEngine(THRESHOLDS, **kw)
+        replay = pd.concat([live.evaluate(s) for s in snaps], ignore_index=True)
+        batch = SignalEngine(THRESHOLDS, **kw).evaluate_history(hist.sample(frac=1, random_state=0)).sort_index()
+        pd.testing.assert_frame_equal(batch, replay, check_dtype=False, obj=str(kw))
+        assert replay['alert'].any() and not replay['alert'].all()
+
+
+def test_labels_reason_and_side():
+    df = pd.DataFrame({'z_hist': [2.5, 0.0, -2.5, np.nan], 'z_cross': [1.9, 0.0, 0.0, 0.0],
+                       'z_term': [0.0, -3.0, 0.0, 0.0], 'apy_net': 0.2, 'spread': [10.0, -10.0, 0.0, np.nan]})
+    _, _, by_rule = SignalEngine(THRESHOLDS).masks(df)
+    reason, side = SignalEngine._labels(df, by_rule)
+    assert reason.tolist() == ['z_hist,z_cross', 'z_term', 'z_hist', '']
+    assert side.tolist() == [SIDE_RICH, SIDE_CHEAP, SIDE_CHEAP, SIDE_CHEAP]
+
+
+def test_missing_scores_never_pass():
+    df = pd.DataFrame({'z_hist': [np.nan, 3.0], 'apy_net': [0.5, np.nan], 'spread': 1.0})
+    enter, hold, _ = SignalEngine(THRESHOLDS).masks(df)
+    assert not enter.any() and not hold.any()
+
+
+@pytest.mark.parametrize('liq,entered', [(6.0, True), (4.0, False), (np.nan, False), (-np.inf, False)])
+def test_liquidity_floor(liq, entered):
+    eng = SignalEngine({**THRESHOLDS, 'liq_depth_min_bp': 5})
+    assert eng.evaluate(_snap(0, 2.5, liq_depth_bp=liq))['signal_flag'].iat[0] == entered
+    # No floor, or no liquidity column at all: not gated
+    assert SignalEngine(THRESHOLDS).evaluate(_snap(0, 2.5, liq_depth_bp=liq))['signal_flag'].iat[0]
+    assert SignalEngine({**THRESHOLDS, 'liq_depth_min_bp': 5}).evaluate(_snap(0, 2.5))['signal_flag'].iat[0]
@@ -0,0 +1,91 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_stats_state.py
+# ───────────────────────────────────────────────────────────────────────────────
+import numpy as np
+import pandas as pd
+import pytest
+from src.compute_metrics import compute_all_metrics
+from src.stats_state import StatsState, WindowStats
+from src.utils_synthetic import synthetic_history
+
+TERM_BINS = [0, 7, 14, 30, 60, 90, 180, 365]
+LOOKBACK_DAYS, MIN_ROWS = 2, 24
+
+
+class FixedCurve:
+    """Same term curve for every call, so batch and incremental deviations are comparable."""
+
+    def __init__(self, hist):
+        coef = np.polyfit(hist['days_to_expiry'].to_numpy(dtype=float), hist['spread'].to_numpy(dtype=float), 2)
+        self.predict = np.poly1d(coef)
+
+    def fit(self, hist, key=None):
+        return self.predict
+
+
+def _replay(h, state, skip: int = 60):
+    """(batch, incremental) metrics for every snapshot after `skip`, each scored against the rows before it."""
+    curve = FixedCurve(h)
+    out = []
+    for t in sorted(h['timestamp_utc'].unique())[skip:]:
+        before, snap = h[h['timestamp_utc'] < t], h[h['timestamp_utc'] == t]
+        kw = dict(lookback_days_for_hist_z=LOOKBACK_DAYS, min_history_rows_per_expiry=MIN_ROWS, term_curve=curve)
+        out.append((compute_all_metrics(snap, before, TERM_BINS, **kw),
+                    compute_all_metrics(snap, before, TERM_BINS, stats_state=state, **kw)))
+    return out
+
+
+def _history(freq: str, n: int):
+    h = synthetic_history(n_snapshots=n, n_instruments=4, freq=freq, start='2024-01-01')
+    h['exchange'] = 'deribit'
+    return h
+
+
+@pytest.mark.parametrize('freq,bucket_s', [('h', 3600), ('20min', 1200)])
+def test_incremental_matches_batch(freq, bucket_s):
+    res = _replay(_history(freq, 140), StatsState(LOOKBACK_DAYS, MIN_ROWS, bucket_s=bucket_s))
+    for batch, inc in res:
+        for col in ('z_hist', 'z_term'):
+            np.testing.assert_allclose(inc[col].to_numpy(dtype=float), batch[col].to_numpy(dtype=float),
+                                       rtol=1e-6, atol=1e-6, equal_nan=True)
+    assert any(b['z_hist'].notna().any() for b, _ in res)
+
+
+def test_sub_bucket_cadence_within_tolerance():
+    # 20-minute rows in hourly buckets: eviction lags the exact window by < 1 bucket
+    res = _replay(_history('20min', 140), StatsState(LOOKBACK_DAYS, MIN_ROWS, bucket_s=3600))
+    err = max(np.nanmax(np.abs(i['z_hist'].to_numpy(dtype=float) - b['z_hist'].to_numpy(dtype=float)), initial=0)
+              for b, i in res)
+    assert err < 0.1
+
+
+def test_state_is_bucketed_and_round_trips(tmp_path):
+    st = StatsState(lookback_days=1, min_rows=5, bucket_s=3600)
+    h = _history('min', 3 * 24 * 60)
+    st.warm(h)
+    st._evict(int(h['timestamp_utc'].max().timestamp()))
+    # One bucket per hour of lookback, however many rows fell in it
+    assert all(len(w.buckets) <= 25 for w in st.apy.values())
+    path = str(tmp_path / 'state.npz')
+    st.save(path)
+    back = StatsState.load(path, lookback_days=1, min_rows=5, bucket_s=3600)
+    for k, w in st.apy.items():
+        assert back.apy[k].n == w.n
+        assert back.apy[k].mean == pytest.approx(w.mean)
+        assert back.apy[k].std() == pytest.approx(w.std())
+    # A different bucket width cannot be reused; the state re-warms instead
+    assert StatsState.load(path, lookback_days=1, min_rows=5, bucket_s=600).is_empty()
+
+
+def test_window_eviction_matches_direct_stats():
+    rng = np.random.default_rng(1)
+    w = WindowStats(bucket_s=10)
+    ts = np.arange(0, 1000, 3)
+    xs = rng.normal(5, 2, len(ts))
+    for t, x in zip(ts, xs):
+        w.push(int(t), float(x))
+    w.evict(500)
+    kept = xs[ts >= 500]
+    assert w.n == len(kept)
+    assert w.mean == pytest.approx(kept.mean())
+    assert w.std() == pytest.approx(kept.std())
@@ -0,0 +1,87 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_stream_deribit.py
+# ───────────────────────────────────────────────────────────────────────────────
+import time
+import pytest
+from bench.fakes import FakeDeribitWS
+from src.stream_deribit import DeribitStream, QuoteBook
+from conftest import wait_for
+
+
+@pytest.fixture
+def session(deribit, ws_recording):
+    deribit.set_instruments('BTC', ws_recording['instruments'])
+    made = []
+
+    def start(repeat: int = 1, **kw):
+        ws = FakeDeribitWS(ws_recording['messages'], repeat=repeat)
+        st = DeribitStream('BTC', 'USD', url=ws.url, api=deribit.url, **kw).start()
+        made.append((ws, st))
+        return ws, st
+    yield start
+    for ws, st in made:
+        st.stop()
+        ws.close()
+
+
+def _tickers(rec, name):
+    return [m['params']['data'] for m in rec['messages'] if m['params']['channel'].startswith(f"ticker.{name}.")]
+
+
+def test_replay_fills_book_and_snapshot(session, ws_recording):
+    ws, st = session()
+    n = len(ws_recording['messages'])
+    assert wait_for(lambda: st.stats['messages'] >= n)
+    last = _tickers(ws_recording, 'BTC-PERPETUAL')[-1]
+    assert st.book.latest['BTC-PERPETUAL'] == (last['last_price'], last['timestamp'])
+    snap = st.snapshot()
+    assert len(snap) == len(ws_recording['instruments']) - 1
+    assert (snap['perp_price'] == last['last_price']).all()
+    assert ws.calls['public/set_heartbeat'] == 1
+
+
+def test_resubscribes_after_disconnect(session):
+    ws, st = session()
+    assert st.wait_ready(5)
+    first = set(ws.subscriptions[0])
+    ws.drop()
+    assert wait_for(lambda: ws.connects == 2 and len(ws.subscriptions) == 2, timeout=10)
+    assert set(ws.subscriptions[1]) == first
+    assert st.stats['reconnects'] >= 1
+    assert ws.calls['public/set_heartbeat'] == 2
+
+
+def test_heartbeat_test_request_is_answered(session):
+    ws, st = session()
+    assert st.wait_ready(5)
+    ws.heartbeat()
+    assert wait_for(lambda: ws.calls['public/test'] == 1)
+    # Nothing new listed: the refresh on heartbeat sends no second subscribe
+    assert ws.calls['public/subscribe'] == 1
+
+
+def test_ring_buffer_keeps_latest_ticks(session, ws_recording):
+    ws, st = session(repeat=3, ring_size=8)
+    n = 3 * len(ws_recording['messages'])
+    assert wait_for(lambda: st.stats['messages'] >= n)
+    ticks = _tickers(ws_recording, 'BTC-27NOV26')
+    ring = st.book.recent('BTC-27NOV26')
+    assert len(ring) == 8
+    assert ring == [(t['timestamp'], t['last_price']) for t in ticks[-8:]]
+
+
+def test_quote_book_deque_is_bounded():
+    book = QuoteBook(ring_size=3)
+    for i in range(10):
+        book.on_ticker({'instrument_name': 'X', 'last_price': float(i), 'timestamp': i})
+    assert book.recent('X') == [(7, 7.0), (8, 8.0), (9, 9.0)]
+    assert book.ticks['X'].maxlen == 3
+    assert book.latest['X'] == (9.0, 9)
+
+
+def test_stop_does_not_wait_for_receive_timeout(session):
+    ws, st = session(heartbeat_s=60)
+    assert st.wait_ready(5)
+    t0 = time.monotonic()
+    st.stop()
+    assert time.monotonic() - t0 < 1.0
@@ -0,0 +1,71 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_termcurve.py
+# ───────────────────────────────────────────────────────────────────────────────
+import numpy as np
+import pandas as pd
+import pytest
+from src.utils_synthetic import synthetic_history
+from src.utils_termcurve import TermCurveCache, fit_term_curve_grid, fit_term_curve_lowess
+
+TERM_BINS = [0, 7, 14, 30, 60, 90, 180, 365]
+
+
+@pytest.mark.parametrize('n', [1_000, 5_000, 20_000])
+def test_grid_lowess_close_to_exact(n):
+    h = synthetic_history(n_rows=n, n_instruments=8)
+    x, y = h['days_to_expiry'].to_numpy(dtype=float), h['spread'].to_numpy(dtype=float)
+    exact = y - fit_term_curve_lowess(x, y, frac=0.6)(x)
+    grid = y - fit_term_curve_grid(x, y, method='lowess', frac=0.6)(x)
+    # Deviations (what z_term scores) stay within a tenth of their own spread
+    assert np.sqrt(np.mean((grid - exact) ** 2)) < 0.1 * exact.std()
+    assert np.corrcoef(grid, exact)[0, 1] > 0.99
+
+
+def _windows(h: pd.DataFrame, hours: int = 48):
+    ts = sorted(h['timestamp_utc'].unique())
+    for t in ts[hours:]:
+        yield h[(h['timestamp_utc'] >= t - pd.Timedelta(hours=hours)) & (h['timestamp_utc'] < t)]
+
+
+@pytest.mark.parametrize('method', ['lowess', 'kernel'])
+def test_incremental_slide_matches_fresh_fit(method):
+    h = synthetic_history(n_snapshots=120, n_instruments=4)
+    cache = TermCurveCache(method=method, term_bins=TERM_BINS)
+    d = np.linspace(0, 30, 61)
+    for w in _windows(h):
+        fresh = TermCurveCache(method=method, term_bins=TERM_BINS).fit(w)
+        np.testing.assert_allclose(cache.fit(w, key='BTC')(d), fresh(d), rtol=1e-9, atol=1e-9)
+    assert cache.stats['full'] == 1
+    assert cache.stats['incremental'] == 120 - 48 - 1
+
+
+def test_unchanged_window_is_a_hit():
+    h = synthetic_history(n_snapshots=48, n_instruments=4)
+    cache = TermCurveCache(term_bins=TERM_BINS)
+    p = cache.fit(h, key='BTC')
+    assert cache.fit(h.copy(), key='BTC') is p
+    assert cache.stats == {'hits': 1, 'incremental': 0, 'full': 1}
+    # Keys are independent
+    cache.fit(h, key='ETH')
+    assert cache.stats['full'] == 2
+
+
+def test_edited_rows_invalidate_the_fit():
+    h = synthetic_history(n_snapshots=48, n_instruments=4)
+    cache = TermCurveCache(term_bins=TERM_BINS)
+    d = np.linspace(0, 30, 61)
+    cache.fit(h, key='BTC')
+    # Same timestamps and row count, one corrected quote: must refit, not slide
+    edited = h.copy()
+    edited.loc[edited.index[10], 'spread'] += 500.0
+    p = cache.fit(edited, key='BTC')
+    np.testing.assert_allclose(p(d), TermCurveCache(term_bins=TERM_BINS).fit(edited)(d), rtol=1e-9)
+    assert cache.stats['incremental'] == 0 and cache.stats['full'] == 2
+
+
+def test_exact_method_and_empty_window():
+    h = synthetic_history(n_snapshots=24, n_instruments=4)
+    x, y = h['days_to_expiry'].to_numpy(dtype=float), h['spread'].to_numpy(dtype=float)
+    cache = TermCurveCache(method='exact')
+    np.testing.assert_allclose(cache.fit(h)(x), fit_term_curve_lowess(x, y)(x))
+    assert cache.fit(h.iloc[0:0]) is None
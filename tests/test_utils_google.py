@@ -0,0 +1,75 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_utils_google.py
+# ───────────────────────────────────────────────────────────────────────────────
+import numpy as np
+import pandas as pd
+from bench.fakes import FakeGoogleClients
+from src.utils_google import to_sheet_values
+
+
+def _frame(n: int, start: int = 0, **extra) -> pd.DataFrame:
+    df = pd.DataFrame({'timestamp_utc': pd.date_range('2024-01-01', periods=n, freq='h', tz='UTC')
+                       + pd.Timedelta(hours=start),
+                       'run_id': [f'r{start + i}' for i in range(n)],
+                       'apy_net': np.arange(start, start + n, dtype=float)})
+    return df.assign(**extra)
+
+
+def test_to_sheet_values_is_json_safe():
+    df = pd.DataFrame({'t': pd.to_datetime(['2024-01-01', None], utc=True), 'x': [1.5, np.nan], 'n': [1, 2],
+                       'liq': np.array([-np.inf, 3.5], dtype=np.float32)})
+    values = to_sheet_values(df)
+    assert values == [['2024-01-01T00:00:00+00:00', 1.5, 1, ''], ['', '', 2, 3.5]]
+    assert all(type(v) in (str, float, int) for row in values for v in row)
+
+
+def test_append_sends_only_new_rows_and_reads_header_once():
+    gc = FakeGoogleClients()
+    gc.append_rows('sheet', 'tab', _frame(3))
+    gc.append_rows('sheet', 'tab', _frame(2, start=3))
+    ws = gc.open_sheet('sheet', 'tab')
+    assert ws.cells[0] == ['timestamp_utc', 'run_id', 'apy_net']
+    assert [r[1] for r in ws.cells[1:]] == ['r0', 'r1', 'r2', 'r3', 'r4']
+    assert gc.calls['row_values'] == 1        # header learned once, then cached
+    assert gc.calls['update'] == 1            # header written once
+    assert gc.calls['append_rows'] == 2
+    assert gc.calls['get_all_values'] == 0    # never re-reads the sheet to append
+
+
+def test_new_columns_extend_the_header():
+    gc = FakeGoogleClients()
+    gc.append_rows('sheet', 'tab', _frame(1))
+    ws = gc.open_sheet('sheet', 'tab')
+    ws.col_count = 3
+    gc.append_rows('sheet', 'tab', _frame(1, start=1, liq_depth_bp=12.5)[['liq_depth_bp', 'run_id']])
+    assert ws.cells[0] == ['timestamp_utc', 'run_id', 'apy_net', 'liq_depth_bp']
+    assert ws.col_count == 4
+    assert ws.cells[2] == ['', 'r1', '', 12.5]   # reordered to the sheet's header
+
+
+def test_header_from_an_existing_sheet_is_reused():
+    writer = FakeGoogleClients()
+    writer.append_rows('sheet', 'tab', _frame(2))
+    # A second process against the same spreadsheet reads the header instead of rewriting it
+    other = FakeGoogleClients(sheets=writer.gc)
+    other.append_rows('sheet', 'tab', _frame(1, start=2)[['apy_net', 'run_id', 'timestamp_utc']])
+    ws = other.open_sheet('sheet', 'tab')
+    assert ws.cells[0] == ['timestamp_utc', 'run_id', 'apy_net']
+    assert ws.cells[3][:2] == ['2024-01-01T02:00:00+00:00', 'r2']
+    assert writer.gc.calls['update'] == 1
+
+
+def test_append_chunks():
+    gc = FakeGoogleClients()
+    gc.append_rows('sheet', 'tab', _frame(7), chunk_rows=3)
+    assert gc.calls['append_rows'] == 3
+    assert len(gc.open_sheet('sheet', 'tab').cells) == 8
+    gc.append_rows('sheet', 'tab', _frame(0))
+    assert gc.calls['append_rows'] == 3
+
+
+def test_column_values_sees_other_writers():
+    gc = FakeGoogleClients()
+    gc.append_rows('sheet', 'tab', _frame(2))
+    gc.open_sheet('sheet', 'tab').append_rows([['2024-01-02T00:00:00+00:00', 'ext', 9.0]])
+    assert gc.column_values('sheet', 'tab', 'run_id') == ['r0', 'r1', 'ext']
@@ -0,0 +1,154 @@
+# ───────────────────────────────────────────────────────────────────────────────
+# tests/test_utils_metrics.py
+# ───────────────────────────────────────────────────────────────────────────────
+import io, json, time, logging
+from datetime import datetime
+import requests
+from src.utils_logging import JsonFormatter, use_json
+from src.utils_metrics import Metrics, SamplingProfiler, service_of
+
+
+def test_render_exposition_format():
+    m = Metrics()
+    m.inc('http_requests_total', service='deribit', code='2xx')
+    m.inc('http_requests_total', 2, service='deribit', code='2xx')
+    m.set('history_window_rows', 1234)
+    m.observe('fetch', 0.25, asset='BTC')
+    lines = m.render().splitlines()
+    assert '# TYPE arb_http_requests_total counter' in lines
+    assert 'arb_http_requests_total{job="scheduler",code="2xx",service="deribit"} 3' in lines
+    assert '# TYPE arb_history_window_rows gauge' in lines
+    assert 'arb_history_window_rows{job="scheduler"} 1234' in lines
+    assert 'arb_stage_seconds_total{job="scheduler",asset="BTC",stage="fetch"} 0.25' in lines
+    assert 'arb_stage_runs_total{job="scheduler",asset="BTC",stage="fetch"} 1' in lines
+    assert lines[-2] == '# TYPE arb_process_start_time_seconds gauge'
+    # One TYPE line per metric family, before its samples
+    types = [l.split()[2] for l in lines if l.startswith('# TYPE')]
+    assert len(types) == len(set(types))
+
+
+def test_label_values_are_escaped():
+    m = Metrics()
+    m.inc('errors_total', error='bad "quote"\nat C:\\tmp')
+    line = next(l for l in m.render().splitlines() if l.startswith('arb_errors_total'))
+    assert line == 'arb_errors_total{job="scheduler",error="bad \\"quote\\"\\nat C:\\\\tmp"} 1'
+
+
+def test_disabled_is_a_no_op(tmp_path):
+    m = Metrics(enabled=False)
+    m.profiler = SamplingProfiler(str(tmp_path / 'profiles'))
+    m.inc('x_total')
+    m.set('g', 1.0)
+    m.observe('fetch', 1.0)
+    m.http('deribit', 200, 100)
+    with m.span('fetch'), m.profile('compute'):
+        time.sleep(0.02)
+    assert m.snapshot() == {'counters': {}, 'gauges': {}}
+    m.write_textfile(str(tmp_path / 'metrics.prom'))
+    assert list(tmp_path.iterdir()) == []
+    assert m.delta(m.snapshot()) == {}
+
+
+def test_delta_since_snapshot():
+    m = Metrics()
+    m.inc('rows_total', 5, io='write', sink='store')
+    m.inc('unchanged_total')
+    before = m.snapshot()
+    m.inc('rows_total', 3, io='write', sink='store')
+    m.inc('retries_total', service='sheets')
+    with m.span('compute'):
+        pass
+    assert m.delta(before) == {'rows_total{io=write,sink=store}': 3, 'retries_total{service=sheets}': 1}
+    assert 'stage_runs_total{stage=compute}' in m.delta(before, stages=True)
+    assert m.delta(None)['unchanged_total'] == 1
+
+
+def test_write_textfile_and_configure_job(tmp_path):
+    m = Metrics().configure({'metrics': {'enabled': True, 'textfile': str(tmp_path / 'metrics.prom')}},
+                            job='archive')
+    assert m.textfile == str(tmp_path / 'metrics_archive.prom')
+    m.inc('days_total')
+    m.write_textfile()
+    text = (tmp_path / 'metrics_archive.prom').read_text()
+    assert 'arb_days_total{job="archive"} 1' in text
+    assert [p.name for p in tmp_path.iterdir()] == ['metrics_archive.prom']   # no temp file left behind
+
+
+def test_requests_hook_counts_body_bytes(deribit):
+    m = Metrics()
+    s = m.instrument_session(requests.Session(), 'deribit')
+    r1 = s.get(f"{deribit.url}/public/get_instruments", params={'currency': 'BTC'})
+    r2 = s.get(f"{deribit.url}/public/get_index_price", params={'index_name': 'btc_usd'}, stream=True)
+    r2.close()
+    r3 = s.get(f"{deribit.url}/public/nope")
+    c = m.snapshot()['counters']
+    assert c[('http_requests_total', (('code', '2xx'), ('service', 'deribit')))] == 2
+    assert c[('http_requests_total', (('code', '4xx'), ('service', 'deribit')))] == 1
+    # Streamed bodies are counted from Content-Length without reading them
+    want = len(r1.content) + int(r2.headers['Content-Length']) + len(r3.content)
+    assert c[('http_bytes_total', (('service', 'deribit'),))] == want
+
+
+def test_service_of():
+    assert service_of('https://www.deribit.com/api/v2/public/ticker') == 'deribit'
+    assert service_of('https://sheets.googleapis.com/v4/spreadsheets/x') == 'sheets'
+    assert service_of('https://www.googleapis.com/upload/drive/v2/files') == 'google'
+    assert service_of('http://127.0.0.1:8080/x') == '127.0.0.1'
+
+
+def _busy_loop(seconds: float):
+    end = time.perf_counter() + seconds
+    x = 0
+    while time.perf_counter() < end:
+        x += 1
+    return x
+
+
+def test_profiler_session_writes_folded_stacks(tmp_path):
+    m = Metrics().configure({'metrics': {'enabled': True, 'profile': True, 'profile_interval_ms': 1},
+                             'state': {'dir': str(tmp_path)}})
+    with m.profile('compute'):
+        _busy_loop(0.2)
+    path = tmp_path / 'profiles' / 'compute.folded'
+    lines = path.read_text().splitlines()
+    stacks = {l.rsplit(' ', 1)[0]: int(l.rsplit(' ', 1)[1]) for l in lines}
+    busy = sum(n for s, n in stacks.items() if s.endswith('test_utils_metrics.py:_busy_loop'))
+    assert busy >= 0.5 * sum(stacks.values()) and busy > 10
+    # Sessions with the same name accumulate into one file
+    with m.profile('compute'):
+        _busy_loop(0.05)
+    again = sum(int(l.rsplit(' ', 1)[1]) for l in path.read_text().splitlines())
+    assert again > sum(stacks.values())
+
+
+def test_serve_metrics_endpoint():
+    m = Metrics()
+    m.inc('x_total')
+    server = m.serve(0, host='127.0.0.1')
+    try:
+        r = requests.get(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5)
+        assert r.status_code == 200 and 'arb_x_total{job="scheduler"} 1' in r.text
+        assert requests.get(f"http://127.0.0.1:{server.server_port}/other", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_json_formatter():
+    log = logging.getLogger('test_json_formatter')
+    log.propagate = False
+    buf = io.StringIO()
+    log.addHandler(logging.StreamHandler(buf))
+    use_json(log)
+    assert isinstance(log.handlers[0].formatter, JsonFormatter)
+    log.warning("run %s done", 'abc', extra={'fields': {'rows': 12, 'since': datetime(2024, 1, 1)}})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("failed")
+    first, second = (json.loads(l) for l in buf.getvalue().splitlines() if l.startswith('{'))
+    assert first['msg'] == 'run abc done' and first['level'] == 'WARNING' and first['rows'] == 12
+    assert first['logger'] == 'test_json_formatter' and first['since'] == '2024-01-01 00:00:00'
+    assert first['ts'].endswith('Z') and 'T' in first['ts']
+    assert 'ValueError: boom' in second['exc']
+    log.handlers.clear()